@@ -4,25 +4,106 @@ AI Model - Random Forest Regressor for Traffic Light Control
 """
 
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-import joblib
 import os
+import sys
+import time
+
+from flat_forest import FlatForest, META_FILE
+from traffic_logging import fields, get_logger, setup_logging
+
+# pandas, sklearn and joblib are imported where they are used: serving from
+# the lookup table or a flat export never needs them.
+
+
+FEATURES = ["Q_queue", "lanes", "s_total", "t_lost"]
+
+# Input grid covered by the compiled lookup table
+TABLE_Q_MAX = 80
+TABLE_LANES = (1, 3)
+TABLE_T_LOST = 3.0
+
+# Saturation flow per lane (cars per second) served with until one is learned
+# from observed discharge; training draws flows from 0.45 to 0.60 around it
+S_PER_LANE = 0.55
+
+logger = get_logger("model")
+
+
+def round_green(g):
+    """Green times to the hundredth of a second, one rule (NumPy's, half to even) on every path"""
+    return np.round(g, 2)
+
+
+def lookup_table_path(model_path):
+    """Path of the compiled lookup table stored next to a model file"""
+    return os.path.splitext(model_path)[0] + "_table.npz"
+
+
+def flat_model_path(model_path):
+    """Path of the flat-array export stored next to a model file"""
+    return os.path.splitext(model_path)[0] + "_flat"
+
+
+def model_stamp(model_path):
+    """(size, mtime) of a model file, or of the metadata of a flat export"""
+    if os.path.isdir(model_path):
+        model_path = os.path.join(model_path, META_FILE)
+    stat = os.stat(model_path)
+    return stat.st_size, stat.st_mtime
 
 
 class TrafficAIModel:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, lazy=False, s_per_lane=S_PER_LANE, **train_options):
         """
         Initialize AI model - load existing or train new
+
+        With lazy=True and a fresh lookup table on disk, the model itself is
+        only loaded the first time an input falls outside the table grid.
+        A saved model brings its own s_per_lane.
         """
+        self.table = None
+        self.s_per_lane = s_per_lane
+        self.model_path = model_path
+        self._model = None
+
         if model_path and os.path.exists(model_path):
-            print(f"Loading model from {model_path}")
-            self.model = joblib.load(model_path)
-            print("Model loaded successfully!")
+            if lazy:
+                self.table = self.read_lookup_table(model_path)
+            if self.table is not None:
+                logger.info("Lookup table ready - %s loads on first use", model_path)
+            else:
+                self.model = self.load_model(model_path)
+                self.load_lookup_table(model_path)
+        else:
+            logger.info("Training new model")
+            self.model = self.train_model(**train_options)
+            logger.info("Model trained")
+            self.compile_lookup_table()
+
+    @property
+    def model(self):
+        """Forest used for inputs outside the lookup table grid"""
+        if self._model is None:
+            self._model = self.load_model(self.model_path)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def load_model(self, model_path):
+        """Load a pickled forest or a flat export directory"""
+        if os.path.isdir(model_path):
+            logger.info("Loading flat model from %s", model_path)
+            model = FlatForest.load(model_path)
+            self.s_per_lane = model.inputs.get("s_per_lane", self.s_per_lane)
         else:
-            print("Training new model...")
-            self.model = self.train_model()
-            print("Model trained successfully!")
+            import joblib
+
+            logger.info("Loading model from %s", model_path)
+            model = joblib.load(model_path)
+        logger.info("Model loaded")
+        return model
 
     def teacher_green_time(self, Q, s, t_lost, g_min=15, g_max=90):
         """Teacher Equation for green time calculation"""
@@ -30,58 +111,284 @@ class TrafficAIModel:
         g = max(g_min, min(g, g_max))
         return g
 
-    def generate_training_data(self, N=5000):
+    def teacher_green_times(self, Q, s, t_lost, g_min=15, g_max=90):
+        """Vectorized Teacher Equation over NumPy arrays"""
+        return np.clip(Q / s + t_lost, g_min, g_max)
+
+    def sample_training_chunk(self, rng, N):
+        """Draw N synthetic samples as rows of FEATURES + green_time"""
+        chunk = np.empty((N, len(FEATURES) + 1), dtype=np.float64)
+        Q = chunk[:, 0]
+        lanes = chunk[:, 1]
+        s = chunk[:, 2]
+        t_lost = chunk[:, 3]
+
+        Q[:] = rng.integers(0, 80, size=N)
+        lanes[:] = rng.integers(1, 4, size=N)
+        s[:] = lanes * rng.uniform(0.45, 0.60, size=N) * (self.s_per_lane / S_PER_LANE)
+        t_lost[:] = rng.uniform(2, 5, size=N)
+
+        y = self.teacher_green_times(Q, s, t_lost)
+        y += rng.normal(0, 1.5, size=N)
+        chunk[:, 4] = np.clip(y, 15, 90)
+
+        return chunk
+
+    def generate_training_data(self, N=5000, seed=None):
         """Generate synthetic training data"""
-        Q = np.random.randint(0, 80, size=N)
-        lanes = np.random.randint(1, 4, size=N)
-        s_per_lane = np.random.uniform(0.45, 0.60, size=N)
-        s = lanes * s_per_lane
-        t_lost = np.random.uniform(2, 5, size=N)
-
-        y = np.array([self.teacher_green_time(Q[i], s[i], t_lost[i]) for i in range(N)])
-        y = y + np.random.normal(0, 1.5, size=N)
-        y = np.clip(y, 15, 90)
-
-        data = pd.DataFrame({
-            "Q_queue": Q,
-            "lanes": lanes,
-            "s_total": s,
-            "t_lost": t_lost,
-            "green_time": y
-        })
+        import pandas as pd
+
+        chunk = self.sample_training_chunk(np.random.default_rng(seed), N)
+        return pd.DataFrame(chunk, columns=FEATURES + ["green_time"])
+
+    def generate_training_file(self, path, N, chunk_size=1_000_000, seed=None):
+        """Stream N synthetic samples in chunks to a memory-mapped .npy file"""
+        rng = np.random.default_rng(seed)
+        data = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float64, shape=(N, len(FEATURES) + 1)
+        )
 
+        for start in range(0, N, chunk_size):
+            stop = min(start + chunk_size, N)
+            data[start:stop] = self.sample_training_chunk(rng, stop - start)
+
+        data.flush()
         return data
 
-    def train_model(self):
-        """Train Random Forest model"""
-        data = self.generate_training_data(5000)
-        X = data[["Q_queue", "lanes", "s_total", "t_lost"]]
-        y = data["green_time"]
+    def train_model(self, N=5000, n_jobs=-1, data_path=None, seed=None, max_samples=None, n_estimators=250):
+        """
+        Train Random Forest model
+
+        max_samples caps the bootstrap sample drawn for each tree, so fit
+        cost stays flat while the forest as a whole sees a much larger dataset.
+        """
+        from sklearn.ensemble import RandomForestRegressor
+
+        self.timings = {}
 
-        model = RandomForestRegressor(n_estimators=250, random_state=42)
+        start = time.perf_counter()
+        if data_path:
+            data = np.load(data_path, mmap_mode="r") if os.path.exists(data_path) else None
+            if data is None or len(data) != N:
+                data = self.generate_training_file(data_path, N, seed=seed)
+        else:
+            data = self.sample_training_chunk(np.random.default_rng(seed), N)
+        X = data[:, :len(FEATURES)]
+        y = data[:, len(FEATURES)]
+        self.timings["generate"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        model = RandomForestRegressor(
+            n_estimators=n_estimators, random_state=42, n_jobs=n_jobs, max_samples=max_samples
+        )
         model.fit(X, y)
+        # Serving predicts a handful of rows at a time; thread fan-out only adds latency
+        model.set_params(n_jobs=None)
+        self.timings["fit"] = time.perf_counter() - start
+
+        logger.info("Training timings (%d samples, n_jobs=%s): %s", len(y), n_jobs,
+                    ", ".join(f"{stage} {seconds:.2f} sec" for stage, seconds in self.timings.items()),
+                    extra=fields(**self.timings))
 
         return model
 
+    def model_input(self, X):
+        """Wrap feature rows in a DataFrame only for models fitted on one"""
+        if hasattr(self.model, "feature_names_in_"):
+            import pandas as pd
+
+            return pd.DataFrame(X, columns=FEATURES, copy=False)
+        return X
+
     def predict_green_time(self, Q_queue, lanes, t_lost=3.0):
         """Predict green time based on queue and lanes"""
+        if self.table is not None and self.in_table_grid(Q_queue, lanes, t_lost):
+            return float(self.table[int(lanes) - TABLE_LANES[0], int(Q_queue)])
+
+        return self.predict_green_time_forest(Q_queue, lanes, t_lost)
+
+    def predict_green_time_forest(self, Q_queue, lanes, t_lost=3.0):
+        """Predict green time by running the full Random Forest"""
         g_min = 15
         g_max = 90
-        s_per_lane = 0.55
-        s_total = lanes * s_per_lane
+        s_total = lanes * self.s_per_lane
 
-        X_in = pd.DataFrame([[Q_queue, lanes, s_total, t_lost]],
-                            columns=["Q_queue", "lanes", "s_total", "t_lost"])
+        X_in = np.array([[Q_queue, lanes, s_total, t_lost]], dtype=np.float64)
 
-        g = self.model.predict(X_in)[0]
+        g = self.model.predict(self.model_input(X_in))[0]
         g = max(g_min, min(g, g_max))
 
-        return round(g, 2)
+        return float(round_green(g))
+
+    def predict_green_times(self, Q_queue, lanes, t_lost=3.0):
+        """Predict green times for many intersections in one call"""
+        g_min = 15
+        g_max = 90
+        s_per_lane = self.s_per_lane
+
+        Q, lanes, t_lost = np.broadcast_arrays(
+            np.asarray(Q_queue, dtype=np.float64),
+            np.asarray(lanes, dtype=np.float64),
+            np.asarray(t_lost, dtype=np.float64)
+        )
+        g = np.empty(Q.shape, dtype=np.float64)
+
+        if self.table is not None:
+            in_grid = (
+                (t_lost == TABLE_T_LOST)
+                & (Q == np.floor(Q)) & (Q >= 0) & (Q <= TABLE_Q_MAX)
+                & (lanes == np.floor(lanes))
+                & (lanes >= TABLE_LANES[0]) & (lanes <= TABLE_LANES[1])
+            )
+            g[in_grid] = self.table[
+                lanes[in_grid].astype(np.intp) - TABLE_LANES[0],
+                Q[in_grid].astype(np.intp)
+            ]
+        else:
+            in_grid = np.zeros(Q.shape, dtype=bool)
+
+        rest = ~in_grid
+        if rest.any():
+            X_in = np.column_stack([
+                Q[rest], lanes[rest], lanes[rest] * s_per_lane, t_lost[rest]
+            ])
+            g_rest = self.model.predict(self.model_input(X_in))
+            g[rest] = round_green(np.clip(g_rest, g_min, g_max))
+
+        return g
+
+    def in_table_grid(self, Q_queue, lanes, t_lost):
+        """Check whether the inputs fall on the compiled lookup table grid"""
+        return (
+            t_lost == TABLE_T_LOST
+            and Q_queue == int(Q_queue) and 0 <= Q_queue <= TABLE_Q_MAX
+            and lanes == int(lanes) and TABLE_LANES[0] <= lanes <= TABLE_LANES[1]
+        )
+
+    def evaluate_grid(self):
+        """Run the forest once over every (Q_queue, lanes) grid point"""
+        g_min = 15
+        g_max = 90
+        s_per_lane = self.s_per_lane
+
+        lanes, Q = np.meshgrid(
+            np.arange(TABLE_LANES[0], TABLE_LANES[1] + 1),
+            np.arange(TABLE_Q_MAX + 1),
+            indexing="ij"
+        )
+        X_in = np.column_stack([
+            Q.ravel(),
+            lanes.ravel(),
+            lanes.ravel() * s_per_lane,
+            np.full(Q.size, TABLE_T_LOST)
+        ])
+
+        g = self.model.predict(self.model_input(X_in))
+        # Same clamp and rounding as the scalar path
+        return round_green(np.clip(g, g_min, g_max)).reshape(Q.shape)
+
+    def compile_lookup_table(self):
+        """Precompute green times over the whole input grid"""
+        self.table = self.evaluate_grid()
+        return self.table
+
+    def verify_lookup_table(self):
+        """Check that the lookup table matches the forest exactly"""
+        if self.table is None:
+            return False
+
+        if not np.array_equal(self.table, self.evaluate_grid()):
+            return False
+
+        # Spot-check the scalar forest path on the grid corners
+        for lanes in TABLE_LANES:
+            for Q in (0, TABLE_Q_MAX):
+                expected = self.predict_green_time_forest(Q, lanes, TABLE_T_LOST)
+                if self.table[lanes - TABLE_LANES[0], Q] != expected:
+                    return False
+
+        return True
+
+    def save_lookup_table(self, model_path):
+        """Save the lookup table next to the model file"""
+        if self.table is None:
+            self.compile_lookup_table()
+
+        model_size, model_mtime = model_stamp(model_path)
+        table_path = lookup_table_path(model_path)
+        np.savez(
+            table_path,
+            table=self.table,
+            q_max=TABLE_Q_MAX,
+            lanes=np.array(TABLE_LANES),
+            t_lost=TABLE_T_LOST,
+            model_size=model_size,
+            model_mtime=model_mtime,
+            s_per_lane=self.s_per_lane
+        )
+        logger.info("Lookup table saved to %s", table_path)
+
+    def read_lookup_table(self, model_path):
+        """Read the lookup table for a model file, or None if missing or stale"""
+        table_path = lookup_table_path(model_path)
+        model_size, model_mtime = model_stamp(model_path)
+
+        if not os.path.exists(table_path):
+            return None
+
+        with np.load(table_path) as data:
+            fresh = (
+                int(data["q_max"]) == TABLE_Q_MAX
+                and tuple(data["lanes"]) == TABLE_LANES
+                and float(data["t_lost"]) == TABLE_T_LOST
+                and int(data["model_size"]) == model_size
+                and float(data["model_mtime"]) == model_mtime
+            )
+            if not fresh:
+                return None
+
+            # Tables from before s_per_lane was learned were compiled at S_PER_LANE
+            if "s_per_lane" in data.files:
+                self.s_per_lane = float(data["s_per_lane"])
+            logger.info("Lookup table loaded from %s", table_path)
+            return data["table"]
+
+    def load_lookup_table(self, model_path):
+        """Load the lookup table for a model file, recompiling it if stale"""
+        self.table = self.read_lookup_table(model_path)
+        if self.table is not None:
+            return self.table
+
+        logger.info("Compiling lookup table")
+        self.compile_lookup_table()
+        self.save_lookup_table(model_path)
+        return self.table
+
+    def export_flat_model(self, path):
+        """Export the forest as memory-mappable flat arrays"""
+        flat = self.model if isinstance(self.model, FlatForest) else FlatForest.from_sklearn(self.model)
+        flat.inputs = {"s_per_lane": self.s_per_lane}
+        flat.save(path)
+        logger.info("Flat model exported to %s", path)
+        return flat
+
+    def verify_flat_model(self, flat, N=2000, seed=0):
+        """Check that a flat export predicts exactly like the forest"""
+        rng = np.random.default_rng(seed)
+        X = self.sample_training_chunk(rng, N)[:, :len(FEATURES)]
+        return np.array_equal(flat.predict(X), self.model.predict(self.model_input(X)))
 
     def save_model(self, filepath="traffic_ai_model.pkl"):
         """Save trained model to file"""
+        import joblib
+
         joblib.dump(self.model, filepath)
-        print(f"Model saved to {filepath}")
+        logger.info("Model saved to %s", filepath)
+        self.save_lookup_table(filepath)
+
+        flat_path = flat_model_path(filepath)
+        self.export_flat_model(flat_path)
+        self.save_lookup_table(flat_path)
 
     def test_model(self):
         """Test model with different scenarios"""
@@ -106,8 +413,45 @@ class TrafficAIModel:
         print("/=/" * 50)
 
 
+class TeacherModel:
+    """
+    The teacher equation behind the model interface, served by a controller
+    that boots without a trained model instead of training one on startup
+    """
+    model_path = None
+    table = None
+    teacher_green_time = TrafficAIModel.teacher_green_time
+    teacher_green_times = TrafficAIModel.teacher_green_times
+
+    def __init__(self, s_per_lane=S_PER_LANE):
+        self.s_per_lane = s_per_lane
+
+    def predict_green_time(self, Q_queue, lanes, t_lost=3.0):
+        return float(round_green(self.teacher_green_time(Q_queue, lanes * self.s_per_lane, t_lost)))
+
+    def predict_green_times(self, Q_queue, lanes, t_lost=3.0):
+        Q, lanes, t_lost = np.broadcast_arrays(
+            np.asarray(Q_queue, dtype=np.float64),
+            np.asarray(lanes, dtype=np.float64),
+            np.asarray(t_lost, dtype=np.float64)
+        )
+        return round_green(self.teacher_green_times(Q, lanes * self.s_per_lane, t_lost))
+
+
 if __name__ == "__main__":
+    setup_logging()
     print("Starting AI Model...")
-    ai_model = TrafficAIModel()
+    if len(sys.argv) > 1:
+        # python ai_model.py <samples> [n_jobs] [max_samples_per_tree]
+        N = int(sys.argv[1])
+        n_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else -1
+        max_samples = int(sys.argv[3]) if len(sys.argv) > 3 else min(N, 5000)
+        ai_model = TrafficAIModel(
+            N=N, n_jobs=n_jobs, max_samples=max_samples,
+            data_path="traffic_training_data.npy"
+        )
+    else:
+        ai_model = TrafficAIModel()
     ai_model.test_model()
+    print(f"Lookup table matches forest: {ai_model.verify_lookup_table()}")
     ai_model.save_model("traffic_ai_model.pkl")
\ No newline at end of file
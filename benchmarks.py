@@ -0,0 +1,926 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the traffic light control system
+
+Every benchmark returns plain dicts/lists; --json=PATH writes them with
+machine metadata so results can be compared between releases.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from ai_model import TrafficAIModel
+from coordination import NetworkCoordinator
+from inference_pool import INFERENCE_BUDGET, InferencePool
+from phase_scheduler import PhaseScheduler
+from road_network import RoadNetwork, ShortestPathTree
+from signal_fleet import SignalFleet
+from telemetry import TelemetryStore
+from traffic_signal_v2 import DENSITY_PERIOD, AdvancedTrafficSignal
+from traffic_logging import setup_logging
+from traffic_server_with_ai import SmartTrafficSystemWithAI
+from transport import InProcessBroker, InProcessTransport, Message
+from wire_format import decode, encode
+
+
+def random_inputs(n, seed=0):
+    """Random (Q_queue, lanes) inputs for n intersections"""
+    rng = np.random.default_rng(seed)
+    Q = rng.integers(0, 81, size=n)
+    lanes = rng.integers(1, 4, size=n)
+    return Q, lanes
+
+
+def bench_batch_prediction(ai_model, sizes=(4, 100, 10_000, 100_000), max_calls=2000):
+    """Compare per-call predict_green_time with batched predict_green_times"""
+    print("\n" + "=" * 60)
+    print("PER-CALL VS BATCHED PREDICTION")
+    print("=" * 60)
+
+    results = []
+    for n in sizes:
+        Q, lanes = random_inputs(n)
+
+        # Per-call cost is measured on a prefix and extrapolated for large n
+        calls = min(n, max_calls)
+        start = time.perf_counter()
+        for i in range(calls):
+            ai_model.predict_green_time(int(Q[i]), int(lanes[i]))
+        per_call = (time.perf_counter() - start) / calls
+
+        start = time.perf_counter()
+        ai_model.predict_green_times(Q, lanes)
+        batch = time.perf_counter() - start
+
+        result = {
+            "intersections": n,
+            "per_call_rate": 1.0 / per_call,
+            "batch_rate": n / batch,
+            "speedup": per_call * n / batch
+        }
+        results.append(result)
+
+        print(f"  {n:>7} intersections: "
+              f"per-call {result['per_call_rate']:>12,.0f}/s | "
+              f"batched {result['batch_rate']:>12,.0f}/s | "
+              f"x{result['speedup']:.1f}")
+
+    return results
+
+
+# Runs in a fresh interpreter; publish is intercepted so no broker is needed
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+
+import paho.mqtt.client as mqtt
+first_command = []
+
+def publish(self, topic, payload=None, *args, **kwargs):
+    if topic.endswith("/control") and not first_command:
+        first_command.append(time.perf_counter())
+
+mqtt.Client.publish = publish
+
+import traffic_server_with_ai
+imported = time.perf_counter()
+
+system = traffic_server_with_ai.SmartTrafficSystemWithAI(sys.argv[1], fast_boot=sys.argv[2] == "1")
+while not first_command:
+    time.sleep(0.001)
+
+print(json.dumps({
+    "import_time": imported - start,
+    "first_command_time": first_command[0] - start,
+    "pandas_imported": "pandas" in sys.modules,
+    "sklearn_imported": "sklearn" in sys.modules
+}))
+"""
+
+
+def bench_startup(model_path, runs=3):
+    """Measure import time and time-to-first-control-command of the controller"""
+    print("\n" + "=" * 60)
+    print("CONTROLLER STARTUP")
+    print("=" * 60)
+
+    results = {}
+    for fast_boot in (False, True):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT, model_path, str(int(fast_boot))],
+                capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+        mode = "fast_boot" if fast_boot else "full_boot"
+        results[mode] = {
+            "import_time": min(s["import_time"] for s in samples),
+            "first_command_time": min(s["first_command_time"] for s in samples),
+            "pandas_imported": samples[0]["pandas_imported"],
+            "sklearn_imported": samples[0]["sklearn_imported"]
+        }
+
+        r = results[mode]
+        print(f"  {mode}: import {r['import_time'] * 1000:.0f} ms | "
+              f"first command {r['first_command_time'] * 1000:.0f} ms | "
+              f"pandas {r['pandas_imported']} | sklearn {r['sklearn_imported']}")
+
+    return results
+
+
+def bench_phase_scheduler(counts=(100, 1000, 5000, 20_000), duration=5.0, jitter_bound=0.010):
+    """
+    Cycle N intersections green -> yellow -> red on one PhaseScheduler and
+    measure how late each transition fires compared to its planned time.
+    Phase lengths are scaled down (0.5-2 s green) to get many transitions.
+    """
+    print("\n" + "=" * 60)
+    print(f"PHASE SCHEDULER JITTER (bound p99 < {jitter_bound * 1000:.0f} ms)")
+    print("=" * 60)
+
+    results = []
+    for n in counts:
+        scheduler = PhaseScheduler().start()
+        rng = np.random.default_rng(n)
+        lags = []
+        stop_at = scheduler.now() + duration
+
+        def transition(intersection, phase, planned):
+            now = scheduler.now()
+            lags.append(now - planned)
+            if now >= stop_at:
+                return
+
+            if phase == "green":
+                nxt, delay = "yellow", rng.uniform(0.5, 2.0)
+            elif phase == "yellow":
+                nxt, delay = "red", 0.2
+            else:
+                nxt, delay = "green", rng.uniform(0.5, 2.0)
+            scheduler.call_at(planned + delay, transition, intersection, nxt, planned + delay)
+
+        start = scheduler.now() + 0.5
+        for i in range(n):
+            planned = start + rng.uniform(0, 1.0)
+            scheduler.call_at(planned, transition, i, "red", planned)
+
+        time.sleep(duration + 0.5)
+        scheduler.stop()
+
+        lag = np.array(lags)
+        result = {
+            "intersections": n,
+            "transitions_per_sec": len(lag) / duration,
+            "lag_p50": float(np.percentile(lag, 50)),
+            "lag_p99": float(np.percentile(lag, 99)),
+            "lag_max": float(lag.max()),
+            "within_bound": bool(np.percentile(lag, 99) < jitter_bound)
+        }
+        results.append(result)
+
+        print(f"  {n:>6} intersections: {result['transitions_per_sec']:>9,.0f} transitions/s | "
+              f"lag p50 {result['lag_p50'] * 1000:.2f} ms | p99 {result['lag_p99'] * 1000:.2f} ms | "
+              f"max {result['lag_max'] * 1000:.2f} ms | "
+              f"{'OK' if result['within_bound'] else 'OVER BOUND'}")
+
+    return results
+
+
+def bench_signal_actuation(counts=(4, 100, 1000), commands=2000, interval=0.002, seed=0):
+    """
+    Command-to-actuation latency of real AdvancedTrafficSignal instances on
+    one broker and one PhaseScheduler: green/yellow/red commands at random,
+    plus emergency greens sent while a green is in progress. Latency is the
+    command timestamp to the status report of the state change.
+    """
+    print("\n" + "=" * 60)
+    print("SIGNAL COMMAND-TO-ACTUATION LATENCY")
+    print("=" * 60)
+
+    results = []
+    for n in counts:
+        rng = random.Random(seed)
+        broker = InProcessBroker()
+        scheduler = PhaseScheduler("Signals").start()
+        signals = []
+        for i in range(n):
+            signal = AdvancedTrafficSignal(f"intersection{i}", f"SIGNAL {i}",
+                                           transport=InProcessTransport(f"intersection{i}", broker),
+                                           scheduler=scheduler)
+            signal.client.connect()
+            signal.client.loop_start()
+            signals.append(signal)
+
+        sent = {}
+        latencies = {"phase": [], "emergency": []}
+        client = InProcessTransport("ActuationProbe", broker)
+
+        def on_message(client, userdata, msg):
+            _ = client, userdata
+            now = time.time()
+            data = decode(msg.payload)
+            pending = sent.pop(data["signal"], None)
+            if pending is not None and pending[1] == data["status"]:
+                latencies[pending[0]].append(now - pending[2])
+
+        client.on_message = on_message
+        client.subscribe("traffic/+/status")
+        client.loop_start()
+        time.sleep(0.5)
+
+        for _ in range(commands):
+            signal = signals[rng.randrange(n)]
+            if signal.status == "green" and not signal.emergency and rng.random() < 0.5:
+                kind, command = "emergency", {"command": "emergency_green", "duration": 10, "vehicle": "BENCH"}
+            else:
+                status = rng.choice([s for s in ("green", "yellow", "red") if s != signal.status])
+                kind, command = "phase", {"command": status, "duration": 30}
+            command["timestamp"] = time.time()
+            sent[signal.signal_id] = (kind, "green" if kind == "emergency" else command["command"],
+                                      command["timestamp"])
+            client.publish(f"traffic/{signal.signal_id}/control", encode("control", command))
+            time.sleep(interval)
+
+        time.sleep(0.5)
+        client.loop_stop()
+        for signal in signals:
+            signal.client.loop_stop()
+        scheduler.stop()
+
+        result = {
+            "signals": n,
+            "commands": commands,
+            "emergencies": len(latencies["emergency"]),
+            **percentiles(latencies["phase"], "phase_"),
+            **percentiles(latencies["emergency"], "emergency_")
+        }
+        results.append(result)
+
+        print(f"  {n:>5} signals: phase p50 {result['phase_p50'] * 1000:.2f} ms | "
+              f"p99 {result['phase_p99'] * 1000:.2f} ms | "
+              f"emergency interrupting green ({result['emergencies']}) p50 "
+              f"{result['emergency_p50'] * 1000:.2f} ms | p99 {result['emergency_p99'] * 1000:.2f} ms")
+
+    return results
+
+
+# Representative messages of each hot topic
+WIRE_MESSAGES = {
+    "density": {"value": 23, "signal": "intersection1", "name": "SIGNAL 1",
+                "status": "red", "timestamp": 1700000000.123},
+    "status": {"status": "green", "signal": "intersection1", "name": "SIGNAL 1", "density": 23,
+               "green_time": 39.38, "yellow_time": 5, "timestamp": 1700000000.123},
+    "control": {"command": "green", "duration": 39.38, "density": 23,
+                "message": "Open - Safe passage (AI)", "timestamp": 1700000000.123}
+}
+
+
+def bench_wire_format(iterations=100_000):
+    """Compare payload size and encode/decode throughput of JSON and binary"""
+    print("\n" + "=" * 60)
+    print("WIRE FORMAT: JSON VS BINARY")
+    print("=" * 60)
+
+    results = []
+    for kind, message in WIRE_MESSAGES.items():
+        for wire_format in ("json", "binary"):
+            payload = encode(kind, message, wire_format)
+            if isinstance(payload, str):
+                payload = payload.encode()
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                encode(kind, message, wire_format)
+            encode_rate = iterations / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                decode(payload)
+            decode_rate = iterations / (time.perf_counter() - start)
+
+            result = {
+                "kind": kind,
+                "format": wire_format,
+                "bytes": len(payload),
+                "encode_rate": encode_rate,
+                "decode_rate": decode_rate
+            }
+            results.append(result)
+
+            print(f"  {kind:>8} {wire_format:>6}: {len(payload):>4} bytes | "
+                  f"encode {encode_rate:>10,.0f}/s | decode {decode_rate:>10,.0f}/s")
+
+    return results
+
+
+def percentiles(samples, prefix=""):
+    """p50/p90/p99/max of a list of seconds, keyed for JSON results"""
+    samples = np.asarray(samples, dtype=float)
+    if not len(samples):
+        return {f"{prefix}p50": None, f"{prefix}p90": None, f"{prefix}p99": None, f"{prefix}max": None}
+    p50, p90, p99 = np.percentile(samples, (50, 90, 99))
+    return {f"{prefix}p50": float(p50), f"{prefix}p90": float(p90),
+            f"{prefix}p99": float(p99), f"{prefix}max": float(samples.max())}
+
+
+def bench_inference_latency(ai_model, calls=20_000):
+    """Latency percentiles of single predict_green_time calls, table and forest"""
+    print("\n" + "=" * 60)
+    print("INFERENCE LATENCY (predict_green_time)")
+    print("=" * 60)
+
+    Q, lanes = random_inputs(calls, seed=1)
+    table = ai_model.table
+
+    results = {}
+    for path in ("table", "forest"):
+        ai_model.table = table if path == "table" else None
+        n = calls if path == "table" else min(calls, 500)
+
+        latencies = np.empty(n)
+        for i in range(n):
+            start = time.perf_counter()
+            ai_model.predict_green_time(int(Q[i]), int(lanes[i]))
+            latencies[i] = time.perf_counter() - start
+
+        results[path] = {"calls": n, **percentiles(latencies)}
+        r = results[path]
+        print(f"  {path:>6}: p50 {r['p50'] * 1e6:.1f} us | p90 {r['p90'] * 1e6:.1f} us | "
+              f"p99 {r['p99'] * 1e6:.1f} us | max {r['max'] * 1e6:.1f} us")
+
+    ai_model.table = table
+    return results
+
+
+def bench_inference_offload(model_path, counts=(100, 1000, 10_000), rounds=20, workers=2):
+    """
+    Batch prediction in process and through the inference pool as the
+    forest's share of the work grows (inputs off the table grid), with the
+    lateness of a thread waking every millisecond - the MQTT network
+    thread's view of the controller's GIL.
+    """
+    print("\n" + "=" * 60)
+    print("INFERENCE OFFLOAD (forest inputs per batch)")
+    print("=" * 60)
+
+    ai_model = TrafficAIModel(model_path, lazy=True)
+    pool = InferencePool(ai_model, workers, budget=60.0)
+    # Workers import, load and map the forest on their first off-grid batch
+    pool.predict_green_times(np.full(workers * 256, 0.5), 1)
+    pool.budget = INFERENCE_BUDGET
+
+    results = []
+    for n in counts:
+        Q, lanes = random_inputs(n, seed=n)
+        Q = Q + 0.5
+        for name, predictor in (("in_process", ai_model), ("pool", pool)):
+            lateness = []
+            stop = threading.Event()
+
+            def probe():
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    time.sleep(0.001)
+                    lateness.append(time.perf_counter() - start - 0.001)
+
+            thread = threading.Thread(target=probe, daemon=True)
+            thread.start()
+            fallback = pool.stats["inference_fallback_inputs"]
+            latencies = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                predictor.predict_green_times(Q, lanes)
+                latencies.append(time.perf_counter() - start)
+            stop.set()
+            thread.join()
+
+            result = {"intersections": n, "mode": name, **percentiles(latencies, "batch_"),
+                      **percentiles(lateness, "probe_late_"),
+                      "fallback_share": (pool.stats["inference_fallback_inputs"] - fallback) / (n * rounds)}
+            results.append(result)
+            print(f"  {n:>6} intersections {name:>10}: batch p50 {result['batch_p50'] * 1000:.1f} ms | "
+                  f"p99 {result['batch_p99'] * 1000:.1f} ms | probe late p99 "
+                  f"{result['probe_late_p99'] * 1000:.2f} ms | fallback {result['fallback_share']:.0%}")
+
+    pool.close()
+    return results
+
+
+def write_bench_config(path, n):
+    """Intersections config with the ids the signal fleet uses"""
+    intersections = [
+        {"id": f"intersection{i}", "name": f"SIGNAL {i}", "lanes": 1 + i % 3}
+        for i in range(1, n + 1)
+    ]
+    with open(path, "w") as f:
+        json.dump({"intersections": intersections}, f)
+
+
+def start_controller(model_path, config_path, broker):
+    """Fast-boot controller on an in-process broker"""
+    return SmartTrafficSystemWithAI(
+        model_path, fast_boot=True, config_path=config_path,
+        transport=InProcessTransport("TrafficMasterAI", broker)
+    )
+
+
+def stop_controller(controller):
+    controller.system_active = False
+    if controller.inference_pool is not None:
+        controller.inference_pool.close()
+    controller.scheduler.stop()
+    controller.client.loop_stop()
+    controller.client.disconnect()
+
+
+def bench_on_message(model_path, counts=(4, 1000, 10_000), messages=200_000):
+    """Density messages per second through on_message, plus the drain they cost"""
+    print("\n" + "=" * 60)
+    print("ON_MESSAGE THROUGHPUT")
+    print("=" * 60)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in counts:
+            config_path = os.path.join(tmp, f"bench_{n}.json")
+            write_bench_config(config_path, n)
+            controller = start_controller(model_path, config_path, InProcessBroker())
+            # Drains happen only where measured, not on the controller's tick
+            controller.system_active = False
+            controller.tick_timer.cancel()
+
+            for wire_format in ("json", "binary"):
+                rng = np.random.default_rng(n)
+                ids = rng.integers(1, n + 1, size=messages)
+                values = rng.integers(0, 81, size=messages)
+                batch = []
+                for i, value in zip(ids, values):
+                    payload = encode("density", {"value": int(value), "status": "red",
+                                                 "timestamp": time.time()}, wire_format)
+                    if isinstance(payload, str):
+                        payload = payload.encode()
+                    batch.append(Message(f"traffic/intersection{i}/density", payload))
+
+                start = time.perf_counter()
+                for msg in batch:
+                    controller.on_message(None, None, msg)
+                rate = messages / (time.perf_counter() - start)
+
+                # One full tick worth of readings (every intersection reported)
+                for i in range(1, n + 1):
+                    controller.on_message(None, None, batch[i % messages])
+                start = time.perf_counter()
+                controller.drain_density_buffer()
+                drain = time.perf_counter() - start
+
+                result = {"intersections": n, "format": wire_format, "messages_per_sec": rate,
+                          "drain_time": drain}
+                results.append(result)
+                print(f"  {n:>6} intersections {wire_format:>6}: {rate:>10,.0f} msg/s | "
+                      f"drain {drain * 1000:.1f} ms")
+
+            stop_controller(controller)
+
+    return results
+
+
+def run_loaded_system(model_path, n, period, duration, probe=None):
+    """
+    Run the controller against a fleet of n virtual signals reporting every
+    period seconds, all on one asynchronous in-process broker. probe(broker,
+    controller), if given, runs on the main thread while the fleet loads the
+    system. Returns the controller, the fleet and the drain records.
+    """
+    broker = InProcessBroker()
+    drains = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "bench.json")
+        write_bench_config(config_path, n)
+
+        # Signals subscribe first so the controller's opening commands are measured too
+        fleet = SignalFleet(n, period=period, seed=n,
+                            transports=[InProcessTransport("SignalFleet-0", broker)])
+        fleet_thread = threading.Thread(target=fleet.run, args=(duration,), daemon=True)
+        fleet_thread.start()
+        while f"traffic/intersection{n}/control" not in broker.exact:
+            time.sleep(0.01)
+
+        controller = start_controller(model_path, config_path, broker)
+
+        # Readings about to be applied are sampled just before each drain
+        drain = controller.drain_density_buffer
+
+        def timed_drain():
+            with controller.buffer_lock:
+                pending = list(controller.density_buffer.values())
+            drain()
+            drains.append((time.time(), pending))
+
+        controller.drain_density_buffer = timed_drain
+        controller.client.connect()
+        controller.client.loop_start()
+
+        if probe is not None:
+            probe(broker, controller)
+        fleet_thread.join()
+        stop_controller(controller)
+
+    return controller, fleet, drains
+
+
+def bench_control_latency(model_path, counts=(4, 100, 1000, 5000), periods=(7, 1), duration=5.0):
+    """
+    End-to-end control path under growing load. density_to_applied runs
+    from a signal's density publish to the control tick that applied it to
+    the priority queue; command_delivery from the controller's command
+    timestamp to its arrival at the signal (one green runs at a time, so a
+    short run sees few commands; their count is reported).
+    """
+    print("\n" + "=" * 60)
+    print("END-TO-END CONTROL LATENCY")
+    print("=" * 60)
+
+    results = []
+    for n in counts:
+        for period in periods:
+            _, fleet, drains = run_loaded_system(model_path, n, period, duration)
+
+            applied = [done - decode(payload)["timestamp"] for done, pending in drains
+                       for payload in pending]
+            result = {
+                "intersections": n,
+                "offered_rate": n / period,
+                "applied_readings": len(applied),
+                "commands": sum(signal.commands for signal in fleet.signals),
+                **percentiles(applied, "density_to_applied_"),
+                **percentiles(fleet.latencies, "command_delivery_")
+            }
+            results.append(result)
+
+            delivery = result["command_delivery_p99"]
+            print(f"  {n:>5} intersections @ {result['offered_rate']:>7,.0f} msg/s: "
+                  f"applied p50 {result['density_to_applied_p50'] * 1000:.0f} ms | "
+                  f"p99 {result['density_to_applied_p99'] * 1000:.0f} ms | "
+                  f"command p99 {'-' if delivery is None else f'{delivery * 1000:.1f} ms'}")
+
+    return results
+
+
+def bench_emergency_latency(model_path, n=1000, period=1, requests=20, interval=0.25):
+    """
+    Latency from an emergency/request publish to the emergency/response and
+    to the last emergency_green command of the route, while a fleet of n
+    signals keeps the controller busy.
+    """
+    print("\n" + "=" * 60)
+    print(f"EMERGENCY PREEMPTION LATENCY ({n} SIGNALS @ {n / period:,.0f} MSG/S)")
+    print("=" * 60)
+
+    response_latencies = []
+    preemption_latencies = []
+
+    def probe(broker, controller):
+        client = InProcessTransport("EmergencyProbe", broker)
+        route_size = len(controller.network)
+        state = {}
+        done = threading.Event()
+
+        def on_message(client, userdata, msg):
+            _ = client, userdata
+            now = time.time()
+            if msg.topic == "emergency/response":
+                state["response"] = now
+            elif decode(msg.payload).get("vehicle") == state.get("vehicle"):
+                state["greens"] += 1
+                if state["greens"] == route_size:
+                    state["preempted"] = now
+            if "response" in state and "preempted" in state:
+                done.set()
+
+        client.on_message = on_message
+        client.subscribe([("emergency/response", 0), ("traffic/+/control", 0)])
+        client.loop_start()
+
+        time.sleep(1)
+        for i in range(requests):
+            done.clear()
+            state.clear()
+            state.update(vehicle=f"BENCH-{i}", greens=0)
+            sent = time.time()
+            client.publish("emergency/request", encode(
+                "emergency_request", {"vehicle_id": state["vehicle"], "timestamp": sent}
+            ))
+            if done.wait(5):
+                response_latencies.append(state["response"] - sent)
+                preemption_latencies.append(state["preempted"] - sent)
+            time.sleep(interval)
+
+        client.loop_stop()
+        client.disconnect()
+
+    run_loaded_system(model_path, n, period, 2 + requests * (interval + 0.1), probe)
+
+    result = {
+        "intersections": n,
+        "offered_rate": n / period,
+        "requests": requests,
+        "answered": len(response_latencies),
+        **percentiles(response_latencies, "response_"),
+        **percentiles(preemption_latencies, "preemption_")
+    }
+    if response_latencies:
+        print(f"  response p50 {result['response_p50'] * 1000:.1f} ms | "
+              f"p99 {result['response_p99'] * 1000:.1f} ms")
+        print(f"  all {n} emergency greens p50 {result['preemption_p50'] * 1000:.1f} ms | "
+              f"p99 {result['preemption_p99'] * 1000:.1f} ms")
+    print(f"  answered {result['answered']}/{requests} requests")
+    return result
+
+
+def grid_network(side, seed=0, stations=5):
+    """side x side street grid, 300 m blocks with mixed lengths and speed limits"""
+    rng = np.random.default_rng(seed)
+    intersections = {
+        f"n{i}_{j}": {"name": f"SIGNAL {i}-{j}", "x": i * 300.0, "y": j * 300.0}
+        for i in range(side) for j in range(side)
+    }
+    roads = []
+    for i in range(side):
+        for j in range(side):
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < side and j + dj < side:
+                    roads.append({"from": f"n{i}_{j}", "to": f"n{i + di}_{j + dj}",
+                                  "length": 300 * rng.uniform(1.0, 1.3),
+                                  "speed": float(rng.choice([8.3, 13.9, 16.7]))})
+    nodes = list(intersections)
+    places = {f"Station {k}": nodes[i] for k, i in enumerate(rng.integers(0, len(nodes), size=stations))}
+    return RoadNetwork(intersections, roads, places)
+
+
+def bench_routing(sides=(10, 50, 100), seconds=600, requests_per_second=1.0, active_routes=20, seed=0):
+    """
+    Emergency route latency on grid networks while live densities keep
+    changing edge weights, with the cost of repairing the cached trees per
+    density batch and of building a tree for a new origin. Every
+    signal reports once per DENSITY_PERIOD and the controller applies one
+    batch per second; densities follow a zero-mean random walk (queues
+    cleared as fast as they build up). Requests go to a set of active
+    incidents served from a few stations.
+    """
+    print("\n" + "=" * 60)
+    print("EMERGENCY ROUTING")
+    print("=" * 60)
+
+    results = []
+    for side in sides:
+        network = grid_network(side, seed)
+        rng = np.random.default_rng(seed)
+        walk = random.Random(seed)
+        nodes = network.nodes
+        origins = list(network.places.values())
+        pairs = [(origins[rng.integers(0, len(origins))], nodes[rng.integers(0, len(nodes))])
+                 for _ in range(active_routes)]
+        densities = {node: walk.randint(2, 35) for node in nodes}
+        network.update_densities(densities)
+
+        latencies, updates = [], []
+        due = 0.0
+        for second in range(seconds):
+            batch = {}
+            for node in nodes[second % DENSITY_PERIOD::DENSITY_PERIOD]:
+                densities[node] = max(0, min(50, densities[node] + walk.randint(-10, 10)))
+                batch[node] = densities[node]
+            start = time.perf_counter()
+            network.update_densities(batch)
+            updates.append(time.perf_counter() - start)
+
+            due += requests_per_second
+            while due >= 1.0:
+                due -= 1.0
+                origin, destination = pairs[rng.integers(0, len(pairs))]
+                start = time.perf_counter()
+                network.route(origin, destination)
+                latencies.append(time.perf_counter() - start)
+
+        builds = []
+        for origin in nodes[:10]:
+            start = time.perf_counter()
+            ShortestPathTree(network, origin)
+            builds.append(time.perf_counter() - start)
+
+        stats = network.stats
+        result = {
+            "intersections": len(nodes),
+            "hit_rate": stats["route_cache_hits"] / len(latencies),
+            **percentiles(latencies, "route_"),
+            **percentiles(updates, "update_"),
+            **percentiles(builds, "build_"),
+            **stats
+        }
+        results.append(result)
+
+        print(f"  {len(nodes):>6} intersections: hit rate {result['hit_rate']:.0%} | "
+              f"route p50 {result['route_p50'] * 1e6:.1f} us p99 {result['route_p99'] * 1e6:.1f} us | "
+              f"density batch p50 {result['update_p50'] * 1000:.2f} ms | "
+              f"new origin {result['build_p50'] * 1000:.1f} ms")
+
+    return results
+
+
+def bench_coordination(model_path, sides=(10, 50, 100), repeats=20, seed=0):
+    """
+    Coordinated plan on grid networks: corridor derivation at startup, one
+    re-optimization (AI green times of every signal + cycles, splits and
+    offsets) and one per-tick sweep, against the 1 s control period.
+    """
+    print("\n" + "=" * 60)
+    print("NETWORK COORDINATION")
+    print("=" * 60)
+
+    ai_model = TrafficAIModel(model_path)
+    rng = np.random.default_rng(seed)
+    results = []
+    for side in sides:
+        network = grid_network(side, seed)
+        ids = network.nodes
+        lanes = rng.integers(1, 5, size=len(ids))
+
+        start = time.perf_counter()
+        coordinator = NetworkCoordinator(ids, dict(zip(ids, lanes.tolist())), road_network=network)
+        setup = time.perf_counter() - start
+
+        optimize = []
+        for _ in range(repeats):
+            densities = rng.integers(0, 51, size=len(ids))
+            start = time.perf_counter()
+            green_times = ai_model.predict_green_times(Q_queue=densities, lanes=lanes, t_lost=3.0)
+            coordinator.optimize(green_times)
+            optimize.append(time.perf_counter() - start)
+
+        sweep, changes = [], 0
+        for second in range(300):
+            start = time.perf_counter()
+            changes += len(coordinator.sweep(float(second)))
+            sweep.append(time.perf_counter() - start)
+
+        result = {
+            "intersections": len(ids),
+            "corridors": coordinator.n_corridors,
+            "setup": setup,
+            **percentiles(optimize, "optimize_"),
+            **percentiles(sweep, "sweep_"),
+            "phase_changes_per_second": changes / 300
+        }
+        results.append(result)
+
+        print(f"  {len(ids):>6} intersections, {coordinator.n_corridors} corridors: "
+              f"setup {setup * 1000:.0f} ms | optimize p50 {result['optimize_p50'] * 1000:.2f} ms | "
+              f"sweep p50 {result['sweep_p50'] * 1000:.2f} ms | "
+              f"{result['phase_changes_per_second']:.0f} phase changes/s")
+
+    return results
+
+
+def bench_telemetry(counts=(1000, 10_000), hours=2, queries=20, seed=0):
+    """
+    Telemetry store fed like a controller for hours of simulated time: every
+    intersection reports density every DENSITY_PERIOD and changes phase
+    about once a minute. Times the per-tick record, last-hour queries over
+    all intersections, one flush a minute and reports the fixed memory.
+    """
+    print("\n" + "=" * 60)
+    print(f"TELEMETRY STORE ({hours} H OF HISTORY)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in counts:
+        store = TelemetryStore([f"intersection{i}" for i in range(n)])
+        directory = tempfile.mkdtemp(prefix="telemetry-")
+        density = rng.integers(0, 51, size=n)
+        phase = rng.integers(0, 3, size=n)
+        record, flush, flushed = [], [], 0
+
+        for second in range(hours * 3600):
+            start = time.perf_counter()
+            reporting = np.flatnonzero(np.arange(n) % DENSITY_PERIOD == second % DENSITY_PERIOD)
+            density[reporting] = np.clip(density[reporting] + rng.integers(-10, 11, size=len(reporting)), 0, 50)
+            store.record("density", reporting, density[reporting], second)
+            for row in np.flatnonzero(rng.random(n) < 1 / 60).tolist():
+                phase[row] = (phase[row] + 1) % 3
+                store.record_status(store.ids[row], ("green", "yellow", "red")[phase[row]], second)
+                if phase[row] == 1:
+                    store.record("cars", [row], [density[row] // 2], second)
+            record.append(time.perf_counter() - start)
+
+            if second % 60 == 59:
+                start = time.perf_counter()
+                flushed += store.flush(directory)
+                flush.append(time.perf_counter() - start)
+
+        query = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            store.query("density", hours * 3600 - 1)
+            query.append(time.perf_counter() - start)
+
+        result = {
+            "intersections": n,
+            "memory_bytes": store.nbytes(),
+            "flushed_bytes": flushed,
+            **percentiles(record, "record_"),
+            **percentiles(query, "last_hour_query_"),
+            **percentiles(flush, "flush_")
+        }
+        results.append(result)
+
+        print(f"  {n:>6} intersections: memory {result['memory_bytes'] / 2 ** 20:.1f} MiB | "
+              f"record/s p50 {result['record_p50'] * 1000:.2f} ms | "
+              f"last-hour query p50 {result['last_hour_query_p50'] * 1000:.2f} ms | "
+              f"flush p50 {result['flush_p50'] * 1000:.1f} ms | "
+              f"{flushed / 2 ** 20:.1f} MiB on disk")
+
+    return results
+
+
+def save_results(results, path):
+    """Write results with enough metadata to compare runs between releases"""
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    # python benchmarks.py [prediction|startup|scheduler|actuation|wire|inference|on_message|
+    #                       offload|control|emergency|routing|coordination|telemetry|e2e] [model_path]
+    #                      [--json=results.json]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    benchmark = args[0] if args else "prediction"
+    model_path = args[1] if len(args) > 1 else "traffic_ai_model.pkl"
+    # Component logs would interleave with the results; only errors are shown
+    setup_logging("ERROR")
+
+    results = {}
+    if benchmark == "startup":
+        results["startup"] = bench_startup(model_path)
+    elif benchmark == "scheduler":
+        results["scheduler"] = bench_phase_scheduler()
+    elif benchmark == "actuation":
+        results["actuation"] = bench_signal_actuation()
+    elif benchmark == "wire":
+        results["wire"] = bench_wire_format()
+    elif benchmark == "inference":
+        results["inference"] = bench_inference_latency(TrafficAIModel(model_path))
+    elif benchmark == "offload":
+        results["offload"] = bench_inference_offload(model_path)
+    elif benchmark == "on_message":
+        results["on_message"] = bench_on_message(model_path)
+    elif benchmark == "control":
+        results["control"] = bench_control_latency(model_path)
+    elif benchmark == "emergency":
+        results["emergency"] = bench_emergency_latency(model_path)
+    elif benchmark == "routing":
+        results["routing"] = bench_routing()
+    elif benchmark == "coordination":
+        results["coordination"] = bench_coordination(model_path)
+    elif benchmark == "telemetry":
+        results["telemetry"] = bench_telemetry()
+    elif benchmark == "e2e":
+        # The full suite behind the control and emergency SLAs
+        results["inference"] = bench_inference_latency(TrafficAIModel(model_path))
+        results["on_message"] = bench_on_message(model_path)
+        results["control"] = bench_control_latency(model_path)
+        results["emergency"] = bench_emergency_latency(model_path)
+        results["routing"] = bench_routing()
+        results["coordination"] = bench_coordination(model_path)
+    else:
+        ai_model = TrafficAIModel(model_path)
+
+        results["prediction_table"] = bench_batch_prediction(ai_model)
+
+        # Same comparison with the lookup table disabled (full forest per call)
+        ai_model.table = None
+        results["prediction_forest"] = bench_batch_prediction(ai_model, max_calls=50)
+
+    if "json" in options:
+        save_results(results, options["json"])
\ No newline at end of file
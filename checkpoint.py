@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoint - controller state snapshots for a warm restart
+
+The controller's per-intersection state (density, waiting time, priority,
+green time, status and when the signal turned red) and the running green
+are written every few seconds into a memory-mapped file. The file holds
+two slots; a save fills the older one and stamps it with a sequence
+number and a CRC, so a crash mid-save leaves the previous snapshot intact.
+Restoring maps the file, picks the newest slot whose CRC matches and
+copies it out - milliseconds for thousands of intersections.
+
+Times are stored as wall-clock seconds; the controller converts them to
+and from its scheduler's clock.
+"""
+
+import os
+import zlib
+
+import numpy as np
+
+
+CHECKPOINT_PERIOD = 5.0     # seconds between snapshots
+MAX_CHECKPOINT_AGE = 600.0  # older snapshots describe traffic that has moved on
+MAGIC = b"TLCK"
+VERSION = 1
+
+STATE_DTYPE = np.dtype([
+    ("density", "<f4"), ("waiting_time", "<f4"), ("priority", "<f4"), ("green_time", "<f4"),
+    ("status", "i1"), ("red_since", "<f8")
+])
+
+
+def slot_dtype(n):
+    """One snapshot of n intersections; current_green is a row, or -1"""
+    return np.dtype([
+        ("sequence", "<u8"), ("time", "<f8"), ("current_green", "<i4"), ("green_ends", "<f8"),
+        ("crc", "<u4"), ("state", STATE_DTYPE, (n,))
+    ])
+
+
+def file_dtype(n):
+    return np.dtype([("magic", "S4"), ("version", "<u4"), ("n", "<u4"), ("ids", "<u4"),
+                     ("slots", slot_dtype(n), (2,))])
+
+
+def slot_crc(slot):
+    """CRC of everything in a slot but the CRC itself"""
+    crc = zlib.crc32(slot["state"].tobytes())
+    for name in ("sequence", "time", "current_green", "green_ends"):
+        crc = zlib.crc32(slot[name].tobytes(), crc)
+    return crc
+
+
+class Checkpoint:
+    def __init__(self, path, ids):
+        """Snapshots of the intersections ids, in row order, at path"""
+        self.path = path
+        self.ids = list(ids)
+        self.index = {key: i for i, key in enumerate(self.ids)}
+        # A snapshot of another intersection set is never restored
+        self.ids_crc = zlib.crc32("\n".join(self.ids).encode())
+        self.dtype = file_dtype(len(self.ids))
+        self.map = None
+        self.sequence = 0
+
+    def compatible(self, header):
+        return (header["magic"] == MAGIC and header["version"] == VERSION
+                and header["n"] == len(self.ids) and header["ids"] == self.ids_crc)
+
+    def restore(self):
+        """
+        Newest intact snapshot as a dict (time, current_green key or None,
+        green_ends, state array), or None without one
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != self.dtype.itemsize:
+            return None
+        header = np.memmap(self.path, dtype=self.dtype, mode="r", shape=())
+        if not self.compatible(header):
+            return None
+
+        intact = [slot for slot in header["slots"] if slot["sequence"] and slot["crc"] == slot_crc(slot)]
+        if not intact:
+            return None
+        slot = max(intact, key=lambda s: s["sequence"])
+        self.sequence = int(slot["sequence"])
+        current = int(slot["current_green"])
+        return {
+            "time": float(slot["time"]),
+            "current_green": self.ids[current] if current >= 0 else None,
+            "green_ends": float(slot["green_ends"]),
+            "state": slot["state"].copy()
+        }
+
+    def open(self):
+        """Map the file for writing, starting a new one if it holds another intersection set"""
+        if os.path.exists(self.path) and os.path.getsize(self.path) == self.dtype.itemsize:
+            self.map = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=())
+            if self.compatible(self.map):
+                # Sequence numbers carry on from the snapshots already there
+                self.sequence = max(self.sequence, int(self.map["slots"]["sequence"].max()))
+                return
+        self.map = np.memmap(self.path, dtype=self.dtype, mode="w+", shape=())
+        self.map["magic"] = MAGIC
+        self.map["version"] = VERSION
+        self.map["n"] = len(self.ids)
+        self.map["ids"] = self.ids_crc
+        self.sequence = 0
+
+    def save(self, state, time, current_green=None, green_ends=np.nan):
+        """Write state (STATE_DTYPE, one row per intersection) over the older slot"""
+        if self.map is None:
+            self.open()
+        self.sequence += 1
+        slot = self.map["slots"][self.sequence % 2]
+        slot["state"] = state
+        slot["time"] = time
+        slot["current_green"] = -1 if current_green is None else self.index[current_green]
+        slot["green_ends"] = green_ends
+        slot["sequence"] = self.sequence
+        slot["crc"] = slot_crc(slot)
+        self.map.flush()
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map = None
\ No newline at end of file
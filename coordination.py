@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Coordination - network-wide cycle lengths, splits and offsets
+
+Intersections are grouped into conflict sets (signals of one junction that
+may never be green together and take turns) and corridors (chains of
+junctions along the main roads). All sets of a corridor share one cycle
+length, long enough for its busiest set, and each set's green starts when
+a platoon released at the head of the corridor arrives there, so traffic
+along the corridor rides a green wave. Signals in different conflict sets
+are green in parallel.
+
+Splits come from the AI model: every signal's predicted green time is its
+demand, scaled so the greens of a set fill the corridor cycle. Each step
+is one NumPy operation over the whole network.
+
+Between re-optimizations the plan is executed by sweep(), one vectorized
+pass per control tick that returns the signals whose phase changes.
+"""
+
+import math
+
+import numpy as np
+
+
+YELLOW_TIME = 5.0
+MIN_GREEN = 10.0
+MAX_GREEN = 90.0
+CROSS_GREEN = 15.0      # demand of the cross street of a signal alone in its set
+MIN_CYCLE = 40.0
+MAX_CYCLE = 180.0
+MAX_CORRIDOR = 20       # intersections per derived corridor
+
+GREEN, YELLOW, RED = 0, 1, 2
+STATES = ("green", "yellow", "red")
+
+
+def derive_corridors(road_network, ids, lanes, max_length=MAX_CORRIDOR):
+    """Chain intersections along the roads: straightest continuation, then most lanes, then shortest"""
+    members = set(ids)
+    coords = road_network.coords
+    free_flow = road_network.free_flow
+
+    def straightness(chain, node):
+        if coords is None or len(chain) < 2:
+            return 0.0
+        (x0, y0), (x1, y1), (x2, y2) = coords[chain[-2]], coords[chain[-1]], coords[node]
+        a, b = (x1 - x0, y1 - y0), (x2 - x1, y2 - y1)
+        norm = math.hypot(*a) * math.hypot(*b)
+        return round((a[0] * b[0] + a[1] * b[1]) / norm, 1) if norm else 0.0
+
+    assigned = set()
+    corridors = []
+    for start in sorted(ids, key=lambda key: -lanes[key]):
+        if start in assigned:
+            continue
+        chain = [start]
+        assigned.add(start)
+        while len(chain) < max_length:
+            node = chain[-1]
+            candidates = [v for v in free_flow.get(node, ()) if v in members and v not in assigned]
+            if not candidates:
+                break
+            chain.append(min(candidates, key=lambda v: (-straightness(chain, v), -lanes[v], free_flow[node][v])))
+            assigned.add(chain[-1])
+        corridors.append(chain)
+
+    return corridors
+
+
+class NetworkCoordinator:
+    def __init__(self, ids, lanes, corridors=(), conflict_sets=(), road_network=None):
+        """
+        ids: intersections to coordinate; lanes: id -> lanes
+        corridors, conflict_sets: lists of id lists (see read_coordination_config);
+        corridors are derived from road_network when none are given
+        """
+        self.ids = list(ids)
+        self.index = {key: i for i, key in enumerate(self.ids)}
+        n = len(self.ids)
+
+        # Every signal is in exactly one conflict set, alone unless listed
+        set_of = np.full(n, -1, dtype=np.int64)
+        rank = np.zeros(n, dtype=np.int64)
+        n_sets = 0
+        for group in conflict_sets:
+            members = [self.index[key] for key in group if key in self.index and set_of[self.index[key]] < 0]
+            if members:
+                set_of[members] = n_sets
+                rank[members] = np.arange(len(members))
+                n_sets += 1
+        alone = np.flatnonzero(set_of < 0)
+        set_of[alone] = np.arange(n_sets, n_sets + len(alone))
+        n_sets += len(alone)
+
+        if not corridors and road_network is not None:
+            corridors = derive_corridors(road_network, self.ids, lanes)
+
+        # A set joins the corridor of its first listed member; its offset is
+        # the free-flow travel time from the head of that corridor
+        corridor_of_set = np.full(n_sets, -1, dtype=np.int64)
+        set_travel = np.zeros(n_sets)
+        for c, chain in enumerate(corridors):
+            travel, previous = 0.0, None
+            for key in chain:
+                if key not in self.index:
+                    continue
+                if previous is not None and road_network is not None:
+                    travel += road_network.free_flow.get(previous, {}).get(key, 0.0)
+                s = set_of[self.index[key]]
+                if corridor_of_set[s] < 0:
+                    corridor_of_set[s] = c
+                    set_travel[s] = travel
+                previous = key
+        loose = np.flatnonzero(corridor_of_set < 0)
+        corridor_of_set[loose] = np.arange(len(corridors), len(corridors) + len(loose))
+
+        self.set_of = set_of
+        self.set_size = np.bincount(set_of, minlength=n_sets)
+        self.corridor_of_set = corridor_of_set
+        self.n_corridors = int(corridor_of_set.max()) + 1 if n_sets else 0
+        self.set_travel = set_travel
+
+        # Members sorted by (set, rank) for the segmented sums of the offsets
+        self.order = np.lexsort((rank, set_of))
+        self.set_start = np.searchsorted(set_of[self.order], np.arange(n_sets))
+
+        self.cycle = np.full(n, MIN_CYCLE)
+        self.green = np.zeros(n)
+        self.offset = np.zeros(n)
+        self.state = np.full(n, RED, dtype=np.int8)
+        self.since = np.full(n, -np.inf)
+
+    def optimize(self, green_times):
+        """New cycle, split and offset of every signal from its AI green time"""
+        g = np.clip(np.asarray(green_times, dtype=float), MIN_GREEN, MAX_GREEN)
+        set_of, corridor_of_set = self.set_of, self.corridor_of_set
+
+        # A signal alone in its set alternates with its cross street
+        alone = self.set_size == 1
+        demand = np.bincount(set_of, weights=g, minlength=len(self.set_size)) + alone * CROSS_GREEN
+        lost = (self.set_size + alone) * YELLOW_TIME
+        required = demand + lost
+
+        corridor_cycle = np.zeros(self.n_corridors)
+        np.maximum.at(corridor_cycle, corridor_of_set, required)
+        set_cycle = np.clip(corridor_cycle, MIN_CYCLE, MAX_CYCLE)[corridor_of_set]
+
+        # Greens of a set share the cycle in proportion to the AI green times,
+        # but never drop below MIN_GREEN: a set they do not fit in stretches
+        # its corridor's cycle past MAX_CYCLE
+        scale = (set_cycle - lost) / demand
+        green = np.maximum(g * scale[set_of], MIN_GREEN)
+        needed = (np.bincount(set_of, weights=green, minlength=len(self.set_size))
+                  + alone * np.maximum(CROSS_GREEN * scale, MIN_GREEN) + lost)
+        over = needed > set_cycle + 1e-6
+        corridor_cycle[:] = 0.0
+        np.maximum.at(corridor_cycle, corridor_of_set, np.where(over, needed, set_cycle))
+        stretched = corridor_cycle[corridor_of_set] > set_cycle
+        set_cycle = corridor_cycle[corridor_of_set]
+
+        # Each member starts after the greens (and yellows) of the ones before it
+        slot = (green + YELLOW_TIME)[self.order]
+        before = np.cumsum(slot) - slot
+        within = np.empty_like(green)
+        within[self.order] = before - before[self.set_start][set_of[self.order]]
+
+        cycle = set_cycle[set_of]
+        self.cycle = cycle
+        self.green = green
+        self.offset = (self.set_travel[set_of] + within) % cycle
+
+        return {
+            "corridors": self.n_corridors,
+            "conflict_sets": len(self.set_size),
+            "mean_cycle": round(float(cycle.mean()), 1) if len(cycle) else 0.0,
+            "oversaturated_sets": int(np.count_nonzero(required > MAX_CYCLE)),
+            "stretched_sets": int(np.count_nonzero(stretched))
+        }
+
+    def sweep(self, now, held=None):
+        """
+        Indices of the signals whose phase changes at now (their new phase is
+        in self.state). Whatever the plan, a green lasts MIN_GREEN and ends
+        in YELLOW_TIME of yellow; held signals are left alone. A signal turns
+        green only when every other member of its conflict set is red, so a
+        re-plan that moves greens around waits for the old ones to clear.
+        """
+        position = (now - self.offset) % self.cycle
+        target = np.where(position < self.green, GREEN,
+                          np.where(position < self.green + YELLOW_TIME, YELLOW, RED)).astype(np.int8)
+
+        state, elapsed = self.state, now - self.since
+        target[(state == GREEN) & (target != GREEN) & (elapsed < MIN_GREEN)] = GREEN
+        target[(state == GREEN) & (target == RED)] = YELLOW
+        target[(state == YELLOW) & (elapsed < YELLOW_TIME)] = YELLOW
+        target[(state == YELLOW) & (target == GREEN)] = RED
+        target[(state == RED) & (target == YELLOW)] = RED
+
+        changed = target != state
+        if held is not None:
+            changed &= ~held
+
+        # Greens are deferred to a later tick while their set is busy; of
+        # several members opening at once, the first listed goes
+        opening = changed & (state == RED) & (target == GREEN)
+        after = np.where(changed, target, state)
+        busy = np.bincount(self.set_of, weights=(after != RED) & ~opening, minlength=len(self.set_size)) > 0
+        candidates = np.flatnonzero(opening & ~busy[self.set_of])
+        _, first = np.unique(self.set_of[candidates], return_index=True)
+        changed[opening] = False
+        changed[candidates[first]] = True
+
+        indices = np.flatnonzero(changed)
+        state[indices] = target[indices]
+        self.since[indices] = now
+        return indices
+
+    def next_green(self, now, indices=None):
+        """When the planned green of each signal (or of indices) starts next; now if it is green"""
+        offset, cycle, green = self.offset, self.cycle, self.green
+        if indices is not None:
+            offset, cycle, green = offset[indices], cycle[indices], green[indices]
+        position = (now - offset) % cycle
+        return np.where(position < green, now, now + cycle - position)
+
+    def set_state(self, key, state, now):
+        """Phase a signal was put in outside the plan (emergency preemption)"""
+        i = self.index[key]
+        self.state[i] = state
+        self.since[i] = now
\ No newline at end of file
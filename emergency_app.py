@@ -1,15 +1,22 @@
-import paho.mqtt.client as mqtt
-import json
+import sys
 import time
 
-print("=" * 50)
-print("EMERGENCY VEHICLE APPLICATION")
-print("=" * 50)
+from traffic_logging import fields, get_logger, setup_logging
+from transport import create_transport
+from wire_format import decode, encode
+
+logger = get_logger("emergency")
+
+# Seconds between intersections when the response carries no ETAs
+DEFAULT_LEG_TIME = 2
 
 
 class EmergencyApp:
-    def __init__(self):
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "EmergencyApp")
+    def __init__(self, wire_format="json", transport=None, scheduler=None):
+        self.wire_format = wire_format
+        # With a scheduler the vehicle moves on its clock instead of sleeping
+        self.scheduler = scheduler
+        self.client = transport or create_transport("EmergencyApp")
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.route = None
@@ -17,49 +24,73 @@ class EmergencyApp:
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         _ = userdata, flags, properties
-        print("Connected to smart traffic system!")
-        print(f"   Connection code: {rc}")
         if rc == 0:
             client.subscribe("emergency/response")
-            print("   Subscribed to emergency/response channel")
+            logger.info("Connected to smart traffic system - subscribed to emergency/response")
         else:
-            print(f"   Connection failed: {rc}")
+            logger.error("Connection failed", extra=fields(code=rc))
 
     def on_message(self, client, userdata, msg):
         _ = userdata
         try:
-            data = json.loads(msg.payload.decode())
+            data = decode(msg.payload)
             self.route = data
             self.emergency_active = True
 
-            print("\n" + "📍" * 25)
-            print("   EMERGENCY ROUTE RECEIVED FROM CENTRAL SYSTEM!")
-            print("   Route:", " → ".join(data.get('path', [])))
-            print("   Estimated time:", data.get('estimated_time', 'Unknown'))
-            print("   Status:", data.get('status', 'Unknown'))
+            logger.info("Emergency route received: %s", " → ".join(data.get('path', [])), extra=fields(
+                estimated_time=data.get('estimated_time', 'Unknown'),
+                status=data.get('status', 'Unknown'),
+                all_clear=data.get('all_clear', False)
+            ))
 
-            if data.get('all_clear', False):
-                print("   All signals on route are GREEN")
+            self.simulate_emergency_movement(data.get('path', []), data.get('etas'),
+                                             data.get('vehicle_id'), data.get('request'))
 
-            print("📍" * 25 + "\n")
+        except Exception:
+            logger.exception("Error receiving route")
 
-            self.simulate_emergency_movement(data.get('path', []))
+    def simulate_emergency_movement(self, path, etas=None, vehicle_id=None, request=None):
+        """Drive the route on its ETAs, reporting each intersection passed"""
+        if not path:
+            return
 
-        except Exception as e:
-            print(f"Error receiving route: {e}")
+        if not etas:
+            etas = [i * DEFAULT_LEG_TIME for i in range(len(path))]
+        legs = [later - earlier for earlier, later in zip([0] + etas, etas)]
 
-    def simulate_emergency_movement(self, path):
-        if not path:
+        if self.scheduler is not None:
+            self.scheduler.call_later(legs[0], self.pass_intersection, path, legs, (vehicle_id, request), 0)
             return
 
-        print("Emergency vehicle movement simulation:")
-        for i, intersection in enumerate(path, 1):
-            print(f"   {i}. Passing through {intersection}...")
-            time.sleep(2)
+        for i, intersection in enumerate(path):
+            time.sleep(legs[i])
+            self.report_progress(path, (vehicle_id, request), i)
 
-        print("   Destination reached successfully!")
+        logger.info("Destination reached")
         self.emergency_active = False
 
+    def pass_intersection(self, path, legs, trip, index):
+        self.report_progress(path, trip, index)
+
+        if index + 1 == len(path):
+            logger.info("Destination reached")
+            self.emergency_active = False
+            return
+
+        self.scheduler.call_later(legs[index + 1], self.pass_intersection, path, legs, trip, index + 1)
+
+    def report_progress(self, path, trip, index):
+        """trip: (vehicle_id, request) of the response being driven"""
+        logger.debug("%d. Passing through %s", index + 1, path[index])
+        vehicle_id, request = trip
+        progress = {
+            "vehicle_id": vehicle_id,
+            "request": request,
+            "intersection": path[index],
+            "timestamp": time.time()
+        }
+        self.client.publish("emergency/progress", encode("emergency_progress", progress, self.wire_format))
+
     def send_emergency_request(self, vehicle_type="Ambulance"):
         requests = {
             "Ambulance": {
@@ -88,43 +119,40 @@ class EmergencyApp:
         request = requests.get(vehicle_type, requests["Ambulance"])
         request['timestamp'] = time.time()
 
-        print(f"\nSending emergency request:")
-        print(f"   Vehicle: {request['vehicle_id']}")
-        print(f"   From: {request['from']}")
-        print(f"   To: {request['to']}")
-        print(f"   Priority: {request['priority']}")
-
-        self.client.publish("emergency/request", json.dumps(request))
-        print("   Request sent to central system")
+        self.client.publish("emergency/request", encode("emergency_request", request, self.wire_format))
+        logger.info("Emergency request sent", extra=fields(
+            vehicle=request['vehicle_id'], origin=request['from'],
+            destination=request['to'], priority=request['priority']
+        ))
 
     def start(self):
         try:
-            print("Connecting to MQTT Broker...")
-            self.client.connect("broker.emqx.io", 1883, 60)
+            logger.info("Connecting to broker")
+            self.client.connect()
             self.client.loop_start()
 
             time.sleep(2)
 
             vehicles = ["Ambulance", "Fire", "Police"]
             for i, vehicle in enumerate(vehicles, 1):
-                print(f"\n{'=' * 40}")
-                print(f"Emergency request #{i}: {vehicle}")
+                logger.info("Emergency request #%d: %s", i, vehicle)
                 self.send_emergency_request(vehicle)
                 time.sleep(10)
 
-            print("\n" + "=" * 50)
-            print("Emergency application running...")
-            print("Press Ctrl+C to stop")
+            logger.info("Emergency application running - press Ctrl+C to stop")
 
             while True:
                 time.sleep(5)
 
         except KeyboardInterrupt:
-            print("\nStopping emergency application")
-        except Exception as e:
-            print(f"Error: {e}")
+            logger.info("Stopping emergency application")
+        except Exception:
+            logger.exception("Emergency application failed")
 
 
 if __name__ == "__main__":
-    app = EmergencyApp()
+    setup_logging()
+    logger.info("EMERGENCY VEHICLE APPLICATION")
+
+    app = EmergencyApp("binary" if "--binary" in sys.argv else "json")
     app.start()
\ No newline at end of file
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Flat Forest - Random Forest flattened into contiguous NumPy arrays
+
+On-disk format (version 1) is a directory holding one .npy file per array
+plus meta.json, so every array can be memory-mapped and shared between
+processes without unpickling sklearn objects.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+FORMAT_NAME = "traffic-flat-forest"
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+ARRAYS = ["feature", "threshold", "children", "value", "roots"]
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, children, value, roots, max_depth, n_features, inputs=None):
+        """
+        All trees share one node numbering. children holds the (left, right)
+        pair of each node; leaves point to themselves, so extra traversal
+        steps past a leaf are no-ops. inputs holds serving parameters of the
+        model's inputs (s_per_lane) saved with it.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.left = children[:, 0]
+        self.right = children[:, 1]
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.n_trees = len(roots)
+        self.inputs = dict(inputs or {})
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Flatten a fitted RandomForestRegressor"""
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+
+            roots.append(offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            children.append(np.column_stack([
+                np.where(leaf, nodes, tree.children_left),
+                np.where(leaf, nodes, tree.children_right)
+            ]) + offset)
+            values.append(tree.value[:, 0, 0])
+
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max(estimator.tree_.max_depth for estimator in forest.estimators_),
+            n_features=forest.n_features_in_
+        )
+
+    def save(self, path):
+        """Write the forest as a versioned directory of .npy files"""
+        os.makedirs(path, exist_ok=True)
+
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+        meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "n_trees": self.n_trees,
+            "n_nodes": len(self.feature),
+            "n_features": self.n_features,
+            "max_depth": self.max_depth,
+            "inputs": self.inputs
+        }
+        # meta.json is written last and marks the export as complete
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a saved forest, memory-mapping the arrays by default"""
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+
+        if meta.get("format") != FORMAT_NAME or meta.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported flat model format in {path}: "
+                f"{meta.get('format')} v{meta.get('version')}"
+            )
+
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAYS
+        }
+        return cls(max_depth=meta["max_depth"], n_features=meta["n_features"],
+                   inputs=meta.get("inputs"), **arrays)
+
+    def predict(self, X, chunk_size=4096):
+        """Evaluate every tree for many rows at once"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty(len(X), dtype=np.float64)
+
+        for start in range(0, len(X), chunk_size):
+            rows = X[start:start + chunk_size]
+            out[start:start + chunk_size] = self.predict_chunk(rows)
+
+        return out
+
+    def predict_chunk(self, rows):
+        """Traverse all (tree, row) pairs of one chunk level by level"""
+        n_rows = len(rows)
+        columns = np.ascontiguousarray(rows.T, dtype=np.float64).ravel()
+        children = self.children.ravel()
+
+        # Tree-major layout: pair i is tree i // n_rows, row i % n_rows
+        node = np.repeat(self.roots.astype(np.intp), n_rows)
+        active = np.arange(len(node))
+        row = np.tile(np.arange(n_rows), self.n_trees)
+        current = node.copy()
+
+        for _ in range(self.max_depth):
+            x = columns.take(self.feature.take(current) * n_rows + row)
+            go_right = x > self.threshold.take(current)
+            nxt = children.take(2 * current + go_right)
+
+            # Drop pairs that reached a leaf so deeper levels touch less data
+            moved = nxt != current
+            if moved.all():
+                current = nxt
+                continue
+            node[active] = nxt
+            active = active[moved]
+            row = row[moved]
+            current = nxt[moved]
+            if not len(active):
+                break
+
+        node[active] = current
+        leaf_values = self.value.take(node).reshape(self.n_trees, n_rows)
+
+        # Accumulate tree by tree in the same order as sklearn for identical sums
+        total = np.zeros(n_rows, dtype=np.float64)
+        for tree_values in leaf_values:
+            total += tree_values
+
+        return total / self.n_trees
\ No newline at end of file
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Forecast - short-horizon queue forecasts for every intersection
+
+A signal reports its queue every few seconds, and a green is often
+decided well before it starts. Each intersection keeps its last reading
+and an arrival trend in cars per second, smoothed over the slopes between
+consecutive readings taken while the signal was red (a green discharges
+the queue, so those slopes say nothing about arrivals). A forecast is the
+last reading carried along the trend to the time the green starts, less
+the cars the signal reported passed since that reading.
+
+State is four numbers per intersection in NumPy arrays, so updates and
+forecasts are single vectorized operations over any set of intersections.
+
+Forecasting is off unless the controller is started with --forecast. In
+the simulator (simulation.py --evaluate-forecast, 3 seeds x 24 h) it
+lowers vehicle delay and raises throughput, but the mean wait per red
+phase rises by about a quarter; the horizon cap does not change that.
+"""
+
+import numpy as np
+
+
+SMOOTHING = 0.2     # weight of the newest slope in the trend
+MAX_QUEUE = 50      # queues are reported up to this many cars
+MAX_HORIZON = 300   # seconds a forecast may look ahead
+
+
+class QueueForecaster:
+    def __init__(self, n, smoothing=SMOOTHING, max_queue=MAX_QUEUE, max_horizon=MAX_HORIZON):
+        self.smoothing = smoothing
+        self.max_queue = max_queue
+        self.max_horizon = max_horizon
+
+        self.queue = np.zeros(n)
+        self.trend = np.zeros(n)         # cars per second
+        self.updated = np.full(n, np.nan)
+        self.red = np.zeros(n, dtype=bool)
+
+    def update(self, rows, values, now, red):
+        """New readings of rows at now; red marks the rows that were red when they reported"""
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        red = np.asarray(red, dtype=bool)
+
+        dt = now - self.updated[rows]
+        learn = red & self.red[rows] & (dt > 0)
+        slope = np.divide(values - self.queue[rows], dt, out=np.zeros_like(dt), where=learn)
+        trend = self.trend[rows]
+        self.trend[rows] = np.where(learn, self.smoothing * slope + (1 - self.smoothing) * trend, trend)
+
+        self.queue[rows] = values
+        self.updated[rows] = now
+        self.red[rows] = red
+
+    def discharged(self, rows, cars):
+        """Cars of rows that left on their last green, before a reading shows it"""
+        rows = np.asarray(rows, dtype=np.int64)
+        self.queue[rows] = np.maximum(0.0, self.queue[rows] - np.asarray(cars, dtype=np.float64))
+
+    def forecast(self, rows, at):
+        """Queue of rows at time at (scalar or per row), in whole cars"""
+        rows = np.asarray(rows, dtype=np.int64)
+        horizon = np.clip(np.nan_to_num(at - self.updated[rows]), 0.0, self.max_horizon)
+        queue = self.queue[rows] + self.trend[rows] * horizon
+        return np.rint(np.clip(queue, 0, self.max_queue))
\ No newline at end of file
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Green Wave - emergency preemption timed from the vehicle's ETA
+
+Every intersection on the route is held green only while the emergency
+vehicle can be there: from just before its earliest possible arrival
+(free-flow travel at emergency speed, less the time to flush the queue
+standing in front of it) until just after its latest expected arrival
+(live travel times plus a margin that grows with the distance still to
+drive). When the vehicle reports passing an intersection, that signal is
+released at once and the windows still ahead are re-planned from the
+vehicle's actual position, so they narrow as it drives.
+"""
+
+EMERGENCY_SPEEDUP = 1.25   # an emergency vehicle may beat free-flow travel time by this factor
+ETA_MARGIN = 0.15          # share of the travel time still to drive added to the latest arrival
+ETA_SLACK = 3.0            # seconds added to every latest arrival
+ACTUATION_LEAD = 1.0       # seconds for a command to reach the signal and switch it
+QUEUE_HEADWAY = 2.0        # seconds per queued car and lane to flush ahead of the vehicle
+MAX_FLUSH = 20.0
+PASS_TIME = 3.0            # seconds for the vehicle to clear the intersection
+FALLBACK_GREEN = 60.0      # seconds of green everywhere when no route is known
+
+
+def flush_time(density, lanes):
+    """Seconds to discharge the queue in front of the vehicle"""
+    return min(MAX_FLUSH, density / max(1, lanes) * QUEUE_HEADWAY)
+
+
+class GreenWindow:
+    __slots__ = ("signal_id", "eta", "start", "end", "on_timer", "off_timer",
+                 "active", "opened", "released")
+
+    def __init__(self, signal_id):
+        self.signal_id = signal_id
+        self.eta = None
+        self.start = None
+        self.end = None
+        self.on_timer = None
+        self.off_timer = None
+        self.active = False
+        self.opened = None
+        self.released = False
+
+
+class GreenWave:
+    def __init__(self, vehicle, path, departure, arrivals=None, fastest=None, flush=None, request=None):
+        """
+        request: id of the emergency request, echoed by the vehicle's progress reports
+        path: intersection ids in driving order, vehicle leaving path[0] at departure
+        arrivals: expected seconds from departure to each intersection (live travel times)
+        fastest: the same at free-flow speed limits
+        flush: seconds to clear the queue at each intersection
+        Without arrivals (no route known) every intersection is green for FALLBACK_GREEN.
+        """
+        self.vehicle = vehicle
+        self.request = request
+        self.path = path
+        self.departure = departure
+        self.arrivals = arrivals
+        self.fastest = fastest
+        self.flush = flush or [0.0] * len(path)
+        self.windows = {signal_id: GreenWindow(signal_id) for signal_id in path}
+
+        if arrivals is None:
+            for window in self.windows.values():
+                window.start, window.end = departure, departure + FALLBACK_GREEN
+        else:
+            self.plan(0, departure)
+
+    def plan(self, index, when):
+        """(Re)time the windows of path[index:] for the vehicle at path[index] at time when"""
+        for i in range(index, len(self.path)):
+            live = self.arrivals[i] - self.arrivals[index]
+            earliest = when + (self.fastest[i] - self.fastest[index]) / EMERGENCY_SPEEDUP
+
+            window = self.windows[self.path[i]]
+            window.eta = when + live
+            window.start = earliest - self.flush[i] - ACTUATION_LEAD
+            window.end = window.eta + ETA_MARGIN * live + ETA_SLACK + PASS_TIME
+
+    def etas(self):
+        """Seconds after departure the vehicle is expected at each intersection (None without a route)"""
+        if self.arrivals is None:
+            return None
+        return [round(self.windows[signal_id].eta - self.departure, 1) for signal_id in self.path]
+
+    def green_seconds(self):
+        """Planned preemption of all windows, in signal-seconds"""
+        return sum(window.end - window.start for window in self.windows.values())
\ No newline at end of file
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Inference Pool - green time predictions in worker processes
+
+Each worker process loads the serving model and answers requests over
+its own pipe, so forest evaluation never holds the controller's GIL.
+A batch of intersections is split into one chunk per worker; a worker
+reads its pipe on a thread of its own (so sending to it never blocks on
+an answer it is writing), takes every request waiting and evaluates them
+as one micro-batch, dropping requests whose deadline already passed.
+
+Every batch has a latency budget. Chunks not answered by the deadline
+are given the closed-form teacher equation at the serving model's
+saturation flow, so the caller waits at most the budget however large
+the model grows; late answers are discarded when they arrive.
+
+Workers serve the flat export of a pickled model: a scikit-learn forest
+takes longer than the budget for a single batch. A worker that dies is
+started again, and a pool answering mostly from the teacher equation
+says so in the log.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from ai_model import TrafficAIModel, flat_model_path, round_green
+from traffic_logging import fields, get_logger, setup_logging
+
+
+INFERENCE_WORKERS = 2
+INFERENCE_BUDGET = 0.020    # seconds a batch may take before the teacher equation answers it
+MIN_CHUNK = 256             # inputs per worker below which a batch goes to one worker
+RESPAWN_DELAY = 5.0         # seconds between restarts of one worker
+FALLBACK_WINDOW = 100       # batches per check of the fallback share
+FALLBACK_WARNING = 0.5      # share of inputs answered by the teacher equation worth a warning
+
+logger = get_logger("inference")
+
+
+def worker_model_path(model_path):
+    """The flat export of a pickled model if there is one, else model_path"""
+    if os.path.isdir(model_path):
+        return model_path
+    flat_path = flat_model_path(model_path)
+    if os.path.isdir(flat_path):
+        return flat_path
+    logger.warning("No flat export of %s - inference workers run the pickled forest, "
+                   "which can miss the latency budget on every batch", model_path)
+    return model_path
+
+
+def read_requests(conn, requests):
+    """Worker reader thread: move requests from the pipe to a queue"""
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            request = None
+        requests.put(request)
+        if request is None:
+            return
+
+
+def serve(conn, model_path, log_level):
+    """Worker process: answer (batch, deadline, Q, lanes, t_lost) requests until None arrives"""
+    setup_logging(log_level)
+    model = TrafficAIModel(model_path, lazy=True)
+    pending = queue.Queue()
+    threading.Thread(target=read_requests, args=(conn, pending), daemon=True).start()
+
+    while True:
+        requests = [pending.get()]
+        while not pending.empty():
+            requests.append(pending.get())
+
+        batch = []
+        for request in requests:
+            if request is None:
+                return
+            if request[0] == "load":
+                model = TrafficAIModel(request[1], lazy=True)
+            elif request[1] > time.monotonic():
+                batch.append(request)
+        if not batch:
+            continue
+
+        sizes = [len(request[2]) for request in batch]
+        g = model.predict_green_times(
+            np.concatenate([request[2] for request in batch]),
+            np.concatenate([request[3] for request in batch]),
+            np.concatenate([request[4] for request in batch])
+        )
+        for request, answer in zip(batch, np.split(g, np.cumsum(sizes)[:-1])):
+            conn.send((request[0], answer))
+
+
+class InferencePool:
+    def __init__(self, model, workers=INFERENCE_WORKERS, budget=INFERENCE_BUDGET):
+        """
+        model: the serving TrafficAIModel, loaded from disk; workers load
+        the same path and its s_per_lane is used by the fallback
+        """
+        if not model.model_path or not os.path.exists(model.model_path):
+            raise ValueError("Inference workers need a model saved on disk")
+        self.model = model
+        self.model_path = worker_model_path(model.model_path)
+        self.budget = budget
+        self.next_batch = 0
+        self.next_worker = 0
+        self.stats = {"inference_batches": 0, "inference_inputs": 0, "inference_deadline_missed": 0,
+                      "inference_fallback_inputs": 0, "inference_restarts": 0}
+        # Inputs and fallbacks at the start of the current FALLBACK_WINDOW
+        self.window_start = (0, 0)
+
+        self.context = multiprocessing.get_context("spawn")
+        self.connections = [None] * workers
+        self.processes = [None] * workers
+        self.started = [0.0] * workers
+        for i in range(workers):
+            self.spawn(i)
+        logger.info("Inference workers started", extra=fields(
+            workers=workers, budget_ms=budget * 1000, model=self.model_path
+        ))
+
+    def spawn(self, i):
+        """Start worker i on the serving model, with a new pipe"""
+        conn, child = self.context.Pipe()
+        process = self.context.Process(target=serve, args=(child, self.model_path, logger.getEffectiveLevel()),
+                                       name=f"InferenceWorker-{i}", daemon=True)
+        process.start()
+        child.close()
+        if self.connections[i] is not None:
+            self.connections[i].close()
+        self.connections[i] = conn
+        self.processes[i] = process
+        self.started[i] = time.monotonic()
+
+    def worker(self):
+        """Connection of the next live worker in turn, restarting a dead one; None if it is down"""
+        i = self.next_worker % len(self.processes)
+        self.next_worker += 1
+        if self.processes[i].is_alive():
+            return self.connections[i]
+        if time.monotonic() - self.started[i] < RESPAWN_DELAY:
+            return None
+        logger.error("Inference worker %d exited - restarting it", i,
+                     extra=fields(exitcode=self.processes[i].exitcode))
+        self.stats["inference_restarts"] += 1
+        self.spawn(i)
+        return self.connections[i]
+
+    @property
+    def s_per_lane(self):
+        return self.model.s_per_lane
+
+    def load(self, model):
+        """Serve a new model; requests sent after this use it"""
+        self.model = model
+        self.model_path = worker_model_path(model.model_path)
+        for conn in self.connections:
+            self.send(conn, ("load", self.model_path))
+
+    def predict_green_times(self, Q_queue, lanes, t_lost=3.0):
+        """Same answer as TrafficAIModel.predict_green_times, within the budget"""
+        deadline = time.monotonic() + self.budget
+        Q, lanes, t_lost = np.broadcast_arrays(
+            np.asarray(Q_queue, dtype=np.float64),
+            np.asarray(lanes, dtype=np.float64),
+            np.asarray(t_lost, dtype=np.float64)
+        )
+        g = np.empty(Q.shape, dtype=np.float64)
+        if not len(Q):
+            return g
+        self.stats["inference_batches"] += 1
+        self.stats["inference_inputs"] += len(Q)
+
+        # Small batches go whole to the next worker in turn
+        parts = min(len(self.connections), max(1, len(Q) // MIN_CHUNK))
+        pending = {}
+        for chunk in np.array_split(np.arange(len(Q)), parts):
+            conn = self.worker()
+            self.next_batch += 1
+            if conn is not None and self.send(conn, (self.next_batch, deadline, Q[chunk], lanes[chunk], t_lost[chunk])):
+                pending[self.next_batch] = (conn, chunk)
+            else:
+                self.fallback(g, Q, lanes, t_lost, chunk)
+
+        for batch, (conn, chunk) in pending.items():
+            answer = self.receive(conn, batch, deadline)
+            if answer is None:
+                self.fallback(g, Q, lanes, t_lost, chunk)
+            else:
+                g[chunk] = answer
+
+        if not self.stats["inference_batches"] % FALLBACK_WINDOW:
+            self.check_fallback()
+        return g
+
+    def check_fallback(self):
+        """Warn when the last FALLBACK_WINDOW batches were answered mostly by the teacher equation"""
+        inputs, fallbacks = self.stats["inference_inputs"], self.stats["inference_fallback_inputs"]
+        share = (fallbacks - self.window_start[1]) / max(1, inputs - self.window_start[0])
+        self.window_start = (inputs, fallbacks)
+        if share >= FALLBACK_WARNING:
+            logger.warning("%.0f%% of the last %d batches answered by the teacher equation - "
+                           "the model does not fit the %.0f ms budget", share * 100, FALLBACK_WINDOW,
+                           self.budget * 1000, extra=fields(model=self.model_path))
+
+    def send(self, conn, request):
+        try:
+            conn.send(request)
+            return True
+        except (OSError, ValueError):
+            logger.error("Inference worker unreachable")
+            return False
+
+    def receive(self, conn, batch, deadline):
+        """Answer to batch from conn, or None once the deadline passes; older answers are dropped"""
+        try:
+            while conn.poll(max(0.0, deadline - time.monotonic())):
+                answer_batch, answer = conn.recv()
+                if answer_batch == batch:
+                    return answer
+        except (EOFError, OSError):
+            logger.error("Inference worker unreachable")
+        self.stats["inference_deadline_missed"] += 1
+        return None
+
+    def fallback(self, g, Q, lanes, t_lost, chunk):
+        """Teacher equation for the inputs of chunk"""
+        self.stats["inference_fallback_inputs"] += len(chunk)
+        g[chunk] = round_green(self.model.teacher_green_times(Q[chunk], lanes[chunk] * self.s_per_lane,
+                                                              t_lost[chunk]))
+
+    def close(self):
+        for conn, process in zip(self.connections, self.processes):
+            if process.is_alive():
+                self.send(conn, None)
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
\ No newline at end of file
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Intersection Registry - config loading and indexed priority queue
+"""
+
+import csv
+import json
+import os
+import threading
+
+
+# Runtime state every intersection starts with
+DEFAULT_STATE = {
+    "density": 0,
+    "status": "red",
+    "green_time": 30,
+    "waiting_time": 0,
+    "priority": 0
+}
+
+
+def read_config_file(path):
+    """Parsed contents of a JSON, CSV or YAML config file"""
+    ext = os.path.splitext(path)[1].lower()
+
+    with open(path, encoding="utf-8") as f:
+        if ext == ".json":
+            data = json.load(f)
+        elif ext == ".csv":
+            data = list(csv.DictReader(f))
+        elif ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required for YAML intersection configs") from None
+            data = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unsupported intersection config format: {path}")
+
+    return data
+
+
+def read_config(path):
+    """Read intersection entries from a JSON, CSV or YAML file"""
+    data = read_config_file(path)
+
+    # JSON/YAML may wrap the list as {"intersections": [...]}
+    if isinstance(data, dict):
+        data = data["intersections"]
+    return data
+
+
+def read_road_config(path):
+    """
+    Road segments and named places of a JSON/YAML config wrapped as
+    {"intersections": [...], "roads": [...], "places": {...}}; a plain
+    list or CSV config has neither.
+    """
+    data = read_config_file(path)
+    if not isinstance(data, dict):
+        return [], {}
+    return data.get("roads", []), data.get("places", {})
+
+
+def read_coordination_config(path):
+    """
+    Corridors (lists of intersection ids in driving order) and conflict
+    sets (ids that may never be green together) of a JSON/YAML config;
+    missing groups are derived by the coordinator.
+    """
+    data = read_config_file(path)
+    if not isinstance(data, dict):
+        return [], []
+    return data.get("corridors", []), data.get("conflict_sets", [])
+
+
+def load_intersections(path):
+    """Build the intersection state dict, keyed by id, from a config file"""
+    intersections = {}
+
+    for entry in read_config(path):
+        intersection_id = entry["id"]
+        if intersection_id in intersections:
+            raise ValueError(f"Duplicate intersection id in {path}: {intersection_id}")
+
+        intersection = dict(entry)
+        intersection["name"] = entry.get("name") or intersection_id.upper()
+        intersection["lanes"] = int(entry["lanes"])
+        for key, value in DEFAULT_STATE.items():
+            intersection.setdefault(key, value)
+
+        intersections[intersection_id] = intersection
+
+    return intersections
+
+
+class IndexedPriorityQueue:
+    def __init__(self):
+        """
+        Max-heap of keys by priority with a key -> slot index, so a
+        priority can be updated or a key removed in O(log n). Ties go to
+        the key that was first added to the queue.
+        """
+        self.heap = []
+        self.position = {}
+        self.order = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def push(self, key, priority):
+        """Add key, or update its priority if already queued"""
+        with self.lock:
+            if key in self.position:
+                self.update_locked(key, priority)
+                return
+
+            order = self.order.setdefault(key, len(self.order))
+            self.heap.append([-priority, order, key])
+            self.position[key] = len(self.heap) - 1
+            self.sift_up(len(self.heap) - 1)
+
+    def update(self, key, priority):
+        """Change the priority of a queued key; ignored if not queued"""
+        with self.lock:
+            if key in self.position:
+                self.update_locked(key, priority)
+
+    def update_locked(self, key, priority):
+        i = self.position[key]
+        old = self.heap[i][0]
+        self.heap[i][0] = -priority
+        if -priority < old:
+            self.sift_up(i)
+        else:
+            self.sift_down(i)
+
+    def remove(self, key):
+        """Remove key from the queue if present"""
+        with self.lock:
+            i = self.position.pop(key, None)
+            if i is None:
+                return
+
+            last = self.heap.pop()
+            if i < len(self.heap):
+                self.heap[i] = last
+                self.position[last[2]] = i
+                self.sift_up(i)
+                self.sift_down(self.position[last[2]])
+
+    def peek(self):
+        """Highest-priority key, or None if empty"""
+        with self.lock:
+            return self.heap[0][2] if self.heap else None
+
+    def swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.position[heap[i][2]] = i
+        self.position[heap[j][2]] = j
+
+    def sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.heap[i][:2] < self.heap[parent][:2]:
+                self.swap(i, parent)
+                i = parent
+            else:
+                break
+
+    def sift_down(self, i):
+        n = len(self.heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self.heap[child][:2] < self.heap[smallest][:2]:
+                    smallest = child
+            if smallest == i:
+                break
+            self.swap(i, smallest)
+            i = smallest
\ No newline at end of file
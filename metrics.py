@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics - low-overhead instrumentation for the controller
+
+Counters and fixed-bucket histograms are plain numbers updated without
+locks: each metric is written by one thread (the transport loop or the
+scheduler) and exporters read a snapshot that may be a few updates behind.
+Per-message stages are timed on a sample of the messages only.
+
+Exported as JSON on the traffic/metrics topic and as Prometheus text
+on http://127.0.0.1:<port>/metrics.
+"""
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRICS_TOPIC = "traffic/metrics"
+
+# Histogram upper bounds in seconds, 1 us to 10 s
+BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+           0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# receive: on_message buffering        decode: payload bytes -> dict (JSON parse included)
+# parse: dict -> intersection state    predict: batched AI green times
+# schedule: one control_step decision  publish: encode + publish of one command
+STAGES = ("receive", "decode", "parse", "predict", "schedule", "publish")
+
+COUNTERS = ("density_messages", "status_messages", "emergency_messages", "density_coalesced",
+            "readings_drained", "decode_errors", "readings_applied", "ticks", "decisions", "commands",
+            "preemptions", "emergency_red_arrivals")
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q (None if empty)"""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), counts):
+            seen += count
+            if seen >= q * total:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.50),
+            "p99": self.quantile(0.99)
+        }
+
+
+class ControllerMetrics:
+    def __init__(self, sample_every=16):
+        """Counters, per-stage latency histograms and scheduler lag of one controller"""
+        # Per-message stages are timed for one message in sample_every
+        self.sample_every = sample_every
+        self.started = time.time()
+
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.scheduler_lag = Histogram()
+        self.gauges = {}
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def snapshot(self):
+        return {
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "stages": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+            "scheduler_lag": self.scheduler_lag.snapshot(),
+            "timestamp": time.time()
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix="traffic_controller"):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+
+        for name, value in self.gauges.items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for stage, histogram in self.stages.items():
+            lines += histogram_lines(f"{prefix}_stage_seconds", histogram, f'stage="{stage}",')
+
+        lines.append(f"# TYPE {prefix}_scheduler_lag_seconds histogram")
+        lines += histogram_lines(f"{prefix}_scheduler_lag_seconds", self.scheduler_lag)
+
+        return "\n".join(lines) + "\n"
+
+
+def histogram_lines(name, histogram, labels=""):
+    counts = list(histogram.counts)
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS + (float("inf"),), counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f'{name}_bucket{{{labels}le="{le}"}} {cumulative}')
+
+    label_set = f"{{{labels.rstrip(',')}}}" if labels else ""
+    lines.append(f"{name}_sum{label_set} {histogram.sum}")
+    lines.append(f"{name}_count{label_set} {cumulative}")
+    return lines
+
+
+def serve_prometheus(metrics, port, host="127.0.0.1"):
+    """Serve metrics.to_prometheus() on http://host:port/metrics from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+
+            body = metrics.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="MetricsHTTP")
+    thread.daemon = True
+    thread.start()
+    return server
\ No newline at end of file
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Phase Scheduler - asyncio timers for signal phase transitions
+"""
+
+import asyncio
+import threading
+
+
+class PhaseTimer:
+    def __init__(self, scheduler, when, callback, args):
+        """Handle for one scheduled phase transition"""
+        self.scheduler = scheduler
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.handle = None
+        self.cancelled = False
+
+    def run(self):
+        if not self.cancelled:
+            if self.scheduler.on_lag is not None:
+                self.scheduler.on_lag(self.scheduler.now() - self.when)
+            self.callback(*self.args)
+
+    def cancel(self):
+        """Cancel the transition; safe to call from any thread"""
+        self.cancelled = True
+        if self.handle is not None:
+            self.scheduler.loop.call_soon_threadsafe(self.handle.cancel)
+
+
+class PhaseScheduler:
+    def __init__(self, name="PhaseScheduler"):
+        """
+        One asyncio event loop on a background thread. Every phase change of
+        every intersection is a timer on this loop, so nothing ever sleeps
+        through a phase and a pending change can be cancelled at any time.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run_loop, name=name)
+        self.thread.daemon = True
+        # Called with (actual - planned) seconds for every timer that fires
+        self.on_lag = None
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def now(self):
+        """Monotonic clock the timers run on"""
+        return self.loop.time()
+
+    def call_at(self, when, callback, *args):
+        """Run callback(*args) on the scheduler thread at time when"""
+        timer = PhaseTimer(self, when, callback, args)
+
+        if threading.current_thread() is self.thread:
+            timer.handle = self.loop.call_at(when, timer.run)
+        else:
+            def arm():
+                if not timer.cancelled:
+                    timer.handle = self.loop.call_at(when, timer.run)
+            self.loop.call_soon_threadsafe(arm)
+
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) on the scheduler thread after delay seconds"""
+        return self.call_at(self.now() + delay, callback, *args)
\ No newline at end of file
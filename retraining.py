@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Retraining - refit the green time model from observed discharge
+
+Every green the controller gives is an observation: the queue it was
+given for, the lanes, the green time, the cars the signal reported passed
+and the seconds they took to discharge (the whole green if cars were left
+behind). Cars over discharge seconds is the flow per lane; from these the
+saturation flow is estimated, and a candidate model is trained on the
+teacher equation at that flow, in a worker process so the controller
+never waits for it. Signals that do not report discharge seconds only
+contribute the greens that left cars behind.
+
+A candidate is promoted only if it predicts the green times the held-out
+observations needed better than the serving model does. It is written to
+a new flat export (forest + lookup table) and the serving pointer file is
+replaced atomically, so the controller - and a restarted controller -
+always loads a complete model.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ai_model import TABLE_T_LOST, TeacherModel, TrafficAIModel
+from traffic_logging import fields, get_logger, setup_logging
+
+
+RETRAIN_PERIOD = 3600       # seconds between retraining attempts
+MIN_OBSERVATIONS = 200      # greens observed before the first attempt
+OBSERVATION_CAPACITY = 20_000
+HOLDOUT = 0.25              # share of the observations kept for validation
+MIN_IMPROVEMENT = 0.05      # share of the serving model's error a candidate must remove
+MIN_GAIN = 0.25             # and seconds of mean green time error
+S_PER_LANE_LIMITS = (0.2, 3.0)
+CANDIDATE_SAMPLES = 50_000
+CANDIDATE_TREES = 50
+
+SERVING_FILE = "serving.json"
+
+logger = get_logger("retraining")
+
+
+class DischargeLog:
+    def __init__(self, capacity=OBSERVATION_CAPACITY):
+        """Last capacity greens as rows of (queue, lanes, green_time, cars_passed, discharge_time)"""
+        self.rows = np.zeros((capacity, 5))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.rows))
+
+    def append(self, queue, lanes, green_time, cars_passed, discharge_time=None):
+        if discharge_time is None:
+            discharge_time = np.nan
+        self.rows[self.count % len(self.rows)] = (queue, lanes, green_time, cars_passed, discharge_time)
+        self.count += 1
+
+    def snapshot(self):
+        return self.rows[:len(self)].copy()
+
+
+def saturation_flow(observations, t_lost=TABLE_T_LOST):
+    """Flow per lane (cars per second) the observations show, or None without evidence"""
+    queue, lanes, green, cars, discharge = observations.T
+    # Without discharge seconds only a green that left cars behind shows how long they took
+    seconds = np.where(np.isnan(discharge), np.where(cars < queue, green, np.nan), discharge)
+    usable = (cars > 0) & (seconds > t_lost)
+    if np.count_nonzero(usable) < MIN_OBSERVATIONS // 4:
+        return None
+    flow = cars[usable] / (lanes[usable] * (seconds[usable] - t_lost))
+    return float(np.clip(np.median(flow), *S_PER_LANE_LIMITS))
+
+
+def green_error(model, observations, s_per_lane, t_lost=TABLE_T_LOST):
+    """Mean absolute error of a model against the greens observations needed at s_per_lane"""
+    queue, lanes = observations[:, 0], observations[:, 1]
+    needed = model.teacher_green_times(queue, lanes * s_per_lane, t_lost)
+    predicted = model.predict_green_times(Q_queue=queue, lanes=lanes, t_lost=t_lost)
+    return float(np.mean(np.abs(predicted - needed)))
+
+
+def fit_candidate(observations, serving_path, directory, seed=0):
+    """
+    Train a candidate on the observations and promote it if it passes the
+    validation gate; runs in the worker process. Returns a report dict.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    holdout = rng.random(len(observations)) < HOLDOUT
+    train, test = observations[~holdout], observations[holdout]
+
+    s_per_lane = saturation_flow(train)
+    s_test = saturation_flow(test)
+    report = {"observations": len(observations), "s_per_lane": s_per_lane, "promoted": False}
+    if s_per_lane is None or s_test is None:
+        report["reason"] = "not enough greens to estimate the saturation flow"
+        return report
+
+    if serving_path and os.path.exists(serving_path):
+        serving = TrafficAIModel(serving_path, lazy=True)
+    else:
+        serving = TeacherModel()
+    candidate = TrafficAIModel(
+        s_per_lane=s_per_lane, N=CANDIDATE_SAMPLES, n_jobs=1, seed=seed,
+        max_samples=CANDIDATE_SAMPLES // 10, n_estimators=CANDIDATE_TREES
+    )
+
+    # Validation gate: held-out greens, sane table, clear improvement
+    report["serving_error"] = green_error(serving, test, s_test)
+    report["candidate_error"] = green_error(candidate, test, s_test)
+    table = candidate.table
+    if not (np.isfinite(table).all() and table.min() >= 15 and table.max() <= 90):
+        report["reason"] = "lookup table out of bounds"
+    elif (report["candidate_error"] > report["serving_error"] * (1 - MIN_IMPROVEMENT)
+          or report["serving_error"] - report["candidate_error"] < MIN_GAIN):
+        report["reason"] = "no improvement on held-out greens"
+    else:
+        report["path"] = save_candidate(candidate, directory, seed)
+        report["promoted"] = True
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def save_candidate(model, directory, seed=0):
+    """Write a complete flat export under a new name, then point serving.json at it"""
+    os.makedirs(directory, exist_ok=True)
+    name = f"model_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{seed}"
+    staging = os.path.join(directory, f".{name}")
+    path = os.path.join(directory, name)
+
+    model.export_flat_model(staging)
+    model.save_lookup_table(staging)
+    os.rename(staging, path)
+    # The table's freshness stamp is the export's meta.json, which the rename keeps
+    os.rename(staging + "_table.npz", path + "_table.npz")
+
+    pointer = os.path.join(directory, SERVING_FILE)
+    with open(pointer + ".tmp", "w") as f:
+        json.dump({"path": path, "s_per_lane": model.s_per_lane, "promoted": time.time()}, f)
+    os.replace(pointer + ".tmp", pointer)
+    return path
+
+
+def serving_model_path(directory):
+    """Model promoted last in directory, or None"""
+    try:
+        with open(os.path.join(directory, SERVING_FILE)) as f:
+            path = json.load(f)["path"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return path if os.path.isdir(path) else None
+
+
+class Retrainer:
+    def __init__(self, directory, inline=False):
+        """
+        Runs fit_candidate in one spawned worker process; inline runs it in
+        the caller instead (simulations on a virtual clock)
+        """
+        self.directory = directory
+        # Spawned workers start with a fresh logging setup (configured from the environment)
+        self.executor = None if inline else ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=setup_logging
+        )
+        self.running = False
+        self.attempts = 0
+
+    def submit(self, observations, serving_path, done):
+        """Start one attempt unless one is running; done(report) is called from the worker's thread"""
+        if self.running:
+            return False
+        self.running = True
+        self.attempts += 1
+
+        if self.executor is None:
+            self.finish(fit_candidate(observations, serving_path, self.directory, self.attempts), done)
+            return True
+
+        future = self.executor.submit(fit_candidate, observations, serving_path, self.directory, self.attempts)
+
+        def finished(future):
+            try:
+                report = future.result()
+            except Exception as e:
+                logger.exception("Retraining failed")
+                report = {"promoted": False, "reason": f"worker failed: {e}"}
+            self.finish(report, done)
+
+        future.add_done_callback(finished)
+        return True
+
+    def finish(self, report, done):
+        self.running = False
+        logger.info("Retraining %s", "promoted a new model" if report["promoted"] else "kept the serving model",
+                    extra=fields(**{k: v for k, v in report.items() if k != "path"}))
+        done(report)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Road Network - intersection graph and cached emergency routes
+
+Intersections are nodes and road segments are directed edges weighted by
+travel time: free-flow time of the segment plus the queueing delay at the
+intersection it leads into, derived from live density smoothed over the
+last few reports.
+
+Emergency vehicles start from a handful of places (hospitals, fire and
+police stations), so instead of caching single routes the network keeps a
+shortest-path tree per origin: fastest travel time and predecessor of
+every reachable intersection. Any destination is then answered from the
+cache by walking predecessors. When a delay changes, each tree is repaired
+in place (Ramalingam-Reps style): a faster intersection re-runs Dijkstra
+from that intersection outward, a slower one re-settles only the subtree
+that was routed through it.
+"""
+
+import heapq
+import math
+import threading
+
+from intersection_registry import read_road_config
+
+
+DEFAULT_SPEED = 13.9     # m/s (50 km/h) when a road gives no speed
+DELAY_PER_CAR = 0.5      # seconds an emergency vehicle loses per queued car
+DELAY_STEP = 5.0         # delays are rounded to this step so small density changes leave the trees alone
+DELAY_HYSTERESIS = 0.25  # extra share of a step the delay must move before it changes
+SMOOTHING = 0.2          # weight of the newest density report (reports come every ~7 sec)
+MAX_TREES = 32           # origins kept in the cache, least recently used dropped first
+
+
+class Route:
+    __slots__ = ("path", "cost", "arrivals")
+
+    def __init__(self, path, cost, arrivals):
+        self.path = path
+        self.cost = cost
+        # Travel time from the origin to each node of the path
+        self.arrivals = arrivals
+
+
+class ShortestPathTree:
+    def __init__(self, network, origin):
+        """Fastest paths from origin to every reachable intersection"""
+        self.network = network
+        self.origin = origin
+        self.distance = {}
+        self.parent = {}
+        self.children = {}
+        self.resettled = 0
+        self.settle([(0.0, origin, None)])
+
+    def settle(self, heap):
+        """Dijkstra from the (distance, node, parent) candidates on heap; only improvements are kept"""
+        free_flow, delay, distance = self.network.free_flow, self.network.delay, self.distance
+        heapq.heapify(heap)
+        while heap:
+            d, node, parent = heapq.heappop(heap)
+            if d >= distance.get(node, math.inf):
+                continue
+            distance[node] = d
+            self.attach(node, parent)
+            self.resettled += 1
+
+            for neighbour, seconds in free_flow[node].items():
+                candidate = d + seconds + delay[neighbour]
+                if candidate < distance.get(neighbour, math.inf):
+                    heapq.heappush(heap, (candidate, neighbour, node))
+
+    def attach(self, node, parent):
+        old = self.parent.get(node)
+        if old is not None:
+            self.children[old].discard(node)
+        self.parent[node] = parent
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(node)
+
+    def delays_changed(self, changes):
+        """Repair after the edges into each node got change seconds slower (faster when negative)"""
+        distance = self.distance
+
+        # Only subtrees routed through a slower node can get slower; they are
+        # re-settled from the intersections around them that kept their distance
+        stack = [node for node, change in changes.items()
+                 if change > 0 and node != self.origin and node in distance]
+        region = set()
+        while stack:
+            member = stack.pop()
+            if member not in region:
+                region.add(member)
+                del distance[member]
+                stack.extend(self.children.get(member, ()))
+
+        weight = self.network.weight
+        heap = []
+        for member in region:
+            for u in self.network.incoming[member]:
+                if u in distance:
+                    heap.append((distance[u] + weight(u, member), member, u))
+
+        # All edges into a faster node changed alike, so its predecessor stays the best one
+        for node, change in changes.items():
+            if change < 0 and node != self.origin and node in distance:
+                heap.append((distance[node] + change, node, self.parent[node]))
+
+        self.settle(heap)
+
+    def path_to(self, destination):
+        if destination not in self.distance:
+            return None
+        path = [destination]
+        while path[-1] != self.origin:
+            path.append(self.parent[path[-1]])
+        path.reverse()
+        distance = self.distance
+        return Route(path, distance[destination], [distance[node] for node in path])
+
+
+class RoadNetwork:
+    def __init__(self, intersections, roads=(), places=None):
+        """
+        intersections: id -> entry (name, optional x/y in meters)
+        roads: {"from", "to", "length" (m), "speed" (m/s), "oneway"} entries
+        places: place name -> intersection id, for emergency requests
+        """
+        self.nodes = list(intersections)
+        self.names = {entry.get("name", key): key for key, entry in intersections.items()}
+        self.places = dict(places or {})
+
+        self.coords = None
+        if intersections and all("x" in entry and "y" in entry for entry in intersections.values()):
+            self.coords = {key: (float(entry["x"]), float(entry["y"]))
+                           for key, entry in intersections.items()}
+
+        self.free_flow = {key: {} for key in self.nodes}
+        self.incoming = {key: [] for key in self.nodes}
+        for road in roads:
+            self.add_road(road)
+
+        self.delay = dict.fromkeys(self.nodes, 0.0)
+        self.density = {}
+        self.trees = {}
+        self.lock = threading.Lock()
+        self.stats = {"route_cache_hits": 0, "route_cache_misses": 0, "route_trees": 0, "route_resettled": 0}
+
+        # Emergency vehicles leave from the known places; their first request is a cache hit
+        for origin in dict.fromkeys(self.places.values()):
+            if origin in self.free_flow:
+                self.tree(origin)
+
+    @classmethod
+    def from_config(cls, path, intersections):
+        roads, places = read_road_config(path)
+        return cls(intersections, roads, places)
+
+    def add_road(self, road):
+        u, v = road["from"], road["to"]
+        for node in (u, v):
+            if node not in self.free_flow:
+                raise ValueError(f"Road references unknown intersection: {node}")
+
+        length = road.get("length")
+        if length is None:
+            if self.coords is None:
+                raise ValueError(f"Road {u} -> {v} needs a length (no coordinates)")
+            length = self.distance(u, v)
+        seconds = float(length) / float(road.get("speed", DEFAULT_SPEED))
+
+        directions = [(u, v)] if road.get("oneway") else [(u, v), (v, u)]
+        for a, b in directions:
+            self.free_flow[a][b] = seconds
+            self.incoming[b].append(a)
+
+    def distance(self, u, v):
+        (x1, y1), (x2, y2) = self.coords[u], self.coords[v]
+        return math.hypot(x2 - x1, y2 - y1)
+
+    def weight(self, u, v):
+        return self.free_flow[u][v] + self.delay[v]
+
+    def free_flow_arrivals(self, path):
+        """Seconds from path[0] to each node of path at the speed limits, ignoring queues"""
+        arrivals = [0.0]
+        for u, v in zip(path, path[1:]):
+            arrivals.append(arrivals[-1] + self.free_flow[u][v])
+        return arrivals
+
+    def resolve(self, place):
+        """Intersection id for an id, a place name, a signal name or text naming a signal"""
+        if not place:
+            return None
+        if place in self.free_flow:
+            return place
+        if place in self.places:
+            return self.places[place]
+        if place in self.names:
+            return self.names[place]
+
+        # e.g. "Accident site - SIGNAL 2"; the longest name wins over "SIGNAL 1" in "SIGNAL 12"
+        matches = [name for name in self.names if name in place]
+        return self.names[max(matches, key=len)] if matches else None
+
+    def route(self, origin, destination):
+        """Fastest Route between two intersections from the origin's cached tree, or None if unreachable"""
+        with self.lock:
+            tree = self.trees.pop(origin, None)
+            if tree is None:
+                self.stats["route_cache_misses"] += 1
+                tree = self.tree(origin)
+            else:
+                self.stats["route_cache_hits"] += 1
+                self.trees[origin] = tree
+            return tree.path_to(destination)
+
+    def tree(self, origin):
+        tree = ShortestPathTree(self, origin)
+        self.trees[origin] = tree
+        while len(self.trees) > MAX_TREES:
+            self.trees.pop(next(iter(self.trees)))
+        self.stats["route_trees"] = len(self.trees)
+        return tree
+
+    def update_densities(self, densities):
+        """Apply live densities (id -> cars); only delay steps that change touch the trees"""
+        changes = {}
+        with self.lock:
+            for node, density in densities.items():
+                if node not in self.delay:
+                    continue
+                smoothed = self.density.get(node, density)
+                smoothed += SMOOTHING * (density - smoothed)
+                self.density[node] = smoothed
+
+                delay = smoothed * DELAY_PER_CAR
+                if abs(delay - self.delay[node]) > DELAY_STEP * (0.5 + DELAY_HYSTERESIS):
+                    delay = round(delay / DELAY_STEP) * DELAY_STEP
+                    changes[node] = delay - self.delay[node]
+                    self.delay[node] = delay
+
+            # One repair per tree for the whole batch
+            if changes:
+                for tree in self.trees.values():
+                    before = tree.resettled
+                    tree.delays_changed(changes)
+                    self.stats["route_resettled"] += tree.resettled - before
\ No newline at end of file
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded Controller - intersections partitioned across worker processes
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from intersection_registry import load_intersections
+from traffic_logging import get_logger, setup_logging
+from traffic_server_with_ai import SmartTrafficSystemWithAI
+
+
+ACK_TOPIC = "traffic/shards/emergency_ack"
+ACK_TIMEOUT = 0.5          # seconds the coordinator waits for shard acks
+RESTART_BACKOFF = (1, 30)  # first and maximum delay before restarting a shard
+
+logger = get_logger("shards")
+
+
+def partition(intersection_ids, n_shards):
+    """Split ids into n contiguous, balanced shards (config order is kept)"""
+    n_shards = max(1, min(n_shards, len(intersection_ids)))
+    size, extra = divmod(len(intersection_ids), n_shards)
+
+    shards = []
+    start = 0
+    for i in range(n_shards):
+        stop = start + size + (1 if i < extra else 0)
+        shards.append(intersection_ids[start:stop])
+        start = stop
+    return shards
+
+
+class ShardController(SmartTrafficSystemWithAI):
+    def __init__(self, shard_index, partitions, **kwargs):
+        """
+        One shard of the network. Every shard hears every emergency request
+        and preempts only the intersections it owns; shard 0 coordinates,
+        collecting acks from the other shards before answering the vehicle.
+        """
+        self.shard_index = shard_index
+        self.shard_of = {
+            signal_id: i for i, ids in enumerate(partitions) for signal_id in ids
+        }
+        self.coordinator = shard_index == 0
+        self.pending_emergencies = {}
+
+        # A shard only hears its own signals' densities, so every shard routes
+        # on free-flow travel times to agree on the same emergency path
+        super().__init__(
+            intersection_ids=set(partitions[shard_index]),
+            client_id=f"TrafficMasterAI-shard{shard_index}",
+            live_routing=False,
+            **kwargs
+        )
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        super().on_connect(client, userdata, flags, rc, properties)
+        if self.coordinator:
+            client.subscribe(ACK_TOPIC)
+
+    def on_message(self, client, userdata, msg):
+        if msg.topic == ACK_TOPIC:
+            # Pending emergencies are only touched on the scheduler thread
+            self.scheduler.call_later(0, self.handle_ack, json.loads(msg.payload.decode()))
+        else:
+            super().on_message(client, userdata, msg)
+
+    def activate_emergency_route(self, emergency_data, wire_format="json"):
+        wave = self.plan_emergency_route(emergency_data)
+        request_key = f"{emergency_data.get('vehicle_id')}@{emergency_data.get('timestamp')}"
+
+        if self.coordinator:
+            owners = {self.shard_of[signal_id] for signal_id in wave.path}
+            self.pending_emergencies[request_key] = {
+                "wave": wave,
+                "wire_format": wire_format,
+                "waiting": owners - {self.shard_index},
+                "timer": self.scheduler.call_later(ACK_TIMEOUT, self.finish_emergency, request_key)
+            }
+
+        preempted = self.preempt_route(wave, emergency_data)
+
+        if self.coordinator:
+            self.handle_ack({"request": request_key, "shard": self.shard_index})
+        elif preempted:
+            ack = {"request": request_key, "shard": self.shard_index, "preempted": preempted}
+            self.client.publish(ACK_TOPIC, json.dumps(ack))
+
+    def handle_ack(self, ack):
+        pending = self.pending_emergencies.get(ack["request"])
+        if pending is None:
+            return
+
+        pending["waiting"].discard(ack["shard"])
+        if not pending["waiting"]:
+            pending["timer"].cancel()
+            self.finish_emergency(ack["request"])
+
+    def finish_emergency(self, request_key):
+        pending = self.pending_emergencies.pop(request_key, None)
+        if pending is None:
+            return
+
+        if pending["waiting"]:
+            logger.warning("No ack from shards %s - route not all clear", sorted(pending["waiting"]))
+        self.publish_emergency_response(
+            pending["wave"], all_clear=not pending["waiting"], wire_format=pending["wire_format"]
+        )
+
+
+def run_shard(shard_index, partitions, model_path, fast_boot, config_path):
+    # Spawned workers start with a fresh logging setup (configured from the environment)
+    setup_logging()
+    controller = ShardController(
+        shard_index, partitions,
+        model_path=model_path, fast_boot=fast_boot, config_path=config_path
+    )
+    controller.start()
+
+
+class ShardSupervisor:
+    def __init__(self, n_shards, model_path="traffic_ai_model.pkl", fast_boot=False,
+                 config_path="intersections.json"):
+        """Start shard workers, restart them when they die, rebalance on config change"""
+        self.n_shards = n_shards
+        self.model_path = model_path
+        self.fast_boot = fast_boot
+        self.config_path = config_path
+
+        self.context = multiprocessing.get_context("spawn")
+        self.partitions = []
+        self.workers = []
+        self.config_mtime = None
+
+    def spawn(self, shard_index):
+        worker = self.context.Process(
+            target=run_shard,
+            args=(shard_index, self.partitions, self.model_path, self.fast_boot, self.config_path),
+            name=f"shard{shard_index}",
+            daemon=True
+        )
+        worker.start()
+        logger.info("Shard %d started (PID %d) - %d intersections",
+                    shard_index, worker.pid, len(self.partitions[shard_index]))
+        return {"process": worker, "restarts": 0, "restart_at": None}
+
+    def start(self):
+        """(Re)partition the network and start one worker per shard"""
+        self.config_mtime = os.stat(self.config_path).st_mtime
+        intersection_ids = list(load_intersections(self.config_path))
+        self.partitions = partition(intersection_ids, self.n_shards)
+        self.workers = [self.spawn(i) for i in range(len(self.partitions))]
+
+    def stop(self):
+        for worker in self.workers:
+            worker["process"].terminate()
+        for worker in self.workers:
+            worker["process"].join()
+        self.workers = []
+
+    def rebalance(self, n_shards=None):
+        """Repartition across n_shards workers (default: same count)"""
+        if n_shards is not None:
+            self.n_shards = n_shards
+        logger.info("Rebalancing across %d shards", self.n_shards)
+        self.stop()
+        self.start()
+
+    def check_workers(self):
+        """Restart dead workers with exponential backoff"""
+        now = time.monotonic()
+
+        for i, worker in enumerate(self.workers):
+            process = worker["process"]
+            if process.is_alive():
+                continue
+
+            if worker["restart_at"] is None:
+                delay = min(RESTART_BACKOFF[0] * 2 ** worker["restarts"], RESTART_BACKOFF[1])
+                worker["restart_at"] = now + delay
+                logger.error("Shard %d exited with code %s - restarting in %s sec",
+                             i, process.exitcode, delay)
+            elif now >= worker["restart_at"]:
+                restarts = worker["restarts"] + 1
+                self.workers[i] = self.spawn(i)
+                self.workers[i]["restarts"] = restarts
+
+    def run(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+                if os.stat(self.config_path).st_mtime != self.config_mtime:
+                    self.rebalance()
+                else:
+                    self.check_workers()
+        except KeyboardInterrupt:
+            logger.info("Stopping all shards")
+            self.stop()
+
+
+if __name__ == "__main__":
+    # python sharded_controller.py [n_shards] [--fast-boot]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    n_shards = int(args[0]) if args else os.cpu_count()
+    setup_logging()
+
+    supervisor = ShardSupervisor(n_shards, fast_boot="--fast-boot" in sys.argv)
+    supervisor.run()
\ No newline at end of file
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Signal Fleet - thousands of virtual traffic signals in one process
+
+Each virtual signal follows the same density random walk and command
+handling as AdvancedTrafficSignal, but without its own thread or MQTT
+client: one scheduler thread publishes for the whole fleet and a few
+shared clients carry the traffic. Command latency (controller timestamp
+to arrival) is recorded per signal, and the latest LATENCY_WINDOW
+commands of the fleet are kept for its percentiles.
+"""
+
+import heapq
+import json
+from collections import deque
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+from traffic_logging import fields, get_logger, setup_logging
+from traffic_signal_v2 import DENSITY_PERIOD, next_density
+from transport import create_transport
+from wire_format import decode, encode
+
+
+LATENCY_WINDOW = 100_000    # latest command latencies kept for the fleet percentiles
+
+logger = get_logger("fleet")
+
+
+class VirtualSignal:
+    __slots__ = ("signal_id", "signal_name", "topic", "client_index", "status", "density",
+                 "green_time", "yellow_time", "pending_discharge", "cars_passed", "discharge_time", "total_waiting",
+                 "commands", "latency_sum", "latency_max")
+
+    def __init__(self, signal_id, signal_name, density, client_index):
+        self.signal_id = signal_id
+        self.signal_name = signal_name
+        self.topic = f"traffic/{signal_id}"
+        self.client_index = client_index
+
+        self.status = "red"
+        self.density = density
+        self.green_time = 30
+        self.yellow_time = 5
+        self.pending_discharge = 0
+        self.cars_passed = None
+        self.discharge_time = None
+        self.total_waiting = 0
+
+        self.commands = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def handle_command(self, data):
+        """Apply a command; returns True if the signal should report its status"""
+        command = data.get("command")
+
+        if command == "green" and self.status != "green":
+            self.status = "green"
+            self.green_time = data.get("duration", 30)
+            # Same discharge as simulate_cars_passing, applied when green ends
+            cars_per_second = max(1, self.density // 10)
+            self.pending_discharge = min(self.density, cars_per_second * max(0, int(self.green_time) - 2))
+            if self.pending_discharge < self.density:
+                self.discharge_time = self.green_time
+            else:
+                self.discharge_time = -(-self.density // cars_per_second) + 2
+            return False
+
+        if command in ("yellow", "red") and self.status != command:
+            if self.status == "green":
+                self.cars_passed = min(self.density, self.pending_discharge)
+                self.density = max(0, self.density - self.pending_discharge)
+                self.pending_discharge = 0
+            self.status = command
+            return True
+
+        if command == "stop":
+            self.total_waiting += data.get("duration", 30)
+        elif command == "emergency_green":
+            self.status = "green"
+            return True
+
+        return False
+
+    def record_latency(self, latency):
+        self.commands += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+
+class SignalFleet:
+    def __init__(self, n_signals, period=DENSITY_PERIOD, n_clients=1, wire_format="json",
+                 seed=None, transports=None):
+        """transports, if given, are the shared connections (one per client)"""
+        self.period = period
+        self.wire_format = wire_format
+        self.rng = random.Random(seed)
+
+        if transports:
+            n_clients = len(transports)
+        self.signals = [
+            VirtualSignal(f"intersection{i}", f"SIGNAL {i}", self.rng.randint(2, 35), i % n_clients)
+            for i in range(1, n_signals + 1)
+        ]
+        self.by_control_topic = {f"{signal.topic}/control": signal for signal in self.signals}
+
+        self.clients = transports or [create_transport(f"SignalFleet-{i}") for i in range(n_clients)]
+        for i, client in enumerate(self.clients):
+            client.user_data_set(i)
+            client.on_connect = self.on_connect
+            client.on_message = self.on_message
+
+        # Commands arrive on client threads, density steps run on the fleet thread
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.running = False
+
+    def write_config(self, path, seed=None):
+        """Write an intersections config matching the fleet, for the controller"""
+        rng = random.Random(seed)
+        intersections = [
+            {"id": signal.signal_id, "name": signal.signal_name, "lanes": rng.randint(1, 3)}
+            for signal in self.signals
+        ]
+        with open(path, "w") as f:
+            json.dump({"intersections": intersections}, f, indent=2)
+        logger.info("Fleet config written to %s", path)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        _ = flags, properties
+        if rc != 0:
+            logger.error("Fleet client %s: connection failed", userdata, extra=fields(code=rc))
+            return
+
+        topics = [(f"{signal.topic}/control", 0) for signal in self.signals
+                  if signal.client_index == userdata]
+        client.subscribe(topics)
+        logger.info("Fleet client %s: subscribed for %d signals", userdata, len(topics))
+
+    def on_message(self, client, userdata, msg):
+        _ = client, userdata
+        received = time.time()
+        signal = self.by_control_topic.get(msg.topic)
+        if signal is None:
+            return
+
+        try:
+            data = decode(msg.payload)
+        except Exception:
+            logger.exception("%s: error in command", signal.signal_name)
+            return
+
+        with self.lock:
+            if "timestamp" in data:
+                latency = received - data["timestamp"]
+                signal.record_latency(latency)
+                self.latencies.append(latency)
+            report_status = signal.handle_command(data)
+
+        if report_status:
+            self.send_status_update(signal)
+
+    def send_density_update(self, signal):
+        data = {
+            "value": signal.density,
+            "signal": signal.signal_id,
+            "name": signal.signal_name,
+            "status": signal.status,
+            "timestamp": time.time()
+        }
+        self.clients[signal.client_index].publish(
+            f"{signal.topic}/density", encode("density", data, self.wire_format)
+        )
+
+    def send_status_update(self, signal):
+        data = {
+            "status": signal.status,
+            "signal": signal.signal_id,
+            "name": signal.signal_name,
+            "density": signal.density,
+            "green_time": signal.green_time,
+            "yellow_time": signal.yellow_time,
+            "timestamp": time.time()
+        }
+        if signal.cars_passed is not None:
+            data["cars_passed"] = signal.cars_passed
+            data["discharge_time"] = signal.discharge_time
+            signal.cars_passed = None
+        self.clients[signal.client_index].publish(
+            f"{signal.topic}/status", encode("status", data, self.wire_format)
+        )
+
+    def run(self, duration=None):
+        """Publish density for every signal every period seconds"""
+        for client in self.clients:
+            client.connect()
+            client.loop_start()
+
+        # Spread first reports over one period so the fleet does not publish in lockstep
+        start = time.monotonic()
+        due = [(start + self.rng.uniform(0, self.period), i) for i in range(len(self.signals))]
+        heapq.heapify(due)
+
+        self.running = True
+        try:
+            while self.running and (duration is None or time.monotonic() - start < duration):
+                when, i = due[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    time.sleep(min(delay, 0.05))
+                    continue
+
+                signal = self.signals[i]
+                with self.lock:
+                    signal.density = next_density(signal.density, self.rng)
+                self.send_density_update(signal)
+                heapq.heapreplace(due, (when + self.period, i))
+        finally:
+            for client in self.clients:
+                client.loop_stop()
+                client.disconnect()
+
+    def report(self):
+        """Command latency summary for the whole fleet : percentiles over the latest commands, and the slowest signals"""
+        with self.lock:
+            latencies = np.array(self.latencies)
+            commands = sum(signal.commands for signal in self.signals)
+            slowest = sorted(self.signals, key=lambda signal: signal.latency_max, reverse=True)[:5]
+
+        print("\n" + "=" * 60)
+        print(f"FLEET REPORT - {len(self.signals)} SIGNALS")
+        print("=" * 60)
+        if not len(latencies):
+            print("   No commands received")
+            return {}
+
+        summary = {
+            "commands": commands,
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p99": float(np.percentile(latencies, 99)),
+            "latency_max": slowest[0].latency_max
+        }
+        print(f"   Commands: {summary['commands']}")
+        print(f"   Latency p50: {summary['latency_p50'] * 1000:.1f} ms | "
+              f"p99: {summary['latency_p99'] * 1000:.1f} ms | "
+              f"max: {summary['latency_max'] * 1000:.1f} ms")
+        for signal in slowest:
+            if signal.commands:
+                print(f"   {signal.signal_name}: {signal.commands} commands | "
+                      f"mean {signal.latency_sum / signal.commands * 1000:.1f} ms | "
+                      f"max {signal.latency_max * 1000:.1f} ms")
+        return summary
+
+
+if __name__ == "__main__":
+    # python signal_fleet.py [n_signals] [--period=7] [--clients=1] [--duration=SEC]
+    #                        [--config=fleet_intersections.json] [--binary]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    setup_logging()
+
+    fleet = SignalFleet(
+        int(args[0]) if args else 1000,
+        period=float(options.get("period", DENSITY_PERIOD)),
+        n_clients=int(options.get("clients", 1)),
+        wire_format="binary" if "--binary" in sys.argv else "json"
+    )
+    fleet.write_config(options.get("config", "fleet_intersections.json"))
+
+    logger.info("Starting fleet of %d signals", len(fleet.signals))
+    try:
+        fleet.run(float(options["duration"]) if "duration" in options else None)
+    except KeyboardInterrupt:
+        logger.info("Stopping fleet")
+    fleet.report()
\ No newline at end of file
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Simulation - discrete-event runs of the whole system on a virtual clock
+
+The controller, the signals and the emergency vehicles share one
+VirtualScheduler and one synchronous in-process broker, so a simulated
+day runs in seconds and the same seed always gives the same result.
+"""
+
+import heapq
+import itertools
+import random
+import sys
+import time
+
+from emergency_app import EmergencyApp
+from intersection_registry import load_intersections
+from retraining import Retrainer
+from signal_fleet import VirtualSignal
+from traffic_logging import setup_logging
+from traffic_server_with_ai import SmartTrafficSystemWithAI
+from traffic_signal_v2 import DENSITY_PERIOD, next_density
+from transport import InProcessBroker, InProcessTransport
+from wire_format import decode, encode
+
+
+class VirtualTimer:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualScheduler:
+    def __init__(self, start=0.0):
+        """Event queue with the PhaseScheduler interface on a simulated clock"""
+        self.time = start
+        self.queue = []
+        self.sequence = itertools.count()
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def now(self):
+        return self.time
+
+    def call_at(self, when, callback, *args):
+        timer = VirtualTimer(max(when, self.time), callback, args)
+        # The sequence number keeps same-time events in scheduling order
+        heapq.heappush(self.queue, (timer.when, next(self.sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.time + delay, callback, *args)
+
+    def run_until(self, end):
+        """Run every event due up to simulated time end"""
+        while self.queue and self.queue[0][0] <= end:
+            when, _, timer = heapq.heappop(self.queue)
+            if timer.cancelled:
+                continue
+            self.time = when
+            timer.callback(*timer.args)
+        self.time = end
+
+
+class SimulatedSignals:
+    def __init__(self, intersections, scheduler, transport, rng, period=DENSITY_PERIOD):
+        """Signals of the network as VirtualSignals driven by simulated time"""
+        self.scheduler = scheduler
+        self.client = transport
+        self.rng = rng
+        self.period = period
+
+        self.signals = {
+            key: VirtualSignal(intersection["id"], intersection["name"], rng.randint(2, 35), 0)
+            for key, intersection in intersections.items()
+        }
+        self.by_control_topic = {f"{signal.topic}/control": signal for signal in self.signals.values()}
+        self.stats = {
+            key: {"queue_sum": 0, "queue_samples": 0, "discharged": 0,
+                  "red_since": 0.0, "wait_sum": 0.0, "greens": 0}
+            for key in self.signals
+        }
+
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def start(self):
+        self.client.connect()
+        for key, signal in self.signals.items():
+            self.scheduler.call_later(self.rng.uniform(0, self.period), self.density_step, key)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        _ = userdata, flags, rc, properties
+        client.subscribe([(topic, 0) for topic in self.by_control_topic])
+
+    def on_message(self, client, userdata, msg):
+        _ = client, userdata
+        signal = self.by_control_topic[msg.topic]
+        stats = self.stats[signal.signal_id]
+        was_green = signal.status == "green"
+        density_before = signal.density
+
+        signal.handle_command(decode(msg.payload))
+
+        if was_green and signal.status != "green":
+            stats["discharged"] += density_before - signal.density
+            stats["red_since"] = self.scheduler.now()
+            # Reported like a real signal does, for the controller's telemetry
+            data = {"status": signal.status, "cars_passed": signal.cars_passed,
+                    "discharge_time": signal.discharge_time, "timestamp": self.scheduler.now()}
+            signal.cars_passed = None
+            self.client.publish(f"{signal.topic}/status", encode("status", data))
+        elif not was_green and signal.status == "green":
+            stats["wait_sum"] += self.scheduler.now() - stats["red_since"]
+            stats["greens"] += 1
+
+    def density_step(self, key):
+        signal = self.signals[key]
+        stats = self.stats[key]
+
+        signal.density = next_density(signal.density, self.rng)
+        stats["queue_sum"] += signal.density
+        stats["queue_samples"] += 1
+
+        data = {"value": signal.density, "status": signal.status, "timestamp": self.scheduler.now()}
+        self.client.publish(f"{signal.topic}/density", encode("density", data))
+        self.scheduler.call_later(self.period, self.density_step, key)
+
+    def metrics(self, duration):
+        """Mean queue, mean wait for green and throughput per intersection"""
+        metrics = {}
+        for key, stats in self.stats.items():
+            metrics[key] = {
+                "mean_queue": stats["queue_sum"] / max(1, stats["queue_samples"]),
+                "mean_wait": stats["wait_sum"] / max(1, stats["greens"]),
+                "throughput_per_hour": stats["discharged"] / duration * 3600,
+                "greens": stats["greens"]
+            }
+        return metrics
+
+
+def run_simulation(hours=24, seed=0, config_path="intersections.json",
+                   model_path="traffic_ai_model.pkl", emergencies_per_hour=0.5, coordinated=False,
+                   forecasting=False, retrain_dir=None):
+    """Run the full system for hours of simulated time and return its metrics"""
+    rng = random.Random(seed)
+    scheduler = VirtualScheduler()
+    broker = InProcessBroker(synchronous=True)
+    duration = hours * 3600
+
+    controller = SmartTrafficSystemWithAI(
+        model_path, fast_boot=True, config_path=config_path,
+        transport=InProcessTransport("TrafficMasterAI", broker), scheduler=scheduler,
+        coordinated=coordinated, forecasting=forecasting,
+        retrainer=Retrainer(retrain_dir, inline=True) if retrain_dir else None
+    )
+    controller.client.connect()
+
+    signals = SimulatedSignals(
+        load_intersections(config_path), scheduler,
+        InProcessTransport("SimulatedSignals", broker), rng
+    )
+    signals.start()
+
+    app = EmergencyApp(transport=InProcessTransport("EmergencyApp", broker), scheduler=scheduler)
+    app.client.connect()
+
+    def emergency():
+        app.send_emergency_request(rng.choice(["Ambulance", "Fire", "Police"]))
+        scheduler.call_later(rng.expovariate(emergencies_per_hour / 3600), emergency)
+
+    if emergencies_per_hour > 0:
+        scheduler.call_later(rng.expovariate(emergencies_per_hour / 3600), emergency)
+
+    scheduler.run_until(duration)
+
+    return signals.metrics(duration)
+
+
+def print_metrics(metrics, hours, elapsed):
+    print("\n" + "=" * 60)
+    print(f"SIMULATION RESULTS - {hours} HOURS SIMULATED IN {elapsed:.1f} SEC")
+    print("=" * 60)
+    for key, m in metrics.items():
+        print(f"   {key}: mean queue {m['mean_queue']:.1f} cars | "
+              f"mean wait {m['mean_wait']:.1f} sec | "
+              f"throughput {m['throughput_per_hour']:.0f} cars/h | {m['greens']} greens")
+
+    network = network_metrics(metrics)
+    print(f"   NETWORK: mean queue {network['mean_queue']:.1f} cars | "
+          f"mean wait {network['mean_wait']:.1f} sec | "
+          f"throughput {network['throughput_per_hour']:.0f} cars/h")
+
+
+def network_metrics(metrics):
+    """Network means and totals; vehicle delay is the mean time a car spends queued (Little's law)"""
+    n = len(metrics)
+    queued = sum(m["mean_queue"] for m in metrics.values())
+    throughput = sum(m["throughput_per_hour"] for m in metrics.values())
+    return {
+        "mean_queue": queued / n,
+        "mean_wait": sum(m["mean_wait"] for m in metrics.values()) / n,
+        "vehicle_delay": queued / throughput * 3600 if throughput else float("inf"),
+        "throughput_per_hour": throughput
+    }
+
+
+def evaluate_forecasting(hours=24, seeds=(0, 1, 2), **options):
+    """Same simulations with green times for the last reading and for the forecast queue"""
+    print("\n" + "=" * 60)
+    print(f"FORECAST EVALUATION - {len(seeds)} x {hours} HOURS")
+    print("=" * 60)
+
+    results = {False: [], True: []}
+    for seed in seeds:
+        for forecasting in (False, True):
+            network = network_metrics(run_simulation(hours, seed=seed, forecasting=forecasting, **options))
+            results[forecasting].append(network)
+            print(f"   seed {seed} {'forecast' if forecasting else 'last reading':>12}: "
+                  f"mean wait {network['mean_wait']:.1f} sec | vehicle delay {network['vehicle_delay']:.1f} sec | "
+                  f"mean queue {network['mean_queue']:.1f} cars | throughput {network['throughput_per_hour']:.0f} cars/h")
+
+    for name in ("mean_wait", "vehicle_delay", "throughput_per_hour"):
+        before = sum(r[name] for r in results[False]) / len(seeds)
+        after = sum(r[name] for r in results[True]) / len(seeds)
+        print(f"   {name}: {before:.1f} -> {after:.1f} ({(after - before) / before * 100:+.1f}%)")
+    return results
+
+
+if __name__ == "__main__":
+    # python simulation.py [hours] [--seed=0] [--config=intersections.json]
+    #                      [--model=traffic_ai_model.pkl] [--emergencies=0.5] [--log-level=ERROR]
+    #                      [--coordinated] [--forecast] [--evaluate-forecast]
+    #                      [--retrain-dir=models]  (online retraining, one attempt per simulated hour)
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    hours = float(args[0]) if args else 24
+    setup_logging(options.get("log-level", "ERROR"))
+
+    if "--evaluate-forecast" in sys.argv:
+        evaluate_forecasting(
+            hours,
+            config_path=options.get("config", "intersections.json"),
+            model_path=options.get("model", "traffic_ai_model.pkl"),
+            emergencies_per_hour=float(options.get("emergencies", 0.5)),
+            coordinated="--coordinated" in sys.argv
+        )
+        sys.exit()
+
+    start = time.perf_counter()
+    metrics = run_simulation(
+        hours,
+        seed=int(options.get("seed", 0)),
+        config_path=options.get("config", "intersections.json"),
+        model_path=options.get("model", "traffic_ai_model.pkl"),
+        emergencies_per_hour=float(options.get("emergencies", 0.5)),
+        coordinated="--coordinated" in sys.argv,
+        forecasting="--forecast" in sys.argv,
+        retrain_dir=options.get("retrain-dir")
+    )
+    print_metrics(metrics, hours, time.perf_counter() - start)
\ No newline at end of file
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Telemetry - fixed-memory time series of every intersection
+
+Each series (density readings, status changes, green durations, cars
+passed) keeps its raw samples in a NumPy ring buffer with one fixed-size
+block per intersection, and is downsampled as samples arrive into a
+minute and an hour tier (count, sum and max per intersection and period).
+A tier is a ring of columns, one per period and shared by all
+intersections, so entering a new minute clears one column. Everything is
+allocated up front: memory does not grow with uptime.
+
+flush() appends whatever was recorded since the previous flush to files in
+a directory - raw samples as (row, time, value) records and each completed
+tier period as one record for all intersections. Files are never
+rewritten; read_raw() and read_tier() load them back.
+
+Records hold rows, not intersection ids, so ids.json stores the row order
+with its CRC. A store flushing into a directory written for another
+intersection set moves the old files into a subdirectory named after
+their CRC and starts new ones.
+
+Times passed in are the caller's clock (the scheduler's); they are stored
+as wall-clock seconds, clock + origin.
+"""
+
+import json
+import os
+import zlib
+
+import numpy as np
+
+from traffic_logging import fields, get_logger
+
+
+SERIES = ("density", "status", "green", "cars")
+
+# Raw samples kept per intersection (density: half an hour at one report every 7 s)
+RAW_CAPACITY = {"density": 256, "status": 64, "green": 32, "cars": 32}
+
+# Downsampling tiers: (name, seconds per period, periods kept)
+TIERS = (("minute", 60, 90), ("hour", 3600, 48))
+
+# Status series values; a green lasts until the signal leaves both green states
+STATUS_CODES = {"green": 0, "yellow": 1, "red": 2, "emergency_green": 3}
+GREEN_CODES = (0, 3)
+
+logger = get_logger("telemetry")
+
+RAW_DTYPE = np.dtype([("row", "<u4"), ("time", "<f8"), ("value", "<f4")])
+
+
+def ids_crc(ids):
+    """CRC of an intersection list in row order"""
+    return zlib.crc32("\n".join(ids).encode())
+
+
+def tier_dtype(n):
+    """On-disk record of one tier period: its index (time // seconds) and n intersections"""
+    return np.dtype([("period", "<i8"), ("count", "<u2", (n,)), ("sum", "<f4", (n,)), ("max", "<f4", (n,))])
+
+
+def read_raw(path):
+    return np.fromfile(path, dtype=RAW_DTYPE)
+
+
+def read_tier(path, n):
+    return np.fromfile(path, dtype=tier_dtype(n))
+
+
+class RawRing:
+    def __init__(self, n, capacity):
+        """Last capacity samples of each of n rows"""
+        self.capacity = capacity
+        self.times = np.full((n, capacity), np.nan)
+        self.values = np.zeros((n, capacity), dtype=np.float32)
+        # Samples ever written per row, and how many of them were flushed
+        self.head = np.zeros(n, dtype=np.int64)
+        self.flushed = np.zeros(n, dtype=np.int64)
+
+    def append(self, rows, time, values):
+        """One sample for each of rows (no row twice in one call)"""
+        slots = self.head[rows] % self.capacity
+        self.times[rows, slots] = time
+        self.values[rows, slots] = values
+        self.head[rows] += 1
+
+    def since(self, row, start):
+        """(times, values) of one row from start on, oldest first"""
+        count = min(int(self.head[row]), self.capacity)
+        slots = (np.arange(self.head[row] - count, self.head[row])) % self.capacity
+        times = self.times[row, slots]
+        keep = times >= start
+        return times[keep], self.values[row, slots][keep]
+
+    def drain(self):
+        """Records written since the last drain, and how many were overwritten before it"""
+        pending = self.head - self.flushed
+        counts = np.minimum(pending, self.capacity)
+        dropped = int((pending - counts).sum())
+        total = int(counts.sum())
+
+        rows = np.repeat(np.arange(len(counts)), counts)
+        first = np.repeat(self.head - counts, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        slots = (first + offsets) % self.capacity
+
+        records = np.empty(total, dtype=RAW_DTYPE)
+        records["row"] = rows
+        records["time"] = self.times[rows, slots]
+        records["value"] = self.values[rows, slots]
+        self.flushed[:] = self.head
+        return records, dropped
+
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes + self.head.nbytes + self.flushed.nbytes
+
+
+class Tier:
+    def __init__(self, n, seconds, capacity):
+        """Count, sum and max of n rows per period of seconds, for the last capacity periods"""
+        self.seconds = seconds
+        self.capacity = capacity
+        self.period = np.full(capacity, -1, dtype=np.int64)
+        self.count = np.zeros((n, capacity), dtype=np.uint16)
+        self.sum = np.zeros((n, capacity), dtype=np.float32)
+        self.max = np.full((n, capacity), -np.inf, dtype=np.float32)
+        self.current = -1
+        self.flushed = -1
+
+    def roll(self, time):
+        """Clear the columns of the periods started since the last sample"""
+        period = int(time // self.seconds)
+        if period <= self.current:
+            return
+        first = period if self.current < 0 else max(self.current + 1, period - self.capacity + 1)
+        for p in range(first, period + 1):
+            slot = p % self.capacity
+            self.count[:, slot] = 0
+            self.sum[:, slot] = 0.0
+            self.max[:, slot] = -np.inf
+            self.period[slot] = p
+        self.current = period
+
+    def add(self, rows, time, values):
+        self.roll(time)
+        period = int(time // self.seconds)
+        slot = period % self.capacity
+        if self.period[slot] != period:
+            # Older than the tier keeps
+            return
+        np.add.at(self.count, (rows, slot), 1)
+        np.add.at(self.sum, (rows, slot), values)
+        np.maximum.at(self.max, (rows, slot), values)
+
+    def window(self, start, end):
+        """(periods, count, sum, max) of the periods from start to end; periods not kept count 0"""
+        periods = np.arange(int(start // self.seconds), int(end // self.seconds) + 1)
+        slots = periods % self.capacity
+        valid = self.period[slots] == periods
+
+        count = self.count[:, slots]
+        count[:, ~valid] = 0
+        total = self.sum[:, slots]
+        total[:, ~valid] = 0.0
+        peak = self.max[:, slots]
+        peak[:, ~valid] = -np.inf
+        return periods, count, total, peak
+
+    def drain(self, n):
+        """Records of the completed periods not flushed yet"""
+        periods = [p for p in range(max(self.flushed + 1, self.current - self.capacity + 1), self.current)
+                   if self.period[p % self.capacity] == p]
+        records = np.empty(len(periods), dtype=tier_dtype(n))
+        for record, p in zip(records, periods):
+            slot = p % self.capacity
+            record["period"] = p
+            record["count"] = self.count[:, slot]
+            record["sum"] = self.sum[:, slot]
+            record["max"] = self.max[:, slot]
+        if self.current > 0:
+            self.flushed = self.current - 1
+        return records
+
+    def nbytes(self):
+        return self.period.nbytes + self.count.nbytes + self.sum.nbytes + self.max.nbytes
+
+
+class TelemetryStore:
+    def __init__(self, ids, origin=0.0, raw_capacity=None, tiers=TIERS):
+        """
+        ids: intersections in row order; origin: wall-clock time at clock 0
+        raw_capacity: series -> raw samples per intersection (RAW_CAPACITY)
+        """
+        self.ids = list(ids)
+        self.index = {key: i for i, key in enumerate(self.ids)}
+        self.ids_crc = ids_crc(self.ids)
+        self.origin = origin
+        n = len(self.ids)
+
+        capacity = dict(RAW_CAPACITY, **(raw_capacity or {}))
+        self.raw = {series: RawRing(n, capacity[series]) for series in SERIES}
+        self.tiers = {
+            series: {name: Tier(n, seconds, periods) for name, seconds, periods in tiers}
+            for series in SERIES
+        }
+
+        # Current status code and start of the running green of every row
+        self.state = np.full(n, -1, dtype=np.int8)
+        self.green_since = np.full(n, np.nan)
+        self.dropped = 0
+        # Directory whose ids.json was checked against self.ids
+        self.checked_directory = None
+
+    def rows(self, keys):
+        return np.fromiter((self.index[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def record(self, series, rows, values, now):
+        """One sample of series at clock time now for each of rows"""
+        time = now + self.origin
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        self.raw[series].append(rows, time, values)
+        for tier in self.tiers[series].values():
+            tier.add(rows, time, values)
+
+    def record_status(self, key, status, now):
+        """A signal's status change; the green it ends is recorded as a green duration"""
+        code = STATUS_CODES.get(status)
+        row = self.index.get(key)
+        if code is None or row is None or self.state[row] == code:
+            return
+
+        was_green = self.state[row] in GREEN_CODES
+        self.state[row] = code
+        self.record("status", [row], [code], now)
+
+        if code in GREEN_CODES:
+            if not was_green:
+                self.green_since[row] = now
+        elif was_green:
+            self.record("green", [row], [now - self.green_since[row]], now)
+
+    def query(self, series, now, seconds=3600, tier="minute"):
+        """
+        Per-period aggregates of every intersection over the last seconds:
+        start times of the periods and (n, periods) arrays of count, sum,
+        max and mean (NaN where a period has no samples)
+        """
+        time = now + self.origin
+        level = self.tiers[series][tier]
+        periods, count, total, peak = level.window(time - seconds + level.seconds, time)
+        empty = count == 0
+        mean = np.divide(total, count, out=np.full(total.shape, np.nan, dtype=np.float32), where=~empty)
+        peak[empty] = np.nan
+        return {
+            "start": periods * level.seconds - self.origin,
+            "count": count,
+            "sum": total,
+            "max": peak,
+            "mean": mean
+        }
+
+    def recent(self, series, key, now, seconds=3600):
+        """Raw (times, values) of one intersection over the last seconds, in clock time"""
+        times, values = self.raw[series].since(self.index[key], now + self.origin - seconds)
+        return times - self.origin, values
+
+    def flush(self, directory):
+        """Append everything recorded since the last flush; returns bytes written"""
+        if directory != self.checked_directory:
+            self.open_directory(directory)
+            self.checked_directory = directory
+
+        written = 0
+        for series in SERIES:
+            records, dropped = self.raw[series].drain()
+            self.dropped += dropped
+            written += self.append(os.path.join(directory, f"{series}.raw"), records)
+            for name, tier in self.tiers[series].items():
+                written += self.append(os.path.join(directory, f"{series}.{name}"), tier.drain(len(self.ids)))
+        return written
+
+    def open_directory(self, directory):
+        """Write ids.json, first moving aside files recorded for another intersection set"""
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "ids.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Directories written before the CRC was stored only have the ids
+            old_crc = meta.get("ids_crc", ids_crc(meta["ids"]))
+            if old_crc == self.ids_crc and meta["ids"] == self.ids:
+                return
+            self.move_aside(directory, old_crc)
+
+        with open(meta_path, "w") as f:
+            json.dump({"ids": self.ids, "ids_crc": self.ids_crc, "series": SERIES,
+                       "status_codes": STATUS_CODES}, f)
+
+    @staticmethod
+    def move_aside(directory, old_crc):
+        """Move the files of directory into a new subdirectory named after old_crc"""
+        target = os.path.join(directory, f"ids-{old_crc:08x}")
+        suffix = 1
+        while os.path.exists(target):
+            target = os.path.join(directory, f"ids-{old_crc:08x}.{suffix}")
+            suffix += 1
+        os.makedirs(target)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                os.replace(path, os.path.join(target, name))
+        logger.warning("Telemetry directory held another intersection set - old files moved aside",
+                       extra=fields(directory=directory, moved_to=target))
+
+    @staticmethod
+    def append(path, records):
+        if not len(records):
+            return 0
+        with open(path, "ab") as f:
+            records.tofile(f)
+        return records.nbytes
+
+    def nbytes(self):
+        """Memory held by the store; fixed at construction"""
+        total = self.state.nbytes + self.green_since.nbytes
+        for series in SERIES:
+            total += self.raw[series].nbytes()
+            total += sum(tier.nbytes() for tier in self.tiers[series].values())
+        return total
\ No newline at end of file
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for ai_model - batch, scalar and lookup table predictions agree
+"""
+
+import numpy as np
+import pytest
+
+from ai_model import TABLE_LANES, TABLE_Q_MAX, TABLE_T_LOST, TeacherModel, TrafficAIModel
+
+# Values halfway between two hundredths across the green time range
+HALFWAY = np.arange(1500, 9000) / 100 + 0.005
+
+
+class QueueForest:
+    """Stand-in forest predicting the queue length plus offset, so ties can be chosen"""
+
+    def __init__(self, offset=0.0):
+        self.offset = offset
+
+    def predict(self, X):
+        return np.asarray(X)[:, 0] + self.offset
+
+
+@pytest.fixture(scope="module")
+def model():
+    model = TrafficAIModel(N=200, n_estimators=1, n_jobs=1, seed=0)
+    model.model = QueueForest()
+    model.table = None
+    return model
+
+
+def test_forest_batch_and_scalar_round_alike(model):
+    lanes = np.full(len(HALFWAY), 2.0)
+    batch = model.predict_green_times(HALFWAY, lanes)
+    scalar = [model.predict_green_time_forest(Q, 2.0) for Q in HALFWAY.tolist()]
+
+    assert batch.tolist() == scalar
+
+
+def test_lookup_table_rounds_like_the_scalar_path(model):
+    model.model = QueueForest(offset=15.005)
+    try:
+        table = model.evaluate_grid()
+        for lanes in range(TABLE_LANES[0], TABLE_LANES[1] + 1):
+            for Q in range(TABLE_Q_MAX + 1):
+                assert table[lanes - TABLE_LANES[0], Q] == model.predict_green_time_forest(Q, lanes, TABLE_T_LOST)
+    finally:
+        model.model = QueueForest()
+
+
+def test_teacher_batch_and_scalar_round_alike():
+    teacher = TeacherModel(s_per_lane=1.0)
+    batch = teacher.predict_green_times(HALFWAY, 1.0, 0.0)
+    scalar = [teacher.predict_green_time(Q, 1.0, 0.0) for Q in HALFWAY.tolist()]
+
+    assert batch.tolist() == scalar
\ No newline at end of file
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for checkpoint - slot selection, torn saves and intersection sets
+"""
+
+import os
+
+import numpy as np
+
+from checkpoint import STATE_DTYPE, Checkpoint
+
+
+IDS = ["a", "b", "c"]
+
+
+def state(density):
+    rows = np.zeros(len(IDS), dtype=STATE_DTYPE)
+    rows["density"] = density
+    return rows
+
+
+def save_two(path):
+    """Two snapshots: density 1 at time 100 with b green, then density 2 at time 105"""
+    checkpoint = Checkpoint(path, IDS)
+    checkpoint.save(state(1), 100.0, "b", 130.0)
+    checkpoint.save(state(2), 105.0)
+    checkpoint.close()
+    return checkpoint
+
+
+def tear(path, checkpoint, sequence):
+    """Change a snapshot's state without updating its CRC, as a crash mid-save would"""
+    data = np.memmap(path, dtype=checkpoint.dtype, mode="r+", shape=())
+    data["slots"][sequence % 2]["state"]["density"][0] = -5
+    data.flush()
+
+
+def test_restore_without_a_file(tmp_path):
+    assert Checkpoint(os.path.join(tmp_path, "state.ckpt"), IDS).restore() is None
+
+
+def test_restore_picks_the_newest_slot(tmp_path):
+    path = os.path.join(tmp_path, "state.ckpt")
+    save_two(path)
+
+    snapshot = Checkpoint(path, IDS).restore()
+    assert snapshot["time"] == 105.0
+    assert snapshot["current_green"] is None
+    assert snapshot["state"]["density"].tolist() == [2, 2, 2]
+
+
+def test_torn_slot_falls_back_to_the_older_one(tmp_path):
+    path = os.path.join(tmp_path, "state.ckpt")
+    checkpoint = save_two(path)
+    tear(path, checkpoint, checkpoint.sequence)
+
+    snapshot = Checkpoint(path, IDS).restore()
+    assert snapshot["time"] == 100.0
+    assert snapshot["current_green"] == "b"
+    assert snapshot["green_ends"] == 130.0
+    assert snapshot["state"]["density"].tolist() == [1, 1, 1]
+
+
+def test_both_slots_torn(tmp_path):
+    path = os.path.join(tmp_path, "state.ckpt")
+    checkpoint = save_two(path)
+    tear(path, checkpoint, 1)
+    tear(path, checkpoint, 2)
+
+    assert Checkpoint(path, IDS).restore() is None
+
+
+def test_another_intersection_set_is_not_restored(tmp_path):
+    path = os.path.join(tmp_path, "state.ckpt")
+    save_two(path)
+
+    assert Checkpoint(path, ["a", "b", "d"]).restore() is None
+    assert Checkpoint(path, IDS[:-1]).restore() is None
+
+
+def test_sequence_carries_on_after_a_restart(tmp_path):
+    path = os.path.join(tmp_path, "state.ckpt")
+    save_two(path)
+
+    checkpoint = Checkpoint(path, IDS)
+    checkpoint.restore()
+    checkpoint.save(state(3), 110.0)
+    checkpoint.close()
+    assert checkpoint.sequence == 3
+
+    # The new snapshot replaced the oldest slot and is the one restored
+    snapshot = Checkpoint(path, IDS).restore()
+    assert snapshot["time"] == 110.0
+    tear(path, checkpoint, 3)
+    assert Checkpoint(path, IDS).restore()["time"] == 105.0
+
+
+def test_open_replaces_a_file_of_another_intersection_set(tmp_path):
+    path = os.path.join(tmp_path, "state.ckpt")
+    save_two(path)
+
+    checkpoint = Checkpoint(path, ["x", "y", "z"])
+    checkpoint.save(state(4), 120.0, "z", 150.0)
+    checkpoint.close()
+    assert checkpoint.sequence == 1
+
+    snapshot = Checkpoint(path, ["x", "y", "z"]).restore()
+    assert snapshot["current_green"] == "z"
+    assert Checkpoint(path, IDS).restore() is None
\ No newline at end of file
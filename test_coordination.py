@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for coordination - conflict-set safety and plan bounds
+"""
+
+import numpy as np
+
+from coordination import GREEN, MAX_CYCLE, MIN_GREEN, RED, YELLOW_TIME, NetworkCoordinator
+
+
+def non_red_per_set(coordinator):
+    return np.bincount(coordinator.set_of, weights=coordinator.state != RED,
+                       minlength=len(coordinator.set_size))
+
+
+def test_replanning_never_opens_two_members_of_a_set():
+    ids = ["a", "b", "c", "d"]
+    coordinator = NetworkCoordinator(ids, dict.fromkeys(ids, 2), conflict_sets=[["a", "b", "c"]])
+    rng = np.random.default_rng(0)
+
+    for now in range(20_000):
+        if now % 300 == 0:
+            coordinator.optimize(rng.uniform(10, 90, size=len(ids)))
+        coordinator.sweep(float(now))
+        assert non_red_per_set(coordinator).max() <= 1, now
+
+
+def test_replanning_keeps_serving_every_member():
+    ids = ["a", "b", "c"]
+    coordinator = NetworkCoordinator(ids, dict.fromkeys(ids, 2), conflict_sets=[ids])
+    rng = np.random.default_rng(1)
+    greens = np.zeros(len(ids), dtype=int)
+
+    for now in range(5_000):
+        if now % 137 == 0:
+            coordinator.optimize(rng.uniform(10, 90, size=len(ids)))
+        for i in coordinator.sweep(float(now)):
+            greens[i] += coordinator.state[i] == GREEN
+
+    assert greens.min() > 0
+
+
+def test_held_green_blocks_its_set():
+    ids = ["a", "b"]
+    coordinator = NetworkCoordinator(ids, dict.fromkeys(ids, 1), conflict_sets=[ids])
+    coordinator.optimize([30, 30])
+    coordinator.set_state("a", GREEN, 0.0)
+    held = np.array([True, False])
+
+    for now in range(300):
+        coordinator.sweep(float(now), held)
+        assert coordinator.state[1] == RED
+
+
+def test_large_set_keeps_min_green_and_stretches_cycle():
+    ids = [f"s{i}" for i in range(40)]
+    coordinator = NetworkCoordinator(ids, dict.fromkeys(ids, 1), conflict_sets=[ids])
+    stats = coordinator.optimize(np.full(len(ids), 60.0))
+
+    assert coordinator.green.min() >= MIN_GREEN
+    assert stats["stretched_sets"] == 1
+    assert coordinator.cycle[0] > MAX_CYCLE
+    assert coordinator.cycle[0] >= coordinator.green.sum() + len(ids) * YELLOW_TIME - 1e-6
+
+
+def test_small_set_is_not_stretched():
+    ids = ["a", "b"]
+    coordinator = NetworkCoordinator(ids, dict.fromkeys(ids, 1), conflict_sets=[ids])
+    stats = coordinator.optimize([30, 20])
+
+    assert stats["stretched_sets"] == 0
+    assert coordinator.cycle.max() <= MAX_CYCLE
\ No newline at end of file
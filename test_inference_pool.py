@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for inference_pool - the model the workers serve, the latency
+budget and worker restarts
+"""
+
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+import inference_pool
+from ai_model import TrafficAIModel
+from inference_pool import InferencePool, worker_model_path
+
+
+Q = np.array([4.0, 12.0, 33.5, 70.0])
+LANES = np.array([1.0, 2.0, 2.0, 3.0])
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    """A small forest saved with its flat export, loaded as the controller loads it"""
+    path = str(tmp_path_factory.mktemp("model") / "model.pkl")
+    TrafficAIModel(N=2000, n_estimators=5, n_jobs=1, seed=0).save_model(path)
+    return TrafficAIModel(path, lazy=True)
+
+
+def teacher(model):
+    return np.round(model.teacher_green_times(Q, LANES * model.s_per_lane, 3.0), 2)
+
+
+def answered_by_worker(pool, timeout=60.0):
+    """Predict with a generous budget until a worker answers; the answer, or None"""
+    budget, pool.budget = pool.budget, 1.0
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            fallbacks = pool.stats["inference_fallback_inputs"]
+            g = pool.predict_green_times(Q, LANES)
+            if pool.stats["inference_fallback_inputs"] == fallbacks:
+                return g
+        return None
+    finally:
+        pool.budget = budget
+
+
+def test_workers_serve_the_flat_export_of_a_pickle(tmp_path):
+    pickled = tmp_path / "model.pkl"
+    pickled.write_bytes(b"")
+    (tmp_path / "model_flat").mkdir()
+
+    assert worker_model_path(str(pickled)) == str(tmp_path / "model_flat")
+
+
+def test_workers_serve_a_flat_export_as_given(tmp_path):
+    flat = tmp_path / "model_20260101"
+    flat.mkdir()
+
+    assert worker_model_path(str(flat)) == str(flat)
+
+
+def test_workers_fall_back_to_the_pickle(tmp_path):
+    pickled = tmp_path / "model.pkl"
+    pickled.write_bytes(b"")
+
+    assert worker_model_path(str(pickled)) == str(pickled)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGSTOP"), reason="needs SIGSTOP")
+def test_slow_worker_is_answered_by_the_teacher_equation_within_budget(model):
+    pool = InferencePool(model, workers=1, budget=0.05)
+    try:
+        assert answered_by_worker(pool) is not None
+        os.kill(pool.processes[0].pid, signal.SIGSTOP)
+        try:
+            start = time.monotonic()
+            g = pool.predict_green_times(Q, LANES)
+            elapsed = time.monotonic() - start
+        finally:
+            os.kill(pool.processes[0].pid, signal.SIGCONT)
+
+        assert elapsed < 0.05 + 0.5
+        assert np.array_equal(g, teacher(model))
+        assert pool.stats["inference_deadline_missed"] == 1
+        assert pool.stats["inference_fallback_inputs"] == len(Q)
+    finally:
+        pool.close()
+
+
+def test_dead_worker_is_restarted(model, monkeypatch):
+    monkeypatch.setattr(inference_pool, "RESPAWN_DELAY", 0.0)
+    pool = InferencePool(model, workers=1, budget=0.05)
+    try:
+        expected = answered_by_worker(pool)
+        assert np.array_equal(expected, model.predict_green_times(Q, LANES))
+        assert not np.array_equal(expected, teacher(model))
+
+        pool.processes[0].terminate()
+        pool.processes[0].join()
+        # The batch that finds the worker dead restarts it and is answered within budget
+        start = time.monotonic()
+        g = pool.predict_green_times(Q, LANES)
+        assert time.monotonic() - start < 0.05 + 0.5
+        assert np.array_equal(g, teacher(model))
+        assert pool.stats["inference_restarts"] == 1
+        assert pool.processes[0].is_alive()
+
+        assert np.array_equal(answered_by_worker(pool), expected)
+        assert pool.stats["inference_restarts"] == 1
+    finally:
+        pool.close()
\ No newline at end of file
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for intersection_registry - the indexed priority queue
+"""
+
+import random
+
+from intersection_registry import IndexedPriorityQueue
+
+
+def check_heap(queue):
+    for i, entry in enumerate(queue.heap):
+        assert queue.position[entry[2]] == i
+        if i:
+            assert queue.heap[(i - 1) // 2][:2] <= entry[:2]
+    assert len(queue.position) == len(queue.heap)
+
+
+def test_peek_follows_pushes_updates_and_removals():
+    queue = IndexedPriorityQueue()
+    rng = random.Random(0)
+    priorities = {}
+    first_added = {}
+
+    for _ in range(5_000):
+        key = f"k{rng.randrange(40)}"
+        operation = rng.random()
+        if operation < 0.5:
+            priorities[key] = rng.randrange(10)
+            first_added.setdefault(key, len(first_added))
+            queue.push(key, priorities[key])
+        elif operation < 0.8:
+            priority = rng.randrange(10)
+            if key in priorities:
+                priorities[key] = priority
+            queue.update(key, priority)
+        else:
+            priorities.pop(key, None)
+            queue.remove(key)
+
+        check_heap(queue)
+        assert len(queue) == len(priorities)
+        expected = min(priorities, key=lambda k: (-priorities[k], first_added[k]), default=None)
+        assert queue.peek() == expected
+
+
+def test_ties_go_to_the_first_added_key():
+    queue = IndexedPriorityQueue()
+    for key in ("c", "a", "b"):
+        queue.push(key, 5)
+    assert queue.peek() == "c"
+
+    # A key keeps its place in line when it is queued again
+    queue.remove("c")
+    assert queue.peek() == "a"
+    queue.push("c", 5)
+    assert queue.peek() == "c"
+
+
+def test_update_ignores_keys_not_queued():
+    queue = IndexedPriorityQueue()
+    queue.update("a", 3)
+    assert "a" not in queue
+    assert queue.peek() is None
\ No newline at end of file
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for signal_fleet - fleet construction and virtual signal commands
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import signal_fleet
+import transport
+from signal_fleet import SignalFleet, VirtualSignal
+from transport import InProcessBroker, InProcessTransport
+from wire_format import encode
+
+
+def build_fleet(**kwargs):
+    """SignalFleet(**kwargs), or None if the constructor does not return within a few seconds"""
+    built = []
+    thread = threading.Thread(target=lambda: built.append(SignalFleet(**kwargs)), daemon=True)
+    thread.start()
+    thread.join(timeout=5.0)
+    return built[0] if built else None
+
+
+def test_fleet_with_shared_transports():
+    broker = InProcessBroker()
+    clients = [InProcessTransport(f"fleet-{i}", broker) for i in range(3)]
+    fleet = build_fleet(n_signals=10, transports=clients, seed=0)
+
+    assert fleet is not None
+    assert fleet.clients == clients
+    assert len(fleet.signals) == 10
+    assert {signal.client_index for signal in fleet.signals} == {0, 1, 2}
+    assert all(client.on_message == fleet.on_message for client in clients)
+
+
+def test_fleet_creates_its_own_clients(monkeypatch):
+    monkeypatch.setattr(transport, "TRANSPORT", "inprocess")
+    fleet = build_fleet(n_signals=5, n_clients=2, seed=0)
+
+    assert fleet is not None
+    assert len(fleet.clients) == 2
+    assert len(fleet.by_control_topic) == 5
+
+
+def test_short_green_never_adds_cars():
+    signal = VirtualSignal("intersection1", "SIGNAL 1", 20, 0)
+    signal.handle_command({"command": "green", "duration": 1})
+    assert signal.pending_discharge == 0
+
+    signal.handle_command({"command": "yellow"})
+    assert signal.cars_passed == 0
+    assert signal.density == 20
+
+
+def test_green_discharges_at_most_the_queue():
+    signal = VirtualSignal("intersection1", "SIGNAL 1", 20, 0)
+    signal.handle_command({"command": "green", "duration": 30})
+    signal.handle_command({"command": "red"})
+
+    assert signal.cars_passed == 20
+    assert signal.density == 0
+
+
+def test_fleet_keeps_the_latest_latencies(monkeypatch):
+    monkeypatch.setattr(signal_fleet, "LATENCY_WINDOW", 10)
+    broker = InProcessBroker()
+    fleet = build_fleet(n_signals=2, transports=[InProcessTransport("fleet-0", broker)], seed=0)
+
+    for _ in range(25):
+        payload = encode("control", {"command": "stop", "duration": 1, "timestamp": time.time()})
+        fleet.on_message(None, None, SimpleNamespace(topic="traffic/intersection1/control", payload=payload))
+
+    assert len(fleet.latencies) == 10
+    assert fleet.report()["commands"] == 25
\ No newline at end of file
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for telemetry - flushed files and the intersection set they belong to
+"""
+
+import json
+import os
+
+from telemetry import TelemetryStore, ids_crc, read_raw
+
+
+def flush_density(directory, ids, value):
+    store = TelemetryStore(ids)
+    store.record("density", [0], [value], 1.0)
+    store.flush(directory)
+    return store
+
+
+def test_flush_appends_for_the_same_intersections(tmp_path):
+    flush_density(tmp_path, ["a", "b"], 10)
+    flush_density(tmp_path, ["a", "b"], 20)
+
+    records = read_raw(os.path.join(tmp_path, "density.raw"))
+    assert records["value"].tolist() == [10, 20]
+    with open(os.path.join(tmp_path, "ids.json")) as f:
+        assert json.load(f)["ids_crc"] == ids_crc(["a", "b"])
+
+
+def test_flush_moves_aside_files_of_another_intersection_set(tmp_path):
+    flush_density(tmp_path, ["a", "b"], 10)
+    flush_density(tmp_path, ["b", "a"], 20)
+
+    records = read_raw(os.path.join(tmp_path, "density.raw"))
+    assert records["value"].tolist() == [20]
+    with open(os.path.join(tmp_path, "ids.json")) as f:
+        assert json.load(f)["ids"] == ["b", "a"]
+
+    old = os.path.join(tmp_path, f"ids-{ids_crc(['a', 'b']):08x}")
+    assert read_raw(os.path.join(old, "density.raw"))["value"].tolist() == [10]
+    with open(os.path.join(old, "ids.json")) as f:
+        assert json.load(f)["ids"] == ["a", "b"]
+
+
+def test_flush_checks_directories_written_without_a_crc(tmp_path):
+    with open(os.path.join(tmp_path, "ids.json"), "w") as f:
+        json.dump({"ids": ["a", "b"]}, f)
+    flush_density(tmp_path, ["a", "b"], 10)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("ids-")]
+
+    flush_density(tmp_path, ["a", "c"], 20)
+    assert [name for name in os.listdir(tmp_path) if name.startswith("ids-")]
\ No newline at end of file
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for traffic_server_with_ai - emergency preemption on a virtual clock
+"""
+
+import json
+import os
+
+from coordination import GREEN, RED, YELLOW, YELLOW_TIME
+from simulation import VirtualScheduler
+from traffic_server_with_ai import SmartTrafficSystemWithAI
+from transport import InProcessBroker, InProcessTransport
+from wire_format import encode
+
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intersections.json")
+
+
+def make_controller(config_path=CONFIG, **kwargs):
+    """A controller on a virtual clock, serving the teacher equation, with no signals attached"""
+    scheduler = VirtualScheduler()
+    controller = SmartTrafficSystemWithAI(
+        "no_model.pkl", config_path=config_path, scheduler=scheduler,
+        transport=InProcessTransport("TrafficMasterAI", InProcessBroker(synchronous=True)), **kwargs
+    )
+    controller.client.connect()
+    return controller, scheduler
+
+
+def emergency(controller, origin, destination):
+    controller.activate_emergency_route({"vehicle_id": "AMB-1", "from": origin, "to": destination,
+                                         "timestamp": controller.scheduler.now()})
+    return controller.green_waves["AMB-1"]
+
+
+def test_preempted_current_green_returns_to_the_cycle():
+    controller, scheduler = make_controller()
+    scheduler.run_until(1)
+    current = controller.current_green
+    assert current is not None
+
+    # The window of the signal already green ends before its normal green does
+    window = emergency(controller, current, "intersection4").windows[current]
+    scheduler.run_until(window.end + 1)
+    assert current not in controller.preempted
+    assert controller.intersections[current]["status"] == "green"
+
+    statuses = set()
+    while scheduler.now() < window.end + 120 and current not in controller.priority_queue:
+        scheduler.run_until(scheduler.now() + 1)
+        statuses.add(controller.intersections[current]["status"])
+    assert current in controller.priority_queue
+    assert {"yellow", "red"} <= statuses
+
+    greens = 0
+    for _ in range(600):
+        previous = controller.intersections[current]["status"]
+        scheduler.run_until(scheduler.now() + 1)
+        greens += previous != "green" and controller.intersections[current]["status"] == "green"
+    assert greens > 0
+
+
+def test_preempted_signal_keeps_its_conflict_set_red(tmp_path):
+    with open(CONFIG) as f:
+        config = json.load(f)
+    config["conflict_sets"] = [["intersection1", "intersection3"]]
+    config_path = os.path.join(tmp_path, "intersections.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+    controller, scheduler = make_controller(config_path, coordinated=True)
+    coordination = controller.coordination
+    partner, held = coordination.index["intersection1"], coordination.index["intersection3"]
+    while not (coordination.state[partner] == YELLOW and coordination.state[held] == RED):
+        scheduler.run_until(scheduler.now() + 1)
+
+    # A long queue at the destination opens its window well ahead of the
+    # vehicle, across the next planned green of intersection1
+    controller.network["intersection3"]["density"] = 100
+    window = emergency(controller, "intersection4", "intersection3").windows["intersection3"]
+    planned = coordination.next_green(scheduler.now() + YELLOW_TIME, [partner])[0]
+    assert window.start < planned < window.end
+
+    opened = False
+    while not window.released:
+        scheduler.run_until(scheduler.now() + 1)
+        opened |= window.active
+        assert coordination.state[partner] != GREEN
+        assert controller.intersections["intersection1"]["status"] != "green"
+    assert opened
+
+
+def test_bad_density_readings_are_skipped():
+    controller, _ = make_controller()
+    before = {key: intersection["density"] for key, intersection in controller.intersections.items()}
+    readings = {"intersection1": 12, "intersection2": "many", "intersection3": -4,
+                "intersection4": float("nan")}
+    for key, value in readings.items():
+        controller.density_buffer[key] = encode("density", {"value": value, "signal": key, "status": "red"})
+
+    controller.drain_density_buffer()
+    assert controller.metrics.counters["decode_errors"] == 3
+    assert controller.metrics.counters["readings_applied"] == 1
+    assert controller.intersections["intersection1"]["density"] == 12
+    for key in ("intersection2", "intersection3", "intersection4"):
+        assert controller.intersections[key]["density"] == before[key]
\ No newline at end of file
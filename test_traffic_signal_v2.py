@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for traffic_signal_v2 - commands actuate on arrival, timers of an
+earlier phase do nothing
+"""
+
+from types import SimpleNamespace
+
+from phase_scheduler import PhaseScheduler
+from traffic_signal_v2 import AdvancedTrafficSignal
+from transport import InProcessBroker, InProcessTransport
+from wire_format import encode
+
+
+def make_signal():
+    """A signal on a scheduler that is never started: its timers only run when a test calls them"""
+    signal = AdvancedTrafficSignal("intersection1", "SIGNAL 1",
+                                   transport=InProcessTransport("intersection1", InProcessBroker()),
+                                   scheduler=PhaseScheduler("Test"))
+    signal.client.connect()
+    return signal
+
+
+def command(signal, **data):
+    signal.on_message(signal.client, None, SimpleNamespace(payload=encode("control", data)))
+
+
+def test_commands_change_state_before_on_message_returns():
+    signal = make_signal()
+    signal.density = 30
+
+    command(signal, command="green", duration=20)
+    assert signal.status == "green"
+    assert signal.green_time == 20
+    assert signal.passage_total == 30
+
+    command(signal, command="yellow", duration=4)
+    assert signal.status == "yellow"
+    assert signal.last_latency is not None
+
+
+def test_repeated_command_is_not_actuated_again():
+    signal = make_signal()
+    command(signal, command="green", duration=20)
+    phase = signal.phase
+
+    command(signal, command="green", duration=40)
+    assert signal.phase == phase
+    assert signal.green_time == 20
+
+
+def test_emergency_interrupts_a_green_and_drops_its_timers():
+    signal = make_signal()
+    signal.density = 30
+    command(signal, command="green", duration=20)
+    green_phase = signal.phase
+    signal.cars_passed = 6
+
+    command(signal, command="emergency_green", duration=10, vehicle="AMBULANCE")
+    assert signal.status == "green"
+    assert signal.emergency
+    assert signal.density == 24
+
+    # The discharge timer of the interrupted green no longer changes anything
+    signal.discharge_step(green_phase, 3)
+    assert signal.cars_passed == 0
+
+
+def test_yellow_timer_ends_in_red_unless_superseded():
+    signal = make_signal()
+    command(signal, command="yellow", duration=5)
+    signal.end_phase(signal.phase, "red")
+    assert signal.status == "red"
+
+    command(signal, command="yellow", duration=5)
+    stale = signal.phase
+    command(signal, command="green", duration=20)
+    signal.end_phase(stale, "red")
+    assert signal.status == "green"
\ No newline at end of file
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for wire_format - binary round trips and the JSON fallback
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from wire_format import decode, encode, encode_binary, KINDS, payload_format
+
+
+def round_trip(kind, data):
+    payload = encode(kind, data, "binary")
+    return payload, decode(payload)
+
+
+def test_binary_round_trip():
+    data = {"status": "green", "density": 23, "green_time": 39.38, "yellow_time": 5.0,
+            "timestamp": 1700000000.25, "cars_passed": 12}
+    payload, decoded = round_trip("status", data)
+
+    assert payload_format(payload) == "binary"
+    assert decoded == data
+
+
+def test_numpy_integers_stay_binary():
+    payload, decoded = round_trip("density", {"value": np.int64(17), "status": "red"})
+
+    assert payload_format(payload) == "binary"
+    assert decoded == {"value": 17, "status": "red"}
+
+
+@pytest.mark.parametrize("value", [-1, 65535, 70_000, 23.5, "23", True])
+def test_density_outside_u16_goes_as_json(value):
+    data = {"value": value, "status": "red", "timestamp": 1.0}
+    payload, decoded = round_trip("density", data)
+
+    assert payload_format(payload) == "json"
+    assert decoded == data
+
+
+@pytest.mark.parametrize("duration", [-5, 700.0, float("inf")])
+def test_duration_outside_the_field_goes_as_json(duration):
+    payload = encode("control", {"command": "green", "duration": duration}, "binary")
+
+    assert payload_format(payload) == "json"
+    assert json.loads(payload)["duration"] == duration
+
+
+def test_unknown_enum_and_long_extra_go_as_json():
+    for kind, data in (("status", {"status": "flashing"}),
+                       ("control", {"command": "green", "message": "x" * 70_000})):
+        payload, decoded = round_trip(kind, data)
+
+        assert payload_format(payload) == "json"
+        assert decoded == data
+
+
+def test_encode_binary_names_the_field():
+    with pytest.raises(ValueError, match="density"):
+        encode_binary(KINDS["control"], {"command": "green", "density": -3})
\ No newline at end of file
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Traffic Logging - structured, leveled logging for all components
+
+Every component logs through its own logger (traffic.controller,
+traffic.signal.<id>, traffic.emergency, ...). setup_logging() puts one
+non-blocking queue handler on the "traffic" logger; a background thread
+formats and writes the records, so the caller only pays for a queue put
+and never waits on stdout or disk. When the queue is full, records are
+dropped and counted instead of blocking.
+
+Structured fields are passed as extra=fields(key=value, ...) and appear
+as key=value pairs in text output or as keys of the JSON-lines output.
+
+Configuration (environment, or setup_logging arguments):
+    TRAFFIC_LOG_LEVEL    DEBUG / INFO (default) / WARNING / ERROR
+    TRAFFIC_LOG_FORMAT   text (default) or json
+    TRAFFIC_LOG_FILE     append to this file instead of stdout
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+
+ROOT = "traffic"
+LOG_LEVEL = os.environ.get("TRAFFIC_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("TRAFFIC_LOG_FORMAT", "text")
+LOG_FILE = os.environ.get("TRAFFIC_LOG_FILE")
+
+QUEUE_SIZE = 10_000
+
+listener = None
+
+
+def get_logger(component):
+    """Logger of one component, e.g. get_logger("controller")"""
+    return logging.getLogger(f"{ROOT}.{component}")
+
+
+def fields(**values):
+    """Structured fields for a log call: logger.info("...", extra=fields(signal=...))"""
+    return {"fields": values}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "component": record.name.partition(".")[2] or record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extra = getattr(record, "fields", None)
+        if extra:
+            line += " | " + " ".join(f"{key}={value}" for key, value in extra.items())
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        """Queue handler that drops (and counts) records instead of blocking"""
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting is left to the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": f"{ROOT}.logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "%d log records dropped (queue full)", "args": (self.dropped,)
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=None, log_format=None, path=None, stream=None):
+    """
+    Route all traffic.* loggers through one background writer. Safe to call
+    more than once; later calls replace the earlier configuration.
+    """
+    global listener
+
+    level = level or LOG_LEVEL
+    log_format = log_format or LOG_FORMAT
+    path = path or LOG_FILE
+
+    if path:
+        handler = logging.FileHandler(path, mode="a", encoding="utf-8")
+    else:
+        handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    logger = logging.getLogger(ROOT)
+    stop_logging()
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    logger.addHandler(NonBlockingQueueHandler(log_queue))
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return logger
+
+
+def stop_logging():
+    """Flush pending records and stop the writer thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+atexit.register(stop_logging)
+
+
+class EventSummary:
+    def __init__(self, logger, name, interval=10.0, level=logging.INFO):
+        """
+        Counts frequent events and logs one summary per interval seconds
+        instead of one line per event.
+        """
+        self.logger = logger
+        self.name = name
+        self.interval = interval
+        self.level = level
+        self.counts = {}
+        self.since = time.monotonic()
+        self.lock = threading.Lock()
+
+    def count(self, event, n=1):
+        now = time.monotonic()
+        with self.lock:
+            self.counts[event] = self.counts.get(event, 0) + n
+            if now - self.since < self.interval:
+                return
+            counts, self.counts = self.counts, {}
+            elapsed, self.since = now - self.since, now
+
+        if self.logger.isEnabledFor(self.level):
+            summary = ", ".join(f"{value} {key}" for key, value in counts.items())
+            self.logger.log(self.level, "%s in last %.0f sec: %s", self.name, elapsed, summary,
+                            extra=fields(interval=round(elapsed, 3), **counts))
\ No newline at end of file
@@ -1,248 +1,937 @@
-import paho.mqtt.client as mqtt
-import json
-import time
+import logging
+import math
+import numbers
+import os
+import sys
 import threading
-from ai_model import TrafficAIModel
+import time
+
+import numpy as np
+
+from ai_model import TeacherModel, TrafficAIModel, flat_model_path
+from checkpoint import CHECKPOINT_PERIOD, MAX_CHECKPOINT_AGE, STATE_DTYPE, Checkpoint
+from coordination import GREEN, MAX_CYCLE, STATES, YELLOW, YELLOW_TIME, NetworkCoordinator
+from forecast import QueueForecaster
+from inference_pool import InferencePool
+from green_wave import GreenWave, flush_time
+from intersection_registry import IndexedPriorityQueue, load_intersections, read_coordination_config
+from metrics import METRICS_TOPIC, ControllerMetrics, serve_prometheus
+from phase_scheduler import PhaseScheduler
+from retraining import MIN_OBSERVATIONS, RETRAIN_PERIOD, DischargeLog, Retrainer, serving_model_path
+from road_network import RoadNetwork
+from telemetry import STATUS_CODES, TelemetryStore
+from traffic_logging import EventSummary, fields, get_logger, setup_logging
+from transport import create_transport
+from wire_format import decode, encode, payload_format
+
+logger = get_logger("controller")
+
+# Seconds between drains of the density buffer
+CONTROL_TICK = 1.0
+
+# Seconds between metrics snapshots on traffic/metrics
+METRICS_PERIOD = 10.0
+
+# Seconds between re-optimizations of the coordinated plan
+REOPTIMIZE_PERIOD = 300.0
+
+# Seconds between appends of the telemetry to disk
+TELEMETRY_FLUSH_PERIOD = 60.0
 
-print("=" * 60)
-print("SMART TRAFFIC SYSTEM WITH AI - 4 SIGNALS")
-print("USING RANDOM FOREST MODEL")
-print("SIGNAL SEQUENCE: RED -> YELLOW -> GREEN")
-print("=" * 60)
+
+def density_reading(data):
+    """Car count of a decoded density payload; anything but a finite number >= 0 is rejected"""
+    value = data.get("value", 0)
+    if isinstance(value, bool) or not isinstance(value, numbers.Real) or not math.isfinite(value) or value < 0:
+        raise ValueError(f"density value {value!r}")
+    return value
 
 
 class SmartTrafficSystemWithAI:
-    def __init__(self):
-        print("LOADING AI MODEL...")
-        self.ai_model = TrafficAIModel("traffic_ai_model.pkl")
-        print("AI MODEL READY")
+    def __init__(self, model_path="traffic_ai_model.pkl", fast_boot=False,
+                 config_path="intersections.json", intersection_ids=None,
+                 client_id="TrafficMasterAI", wire_format="json", transport=None,
+                 scheduler=None, metrics_port=None, coordinated=False, telemetry_dir=None,
+                 forecasting=False, retrainer=None, inference_workers=0, checkpoint_path=None,
+                 live_routing=True):
+        # A model promoted by online retraining replaces the one on the command line
+        promoted = serving_model_path(retrainer.directory) if retrainer else None
+        if promoted:
+            model_path, fast_boot = promoted, True
+        logger.info("Loading AI model", extra=fields(model=model_path, fast_boot=fast_boot))
+        self.ai_model = self.load_ai_model(model_path, fast_boot)
+        self.serving_path = model_path
+        # With inference workers, predictions run out of process within a latency budget
+        self.inference_pool = None
+        if inference_workers and self.ai_model.model_path is None:
+            logger.warning("Inference workers need a trained model - predicting in process")
+        elif inference_workers:
+            self.inference_pool = InferencePool(self.ai_model, inference_workers)
+        logger.info("AI model ready")
 
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "TrafficMasterAI")
+        self.client = transport or create_transport(client_id)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
-        # 4 traffic signals with different lane counts
+        # Traffic signals and their lane counts come from the config file;
+        # intersection_ids restricts this controller to a subset (one shard)
+        self.network = load_intersections(config_path)
         self.intersections = {
-            "intersection1": {
-                "id": "intersection1",
-                "name": "SIGNAL 1",
-                "density": 0,
-                "lanes": 2,
-                "status": "red",
-                "green_time": 30,
-                "waiting_time": 0,
-                "priority": 0
-            },
-            "intersection2": {
-                "id": "intersection2",
-                "name": "SIGNAL 2",
-                "density": 0,
-                "lanes": 3,
-                "status": "red",
-                "green_time": 30,
-                "waiting_time": 0,
-                "priority": 0
-            },
-            "intersection3": {
-                "id": "intersection3",
-                "name": "SIGNAL 3",
-                "density": 0,
-                "lanes": 1,
-                "status": "red",
-                "green_time": 30,
-                "waiting_time": 0,
-                "priority": 0
-            },
-            "intersection4": {
-                "id": "intersection4",
-                "name": "SIGNAL 4",
-                "density": 0,
-                "lanes": 2,
-                "status": "red",
-                "green_time": 30,
-                "waiting_time": 0,
-                "priority": 0
-            }
+            key: intersection for key, intersection in self.network.items()
+            if intersection_ids is None or key in intersection_ids
+        }
+
+        # Road graph for emergency routing; live densities feed its edge weights
+        # unless live_routing is off (see ShardController)
+        self.road_network = RoadNetwork.from_config(config_path, self.network)
+        self.live_routing = live_routing
+
+        # O(1) dispatch from density and status topics to intersection key
+        self.density_topics = {
+            f"traffic/{intersection['id']}/density": key
+            for key, intersection in self.intersections.items()
+        }
+        self.status_topics = {
+            f"traffic/{intersection['id']}/status": key
+            for key, intersection in self.intersections.items()
         }
 
+        # Signals that are not green, ordered by priority
+        self.priority_queue = IndexedPriorityQueue()
+        for key, intersection in self.intersections.items():
+            if intersection["status"] != "green":
+                self.priority_queue.push(key, intersection["priority"])
+
         self.current_green = None
+        self.green_ends = None
         self.system_active = True
 
-        # Start automatic control cycle
-        self.control_thread = threading.Thread(target=self.traffic_control_cycle)
-        self.control_thread.daemon = True
-        self.control_thread.start()
+        # Emergency green waves by vehicle, and the windows holding each signal green
+        self.green_waves = {}
+        self.preempted = {}
+
+        # Each signal is answered in the wire format it last reported in
+        self.default_wire_format = wire_format
+        self.wire_formats = {}
+
+        # Latest raw density payload per intersection, drained once per tick;
+        # status payloads are all kept, for the cars they report passed
+        self.density_buffer = {}
+        self.status_buffer = []
+        self.buffer_lock = threading.Lock()
+
+        # Hot-path instrumentation; metrics_port also serves it as Prometheus text
+        self.metrics = ControllerMetrics()
+        self.metrics_server = serve_prometheus(self.metrics, metrics_port) if metrics_port else None
+        # Per-reading and per-command events are logged as a periodic summary
+        self.summary = EventSummary(logger, "Control activity")
+
+        # Start automatic control cycle; a simulation passes a virtual-clock scheduler
+        self.phase_timer = None
+        self.scheduler = scheduler or PhaseScheduler("TrafficControlCycle").start()
+        self.scheduler.on_lag = self.metrics.scheduler_lag.observe
+        self.metrics_timer = self.scheduler.call_later(METRICS_PERIOD, self.publish_metrics)
+        for intersection in self.intersections.values():
+            intersection["red_since"] = self.scheduler.now()
+
+        # History of every intersection in fixed memory, appended to telemetry_dir if given
+        self.telemetry = TelemetryStore(list(self.intersections), origin=time.time() - self.scheduler.now())
+        self.telemetry_dir = telemetry_dir
+        if telemetry_dir:
+            self.flush_timer = self.scheduler.call_later(TELEMETRY_FLUSH_PERIOD, self.flush_telemetry)
+
+        # Warm restart from the last snapshot; the status each signal reports
+        # next confirms or corrects its restored state
+        self.checkpoint = None
+        self.unconfirmed = set()
+        if checkpoint_path:
+            self.checkpoint = Checkpoint(checkpoint_path, list(self.intersections))
+            self.restore_checkpoint(statuses=not coordinated)
+            self.checkpoint_timer = self.scheduler.call_later(CHECKPOINT_PERIOD, self.save_checkpoint)
+
+        # With forecasting, green times are predicted for the queue expected
+        # when the green starts (rows as in the telemetry), else for the last reading
+        self.forecaster = None
+        if forecasting:
+            self.forecaster = QueueForecaster(len(self.intersections))
+            self.forecaster.update(self.telemetry.rows(list(self.intersections)),
+                                   [i["density"] for i in self.intersections.values()],
+                                   self.scheduler.now(), False)
+
+        # Every green is an observation (queue, lanes, green time, cars passed)
+        # for online retraining: inputs are kept until the signal reports its passage
+        self.discharge_log = DischargeLog()
+        self.green_inputs = {}
+        self.retrainer = retrainer
+        if retrainer is not None:
+            self.retrain_timer = self.scheduler.call_later(RETRAIN_PERIOD, self.retrain)
+
+        # Coordinated mode runs every signal on a network-wide plan instead of
+        # giving one signal at a time the green
+        self.coordination = None
+        if coordinated:
+            corridors, conflict_sets = read_coordination_config(config_path)
+            self.coordination = NetworkCoordinator(
+                list(self.intersections), {key: i["lanes"] for key, i in self.intersections.items()},
+                corridors, conflict_sets, self.road_network
+            )
+            self.update_green_times(list(self.intersections))
+            self.reoptimize()
+
+        self.tick_timer = self.scheduler.call_later(CONTROL_TICK, self.control_tick)
+        if self.coordination is None and self.current_green is not None:
+            # Restored green: selection resumes when it was due to end
+            self.phase_timer = self.scheduler.call_later(
+                max(0.0, self.green_ends - self.scheduler.now()) + 1, self.control_step
+            )
+        elif self.coordination is None:
+            self.traffic_control_cycle()
+
+    def load_ai_model(self, model_path, fast_boot):
+        """
+        Fast boot serves from the lookup table of the flat export and maps
+        the flat arrays only if an input falls off the table grid, so
+        neither pickle, pandas nor sklearn is touched on startup.
+        """
+        if fast_boot and os.path.isdir(model_path):
+            return TrafficAIModel(model_path, lazy=True)
+        if fast_boot:
+            flat_path = flat_model_path(model_path)
+            if os.path.isdir(flat_path):
+                return TrafficAIModel(flat_path, lazy=True)
+            logger.warning("No flat model at %s - falling back to %s", flat_path, model_path)
+
+        if not os.path.exists(model_path):
+            # Training takes minutes; the controller never trains on boot
+            logger.error("No model at %s - serving the teacher equation until one is trained "
+                         "(python ai_model.py) or promoted by online retraining", model_path)
+            return TeacherModel()
+        return TrafficAIModel(model_path)
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         _ = userdata, flags, properties
         if rc == 0:
-            print("CONNECTED TO MQTT BROKER")
+            logger.info("Connected to broker")
         else:
-            print(f"CONNECTION FAILED - CODE: {rc}")
-
-        print("SUBSCRIBING TO ALL SIGNAL CHANNELS...")
+            logger.error("Connection failed", extra=fields(code=rc))
 
+        topics = []
         for intersection in self.intersections.values():
-            client.subscribe(f"traffic/{intersection['id']}/density")
-            client.subscribe(f"traffic/{intersection['id']}/status")
+            topics.append((f"traffic/{intersection['id']}/density", 0))
+            topics.append((f"traffic/{intersection['id']}/status", 0))
 
+        client.subscribe(topics)
         client.subscribe("emergency/request")
-        print("SUBSCRIBED TO 8 SIGNAL CHANNELS + EMERGENCY CHANNEL")
+        client.subscribe("emergency/progress")
+        logger.info("Subscribed to %d signal channels + emergency channels", len(topics))
 
     def on_message(self, client, userdata, msg):
         _ = client, userdata
         topic = msg.topic
-        payload = msg.payload.decode()
 
-        if "density" in topic:
-            signal_id = topic.split("/")[1]
+        key = self.density_topics.get(topic)
+        if key is not None:
+            counters = self.metrics.counters
+            timed = not counters["density_messages"] % self.metrics.sample_every
+            start = time.perf_counter() if timed else 0.0
 
-            for key, intersection in self.intersections.items():
-                if intersection["id"] == signal_id:
-                    try:
-                        data = json.loads(payload)
-                        density = data.get("value", 0)
-                        old_density = intersection["density"]
-                        intersection["density"] = density
-                        intersection["waiting_time"] += 3
+            # Only the latest reading per intersection is kept; parsing,
+            # inference and priority updates happen once per control tick
+            with self.buffer_lock:
+                self.density_buffer[key] = msg.payload
+                counters["density_messages"] += 1
 
-                        print(f"{intersection['name']}: {old_density} -> {density} cars")
+            if timed:
+                self.metrics.observe("receive", time.perf_counter() - start)
+            return
 
-                        # Use AI model to predict green time
-                        ai_green_time = self.ai_model.predict_green_time(
-                            Q_queue=density,
-                            lanes=intersection["lanes"],
-                            t_lost=3.0
-                        )
+        key = self.status_topics.get(topic)
+        if key is not None:
+            with self.buffer_lock:
+                self.status_buffer.append((key, msg.payload))
+            self.metrics.count("status_messages")
+            return
 
-                        intersection["green_time"] = ai_green_time
+        if "emergency/request" in topic:
+            self.metrics.count("emergency_messages")
+            try:
+                data = decode(msg.payload)
+                logger.warning("Emergency request received - activating green route", extra=fields(
+                    vehicle=data.get("vehicle_id", "Emergency vehicle"),
+                    origin=data.get("from", "Unknown"),
+                    destination=data.get("to", "Unknown")
+                ))
 
-                        # Calculate priority (density + waiting time)
-                        priority = (density * 2) + (intersection["waiting_time"] * 0.5)
-                        intersection["priority"] = priority
+                # Waves and windows are only touched on the scheduler thread
+                self.scheduler.call_later(0, self.handle_emergency_request, data, payload_format(msg.payload))
 
-                        print(f"   AI suggests: {ai_green_time} sec")
-                        print(f"   Priority: {priority:.1f} | Waiting: {intersection['waiting_time']}s")
+            except Exception:
+                logger.exception("Error in emergency request")
+            return
 
-                    except Exception as e:
-                        print(f"ERROR in {signal_id} data: {e}")
-                    break
+        if "emergency/progress" in topic:
+            try:
+                # Windows are only touched on the scheduler thread
+                self.scheduler.call_later(0, self.vehicle_passed, decode(msg.payload))
+            except Exception:
+                logger.exception("Error in emergency progress")
 
-        elif "emergency/request" in topic:
-            print("\n" + "🚑" * 15)
-            print("           EMERGENCY REQUEST RECEIVED!")
-            print("🚑" * 15)
+    def handle_emergency_request(self, emergency_data, wire_format="json"):
+        try:
+            self.activate_emergency_route(emergency_data, wire_format)
+        except Exception:
+            logger.exception("Error in emergency request")
 
-            try:
-                data = json.loads(payload)
-                vehicle = data.get("vehicle_id", "Emergency vehicle")
-                from_loc = data.get("from", "Unknown")
-                to_loc = data.get("to", "Unknown")
+    def activate_emergency_route(self, emergency_data, wire_format="json"):
+        wave = self.plan_emergency_route(emergency_data)
 
-                print(f"\n   Vehicle: {vehicle}")
-                print(f"   From: {from_loc}")
-                print(f"   To: {to_loc}")
-                print(f"   Activating green route...")
+        self.preempt_route(wave, emergency_data)
+        self.publish_emergency_response(wave, all_clear=True, wire_format=wire_format)
 
-                self.activate_emergency_route(data)
+    def plan_emergency_route(self, emergency_data):
+        """GreenWave along the fastest path from the request's origin to its destination"""
+        vehicle = emergency_data.get("vehicle_id", "Emergency")
+        request = f"{vehicle}@{emergency_data.get('timestamp')}"
+        origin = self.road_network.resolve(emergency_data.get("from"))
+        destination = self.road_network.resolve(emergency_data.get("to"))
+        route = None
+        if origin is not None and destination is not None:
+            route = self.road_network.route(origin, destination)
 
-            except Exception as e:
-                print(f"ERROR in emergency request: {e}")
+        if route is None:
+            # Without a known path every signal is cleared, as before routing existed
+            logger.warning("No route from %r to %r - preempting the whole network",
+                           emergency_data.get("from"), emergency_data.get("to"))
+            return GreenWave(vehicle, list(self.network), self.scheduler.now(), request=request)
 
-    def activate_emergency_route(self, emergency_data):
-        route = ["intersection1", "intersection2", "intersection3", "intersection4"]
+        path = list(route.path)
+        flush = [flush_time(self.network[signal_id]["density"], self.network[signal_id]["lanes"])
+                 for signal_id in path]
+        return GreenWave(vehicle, path, self.scheduler.now(), list(route.arrivals),
+                         self.road_network.free_flow_arrivals(path), flush, request)
 
-        for signal_id in route:
-            command = {
-                "command": "emergency_green",
-                "duration": 10,
-                "vehicle": emergency_data.get("vehicle_id", "Emergency"),
-                "message": "Emergency priority - Clear route"
-            }
-            self.client.publish(f"traffic/{signal_id}/control", json.dumps(command))
-            print(f"   Activating emergency green for {signal_id}")
+    def preempt_route(self, wave, emergency_data):
+        """Schedule the green windows of the route intersections this controller owns"""
+        previous = self.green_waves.pop(wave.vehicle, None)
+        if previous is not None:
+            # A new request from the same vehicle replaces its old wave
+            for window in previous.windows.values():
+                if window.off_timer is not None:
+                    window.off_timer.cancel()
+                    self.scheduler.call_later(0, self.end_preemption, previous, window)
+
+        preempted = []
+        for signal_id in wave.path:
+            if signal_id in self.intersections:
+                self.schedule_window(wave, wave.windows[signal_id])
+                preempted.append(signal_id)
+        if preempted:
+            self.green_waves[wave.vehicle] = wave
+
+        logger.info("Emergency green wave for %d intersections", len(preempted), extra=fields(
+            vehicle=emergency_data.get("vehicle_id"), etas=wave.etas(),
+            green_seconds=round(wave.green_seconds(), 1)
+        ))
+        return preempted
+
+    def schedule_window(self, wave, window):
+        """(Re)arm the timers that open and release one window"""
+        now = self.scheduler.now()
+        if window.on_timer is not None:
+            window.on_timer.cancel()
+        if window.off_timer is not None:
+            window.off_timer.cancel()
+
+        if not window.active:
+            window.on_timer = self.scheduler.call_at(max(now, window.start), self.start_preemption,
+                                                     wave, window)
+        window.off_timer = self.scheduler.call_at(max(now, window.end), self.end_preemption, wave, window)
+
+    def start_preemption(self, wave, window):
+        """Hold the signal green for the emergency vehicle until its window ends"""
+        if window.active or window.released:
+            return
+
+        signal_id = window.signal_id
+        intersection = self.intersections[signal_id]
+        now = self.scheduler.now()
+        window.active = True
+        window.opened = now
+        self.preempted.setdefault(signal_id, set()).add(window)
+        self.priority_queue.remove(signal_id)
+
+        command = {
+            "command": "emergency_green",
+            "duration": round(window.end - now, 1),
+            "vehicle": wave.vehicle,
+            "message": "Emergency priority - Clear route"
+        }
+        self.send_command(signal_id, command)
+        intersection["status"] = "green"
+        if self.coordination is not None:
+            # The rest of its conflict set stays red while it is held
+            self.coordination.set_state(signal_id, GREEN, now)
+        self.metrics.count("preemptions")
+
+    def end_preemption(self, wave, window):
+        """Release the signal once the vehicle has passed (or its window ran out)"""
+        if window.released:
+            return
+        window.released = True
+        if window.on_timer is not None:
+            window.on_timer.cancel()
+        if window.off_timer is not None:
+            window.off_timer.cancel()
+
+        if all(other.released for other in wave.windows.values()
+               if other.signal_id in self.intersections):
+            if self.green_waves.get(wave.vehicle) is wave:
+                del self.green_waves[wave.vehicle]
+
+        if not window.active:
+            return
+        window.active = False
+
+        signal_id = window.signal_id
+        held = self.preempted[signal_id]
+        held.discard(window)
+        green_seconds = self.metrics.gauges.get("preempted_green_seconds", 0.0)
+        self.metrics.gauges["preempted_green_seconds"] = green_seconds + self.scheduler.now() - window.opened
 
+        if held:
+            # Another vehicle still needs it
+            return
+        del self.preempted[signal_id]
+        if signal_id == self.current_green:
+            # The green of the normal cycle; its own yellow closes it
+            return
+
+        intersection = self.intersections[signal_id]
+        self.send_command(signal_id, {"command": "yellow", "duration": 5, "message": "Emergency passed"})
+        intersection["status"] = "yellow"
+        if self.coordination is not None:
+            # The plan takes the signal over again after its yellow
+            self.coordination.set_state(signal_id, YELLOW, self.scheduler.now())
+        else:
+            self.scheduler.call_later(5, self.finish_yellow, intersection, None, signal_id)
+
+    def vehicle_passed(self, progress):
+        """The vehicle reported passing an intersection: release it and re-time the ones ahead"""
+        wave = self.green_waves.get(progress.get("vehicle_id"))
+        signal_id = progress.get("intersection")
+        # Reports from an earlier request of the same vehicle are ignored
+        if wave is None or progress.get("request") != wave.request or signal_id not in wave.windows:
+            return
+
+        window = wave.windows[signal_id]
+        if signal_id in self.intersections and not window.active:
+            self.metrics.count("emergency_red_arrivals")
+            logger.warning("%s: emergency vehicle arrived outside its green window",
+                           self.intersections[signal_id]["name"], extra=fields(vehicle=wave.vehicle))
+
+        if wave.arrivals is not None:
+            index = wave.path.index(signal_id)
+            wave.plan(index, self.scheduler.now())
+            for ahead in wave.path[index + 1:]:
+                if ahead in self.intersections and not wave.windows[ahead].released:
+                    self.schedule_window(wave, wave.windows[ahead])
+
+        if signal_id in self.intersections:
+            self.end_preemption(wave, window)
+
+    def publish_emergency_response(self, wave, all_clear, wire_format="json"):
+        etas = wave.etas()
         response = {
-            "path": route,
-            "estimated_time": "3 minutes",
+            "path": wave.path,
+            "vehicle_id": wave.vehicle,
+            "request": wave.request,
+            # Seconds after departure at each intersection of path, and to the destination
+            "etas": etas,
+            "estimated_time": etas[-1] if etas else None,
             "status": "emergency_active",
-            "all_clear": True,
+            "all_clear": all_clear,
             "timestamp": time.time()
         }
-        self.client.publish("emergency/response", json.dumps(response))
-        print(f"   Emergency route sent: {route}")
+        self.client.publish("emergency/response", encode("emergency_response", response, wire_format))
+        logger.info("Emergency route sent", extra=fields(route=wave.path, etas=etas, all_clear=all_clear))
+
+    def send_command(self, signal_id, command):
+        """Publish a control command in the wire format the signal uses"""
+        start = time.perf_counter()
+        command["timestamp"] = time.time()
+        self.telemetry.record_status(signal_id, command["command"], self.scheduler.now())
+        wire_format = self.wire_formats.get(signal_id, self.default_wire_format)
+        self.client.publish(f"traffic/{signal_id}/control", encode("control", command, wire_format))
+
+        self.metrics.count("commands")
+        self.summary.count("commands")
+        self.metrics.observe("publish", time.perf_counter() - start)
 
     def traffic_control_cycle(self):
-        print("\nSTARTING AI CONTROL CYCLE...")
+        logger.info("Starting AI control cycle")
+        self.phase_timer = self.scheduler.call_later(0, self.control_step)
 
-        while self.system_active:
-            try:
-                next_signal = self.select_next_signal()
+    def control_step(self):
+        """Pick the next signal and schedule its phases; never blocks"""
+        if not self.system_active:
+            return
+
+        start = time.perf_counter()
+        try:
+            self.drain_density_buffer()
+            next_signal = self.select_next_signal()
+
+            if not next_signal:
+                self.phase_timer = self.scheduler.call_later(1, self.control_step)
+            elif self.current_green:
+                self.close_current_signal(then=lambda: self.start_green_phase(next_signal))
+            else:
+                self.start_green_phase(next_signal)
+
+        except Exception:
+            logger.exception("Error in control cycle")
+            self.phase_timer = self.scheduler.call_later(5, self.control_step)
+
+        self.metrics.observe("schedule", time.perf_counter() - start)
+
+    def start_green_phase(self, signal_key):
+        self.open_signal(signal_key)
+        green_time = self.intersections[signal_key]["green_time"]
+        self.green_ends = self.scheduler.now() + green_time
+        self.phase_timer = self.scheduler.call_later(green_time + 1, self.control_step)
 
-                if next_signal:
-                    if self.current_green:
-                        self.close_current_signal()
+    def end_phase_early(self):
+        """Cut the pending phase short and re-run selection right away"""
+        # Yellow clearance is never shortened
+        if self.current_green and self.intersections[self.current_green]["status"] == "yellow":
+            return
 
-                    self.open_signal(next_signal)
-                    time.sleep(self.intersections[next_signal]["green_time"])
+        if self.phase_timer is not None:
+            self.phase_timer.cancel()
+        self.phase_timer = self.scheduler.call_later(0, self.control_step)
 
-                time.sleep(1)
+    def control_tick(self):
+        self.metrics.count("ticks")
+        try:
+            self.drain_density_buffer()
+            if self.coordination is not None:
+                self.coordinate()
+        except Exception:
+            logger.exception("Error in control tick")
+        self.tick_timer = self.scheduler.call_later(CONTROL_TICK, self.control_tick)
+
+    def reoptimize(self):
+        """Recompute the coordinated plan from the latest AI green times"""
+        start = time.perf_counter()
+        try:
+            green_times = [self.intersections[key]["green_time"] for key in self.coordination.ids]
+            stats = self.coordination.optimize(green_times)
+            elapsed = time.perf_counter() - start
+            self.metrics.gauges.update(stats)
+            self.metrics.gauges["optimize_seconds"] = elapsed
+            logger.info("Coordinated plan updated", extra=fields(**stats, seconds=round(elapsed, 4)))
+            if stats["stretched_sets"]:
+                logger.warning("Cycle stretched past %.0f sec to fit MIN_GREEN for every signal",
+                               MAX_CYCLE, extra=fields(sets=stats["stretched_sets"]))
+        except Exception:
+            logger.exception("Error in plan optimization")
+        self.reoptimize_timer = self.scheduler.call_later(REOPTIMIZE_PERIOD, self.reoptimize)
+
+    def coordinate(self):
+        """Send the phase changes of the coordinated plan that are due now"""
+        start = time.perf_counter()
+        coordination = self.coordination
+        now = self.scheduler.now()
+
+        held = None
+        if self.preempted:
+            held = np.zeros(len(coordination.ids), dtype=bool)
+            held[[coordination.index[key] for key, windows in self.preempted.items() if windows]] = True
+
+        for i in coordination.sweep(now, held).tolist():
+            key = coordination.ids[i]
+            intersection = self.intersections[key]
+            state = coordination.state[i]
+
+            if state == GREEN:
+                command = {
+                    "command": "green",
+                    "duration": round(float(coordination.green[i]), 1),
+                    "density": intersection["density"],
+                    "message": "Open - Coordinated plan (AI split)"
+                }
+                self.priority_queue.remove(key)
+                self.green_inputs[key] = (intersection["density"], intersection["lanes"], command["duration"])
+                self.metrics.count("decisions")
+                self.summary.count("decisions")
+            elif state == YELLOW:
+                command = {"command": "yellow", "duration": YELLOW_TIME, "message": "Prepare to stop"}
+            else:
+                command = {"command": "red", "message": "Stop"}
+                intersection["waiting_time"] = 0
+                intersection["red_since"] = now
+                self.priority_queue.push(key, intersection["priority"])
+
+            self.send_command(intersection["id"], command)
+            intersection["status"] = STATES[state]
 
+        self.metrics.observe("schedule", time.perf_counter() - start)
+
+    def drain_density_buffer(self):
+        """Apply the latest density of every intersection that reported since the last tick"""
+        with self.buffer_lock:
+            buffer, self.density_buffer = self.density_buffer, {}
+            statuses, self.status_buffer = self.status_buffer, []
+            received = self.metrics.counters["density_messages"]
+        if statuses:
+            self.record_passages(statuses)
+        if not buffer:
+            return
+
+        # Every reading received so far was either drained or overwritten in the buffer
+        self.metrics.count("readings_drained", len(buffer))
+        self.metrics.counters["density_coalesced"] = received - self.metrics.counters["readings_drained"]
+
+        now = self.scheduler.now()
+        changed = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for i, (key, payload) in enumerate(buffer.items()):
+            intersection = self.intersections[key]
+            timed = not i % self.metrics.sample_every
+            start = time.perf_counter() if timed else 0.0
+            try:
+                density = density_reading(decode(payload))
             except Exception as e:
-                print(f"ERROR in control cycle: {e}")
-                time.sleep(5)
+                self.metrics.count("decode_errors")
+                logger.error("Bad density payload: %s", e, extra=fields(signal=intersection["id"]))
+                continue
 
-    def select_next_signal(self):
-        candidates = []
+            if timed:
+                decoded = time.perf_counter()
+                self.metrics.observe("decode", decoded - start)
 
-        for key, intersection in self.intersections.items():
-            if intersection["status"] != "green":
-                score = intersection["priority"]
-                candidates.append((key, score, intersection))
+            self.wire_formats[intersection["id"]] = payload_format(payload)
+            old_density = intersection["density"]
+            intersection["density"] = density
+            if intersection["status"] == "red":
+                # Waiting time is time spent red, however often the signal reports
+                intersection["waiting_time"] = round(now - intersection["red_since"])
+            if timed:
+                self.metrics.observe("parse", time.perf_counter() - decoded)
 
-        if not candidates:
-            return None
+            if debug:
+                logger.debug("%s: %s -> %s cars", intersection["name"], old_density, density)
+            changed.append(key)
+
+        if not changed:
+            return
+
+        rows = self.telemetry.rows(changed)
+        densities = [self.intersections[key]["density"] for key in changed]
+        self.telemetry.record("density", rows, densities, now)
+        if self.forecaster is not None:
+            self.forecaster.update(rows, densities, now,
+                                   [self.intersections[key]["status"] == "red" for key in changed])
+
+        if self.live_routing:
+            self.road_network.update_densities(
+                {self.intersections[key]["id"]: self.intersections[key]["density"] for key in changed}
+            )
+
+        self.metrics.count("readings_applied", len(changed))
+        self.summary.count("readings", len(changed))
+        start = time.perf_counter()
+        self.update_green_times(changed)
+        self.metrics.observe("predict", time.perf_counter() - start)
 
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        selected = candidates[0][0]
+        for key in changed:
+            intersection = self.intersections[key]
+
+            # Calculate priority (density + waiting time)
+            priority = (intersection["density"] * 2) + (intersection["waiting_time"] * 0.5)
+            intersection["priority"] = priority
+            self.priority_queue.update(key, priority)
+
+            if debug:
+                logger.debug("%s: AI suggests %s sec | Priority: %.1f | Waiting: %ss",
+                             intersection["name"], intersection["green_time"], priority,
+                             intersection["waiting_time"])
+
+    def record_passages(self, statuses):
+        """Cars the signals report passed during their last green, from buffered status payloads"""
+        passed = {}
+        discharge_times = {}
+        for key, payload in statuses:
+            try:
+                data = decode(payload)
+            except Exception:
+                self.metrics.count("decode_errors")
+                continue
+            if key in self.unconfirmed:
+                self.reconcile_status(key, data.get("status"))
+            if data.get("cars_passed") is not None:
+                # Two reports of one signal within a tick are recorded as one sample
+                passed[key] = passed.get(key, 0) + data["cars_passed"]
+                discharge_times[key] = data.get("discharge_time")
+
+        for key, cars in passed.items():
+            inputs = self.green_inputs.pop(key, None)
+            if inputs is not None:
+                self.discharge_log.append(*inputs, cars, discharge_times[key])
+
+        if passed:
+            rows = self.telemetry.rows(list(passed))
+            self.telemetry.record("cars", rows, list(passed.values()), self.scheduler.now())
+            if self.forecaster is not None:
+                self.forecaster.discharged(rows, list(passed.values()))
+
+    def reconcile_status(self, key, status):
+        """After a warm restart, correct a restored state the signal's own report contradicts"""
+        intersection = self.intersections[key]
+        if status == intersection["status"]:
+            self.unconfirmed.discard(key)
+        elif status == "red":
+            # The phase ended while the controller was down
+            intersection["status"] = "red"
+            intersection["waiting_time"] = 0
+            intersection["red_since"] = self.scheduler.now()
+            self.priority_queue.push(key, intersection["priority"])
+            self.unconfirmed.discard(key)
+            if key == self.current_green:
+                self.current_green = None
+                self.end_phase_early()
+        elif status == "green" and intersection["status"] == "red":
+            # A green the restored controller did not give: clear it like any other
+            self.send_command(intersection["id"], {"command": "yellow", "duration": YELLOW_TIME,
+                                                   "message": "Prepare to stop"})
+            intersection["status"] = "yellow"
+            self.priority_queue.remove(key)
+            self.scheduler.call_later(YELLOW_TIME, self.finish_yellow, intersection, None, key)
+            self.unconfirmed.discard(key)
+        # A signal in yellow is confirmed by its next report
+        self.metrics.gauges["restore_unconfirmed"] = len(self.unconfirmed)
+
+    def restore_checkpoint(self, statuses=True):
+        """
+        Resume from the last snapshot unless there is none or it is stale.
+        Without statuses (coordinated mode, where the plan sets them) only
+        densities, priorities and green times are restored.
+        """
+        start = time.perf_counter()
+        try:
+            snapshot = self.checkpoint.restore()
+        except Exception:
+            logger.exception("Unreadable checkpoint - cold start", extra=fields(path=self.checkpoint.path))
+            return
+        if snapshot is None:
+            logger.info("No checkpoint - cold start", extra=fields(path=self.checkpoint.path))
+            return
+        age = time.time() - snapshot["time"]
+        if age > MAX_CHECKPOINT_AGE:
+            logger.warning("Checkpoint is %.0f sec old - cold start", age, extra=fields(path=self.checkpoint.path))
+            return
 
-        print(f"\nSELECTING NEXT SIGNAL: {self.intersections[selected]['name']}")
-        print(f"   Density: {self.intersections[selected]['density']} cars")
-        print(f"   AI suggested time: {self.intersections[selected]['green_time']} sec")
+        now = self.scheduler.now()
+        origin = self.telemetry.origin
+        current = snapshot["current_green"] if statuses else None
+        for key, row in zip(self.checkpoint.ids, snapshot["state"].tolist()):
+            density, waiting_time, priority, green_time, status, red_since = row
+            intersection = self.intersections[key]
+            intersection["density"] = round(density)
+            intersection["priority"] = priority
+            intersection["green_time"] = round(green_time, 2)
+            if not statuses:
+                self.priority_queue.update(key, priority)
+                continue
+
+            self.unconfirmed.add(key)
+            if key == current:
+                # Only the running phase survives a restart; emergency holds are re-requested
+                intersection["status"] = "yellow" if status == STATUS_CODES["yellow"] else "green"
+                self.priority_queue.remove(key)
+            else:
+                intersection["status"] = "red"
+                intersection["red_since"] = red_since - origin
+                intersection["waiting_time"] = max(0, round(now - intersection["red_since"]))
+                self.priority_queue.push(key, priority)
+
+        if current is not None:
+            self.current_green = current
+            green_ends = snapshot["green_ends"]
+            self.green_ends = now if np.isnan(green_ends) else green_ends - origin
+
+        elapsed = time.perf_counter() - start
+        self.metrics.gauges["restore_seconds"] = elapsed
+        self.metrics.gauges["restore_unconfirmed"] = len(self.unconfirmed)
+        logger.info("Warm restart from checkpoint", extra=fields(
+            age=round(age, 1), intersections=len(self.checkpoint.ids), current_green=current,
+            seconds=round(elapsed, 4)
+        ))
+
+    def save_checkpoint(self):
+        """Snapshot every intersection's state and the running green"""
+        start = time.perf_counter()
+        try:
+            origin = self.telemetry.origin
+            state = np.array([
+                (i["density"], i["waiting_time"], i["priority"], i["green_time"],
+                 STATUS_CODES.get(i["status"], STATUS_CODES["red"]), i["red_since"] + origin)
+                for i in (self.intersections[key] for key in self.checkpoint.ids)
+            ], dtype=STATE_DTYPE)
+            green_ends = np.nan if self.current_green is None or self.green_ends is None else self.green_ends + origin
+            self.checkpoint.save(state, self.scheduler.now() + origin, self.current_green, green_ends)
+            self.metrics.gauges["checkpoint_seconds"] = time.perf_counter() - start
+        except Exception:
+            logger.exception("Error saving checkpoint", extra=fields(path=self.checkpoint.path))
+        self.checkpoint_timer = self.scheduler.call_later(CHECKPOINT_PERIOD, self.save_checkpoint)
+
+    def retrain(self):
+        """Hand the observed greens to the retraining worker"""
+        if len(self.discharge_log) >= MIN_OBSERVATIONS:
+            self.retrainer.submit(self.discharge_log.snapshot(), self.serving_path,
+                                  lambda report: self.scheduler.call_later(0, self.finish_retraining, report))
+        self.retrain_timer = self.scheduler.call_later(RETRAIN_PERIOD, self.retrain)
+
+    def finish_retraining(self, report):
+        """Swap in a promoted model; every later prediction uses it"""
+        gauges = self.metrics.gauges
+        gauges["retrain_attempts"] = self.retrainer.attempts
+        for name in ("s_per_lane", "serving_error", "candidate_error"):
+            if report.get(name) is not None:
+                gauges[f"retrain_{name}"] = report[name]
+        if not report["promoted"]:
+            return
+
+        try:
+            # Loaded completely before the swap; one assignment replaces the model
+            model = TrafficAIModel(report["path"], lazy=True)
+        except Exception:
+            logger.exception("Promoted model failed to load - keeping the serving model",
+                             extra=fields(model=report["path"]))
+            return
+        self.ai_model = model
+        self.serving_path = report["path"]
+        if self.inference_pool is not None:
+            self.inference_pool.load(model)
+        gauges["retrain_promotions"] = gauges.get("retrain_promotions", 0) + 1
+        logger.info("Serving model swapped", extra=fields(model=report["path"], s_per_lane=model.s_per_lane))
+        self.update_green_times(list(self.intersections))
+
+    def flush_telemetry(self):
+        """Append the telemetry recorded since the last flush to telemetry_dir"""
+        start = time.perf_counter()
+        try:
+            written = self.telemetry.flush(self.telemetry_dir)
+            self.metrics.gauges["telemetry_flush_bytes"] = written
+            self.metrics.gauges["telemetry_flush_seconds"] = time.perf_counter() - start
+        except Exception:
+            logger.exception("Error flushing telemetry", extra=fields(directory=self.telemetry_dir))
+        self.flush_timer = self.scheduler.call_later(TELEMETRY_FLUSH_PERIOD, self.flush_telemetry)
+
+    def expected_green_start(self, rows):
+        """Earliest time each of rows can turn green: its planned start, or after the running green and yellow"""
+        now = self.scheduler.now()
+        if self.coordination is not None:
+            return self.coordination.next_green(now, rows)
+        if self.current_green is None or self.green_ends is None:
+            return now
+        return max(now, self.green_ends) + YELLOW_TIME
+
+    def update_green_times(self, keys, green_start=None):
+        """Recompute AI green times for the given intersections in one call"""
+        if self.forecaster is not None:
+            rows = self.telemetry.rows(keys)
+            if green_start is None:
+                green_start = self.expected_green_start(rows)
+            queues = self.forecaster.forecast(rows, green_start)
+        else:
+            queues = [self.intersections[key]["density"] for key in keys]
+
+        green_times = (self.inference_pool or self.ai_model).predict_green_times(
+            Q_queue=queues,
+            lanes=[self.intersections[key]["lanes"] for key in keys],
+            t_lost=3.0
+        )
+
+        for key, ai_green_time in zip(keys, green_times.tolist()):
+            self.intersections[key]["green_time"] = ai_green_time
+
+    def select_next_signal(self):
+        selected = self.priority_queue.peek()
+
+        if selected is None:
+            return None
+
+        intersection = self.intersections[selected]
+        logger.info("Selecting next signal: %s", intersection["name"], extra=fields(
+            density=intersection["density"], green_time=intersection["green_time"]
+        ))
 
         return selected
 
-    def close_current_signal(self):
+    def close_current_signal(self, then=None):
+        if self.preempted.get(self.current_green):
+            # Held green for an emergency vehicle; its release closes it
+            self.current_green = None
+            if then:
+                then()
+            return
+
         if self.current_green:
             intersection = self.intersections[self.current_green]
 
-            print(f"\n{intersection['name']}: Changing to YELLOW (5 seconds)...")
+            logger.info("%s: changing to YELLOW (5 seconds)", intersection["name"])
             yellow_command = {
                 "command": "yellow",
                 "duration": 5,
                 "message": "Prepare to stop"
             }
-            self.client.publish(f"traffic/{intersection['id']}/control", json.dumps(yellow_command))
+            self.send_command(intersection["id"], yellow_command)
             intersection["status"] = "yellow"
 
-            time.sleep(5)
+            self.phase_timer = self.scheduler.call_later(5, self.finish_yellow, intersection, then)
+
+    def finish_yellow(self, intersection, then=None, signal_key=None):
+        try:
+            signal_key = signal_key or self.current_green
+            if self.preempted.get(signal_key):
+                # An emergency window opened during yellow; the signal stays green
+                if signal_key == self.current_green:
+                    self.current_green = None
+                if then:
+                    then()
+                return
 
-            print(f"{intersection['name']}: Changing to RED")
+            logger.info("%s: changing to RED", intersection["name"])
             red_command = {
                 "command": "red",
                 "message": "Stop"
             }
-            self.client.publish(f"traffic/{intersection['id']}/control", json.dumps(red_command))
+            self.send_command(intersection["id"], red_command)
             intersection["status"] = "red"
             intersection["waiting_time"] = 0
-            self.current_green = None
+            intersection["red_since"] = self.scheduler.now()
+            self.priority_queue.push(signal_key, intersection["priority"])
+            if signal_key == self.current_green:
+                self.current_green = None
+
+            if then:
+                then()
+
+        except Exception:
+            logger.exception("Error in control cycle")
+            self.phase_timer = self.scheduler.call_later(5, self.control_step)
 
     def open_signal(self, signal_key):
         intersection = self.intersections[signal_key]
+        if self.forecaster is not None:
+            # The green starts now: predict for the queue standing there now
+            self.update_green_times([signal_key], self.scheduler.now())
 
-        print(f"\n{intersection['name']}: OPENING SIGNAL")
-        print(f"   Green time: {intersection['green_time']} sec (AI calculated)")
-        print(f"   Cars waiting: {intersection['density']}")
+        logger.info("%s: opening signal", intersection["name"], extra=fields(
+            green_time=intersection["green_time"], cars_waiting=intersection["density"]
+        ))
 
         green_command = {
             "command": "green",
@@ -250,9 +939,13 @@ class SmartTrafficSystemWithAI:
             "density": intersection["density"],
             "message": "Open - Safe passage (AI)"
         }
-        self.client.publish(f"traffic/{intersection['id']}/control", json.dumps(green_command))
+        self.send_command(intersection["id"], green_command)
         intersection["status"] = "green"
+        self.green_inputs[signal_key] = (intersection["density"], intersection["lanes"], intersection["green_time"])
+        self.priority_queue.remove(signal_key)
         self.current_green = signal_key
+        self.metrics.count("decisions")
+        self.summary.count("decisions")
 
         self.notify_other_signals(signal_key)
 
@@ -264,29 +957,69 @@ class SmartTrafficSystemWithAI:
                     "reason": f"{self.intersections[current_signal]['name']} is active",
                     "duration": self.intersections[current_signal]["green_time"]
                 }
-                self.client.publish(f"traffic/{intersection['id']}/control", json.dumps(stop_command))
-                print(f"   Temporary stop for {intersection['name']}")
+                self.send_command(intersection["id"], stop_command)
+                logger.info("Temporary stop for %s", intersection["name"])
+
+    def publish_metrics(self):
+        """Publish a metrics snapshot on traffic/metrics every METRICS_PERIOD"""
+        self.metrics.gauges["intersections"] = len(self.intersections)
+        self.metrics.gauges["queue_length"] = len(self.priority_queue)
+        self.metrics.gauges["buffered_readings"] = len(self.density_buffer)
+        self.metrics.gauges.update(self.road_network.stats)
+        if self.inference_pool is not None:
+            self.metrics.gauges.update(self.inference_pool.stats)
+        try:
+            self.client.publish(METRICS_TOPIC, self.metrics.to_json())
+        except Exception:
+            logger.exception("Error publishing metrics")
+        self.metrics_timer = self.scheduler.call_later(METRICS_PERIOD, self.publish_metrics)
 
     def start(self):
         try:
-            print("CONNECTING TO MQTT BROKER...")
-            self.client.connect("broker.emqx.io", 1883, 60)
-            print("CONNECTION SUCCESSFUL!")
-
-            print("\nSYSTEM INFORMATION:")
-            print(f"   • Number of signals: 4")
-            print(f"   • Signal names: SIGNAL 1, SIGNAL 2, SIGNAL 3, SIGNAL 4")
-            print(f"   • Lane counts: 2,3,1,2 lanes")
-            print(f"   • Model: Random Forest Regressor (trained on 5000 samples)")
-            print(f"   • Inputs: car count + number of lanes")
-            print("\nSTARTING AI CONTROL...")
+            logger.info("Connecting to broker")
+            self.client.connect()
+
+            intersections = list(self.intersections.values())
+            logger.info("Starting AI control", extra=fields(
+                signals=len(intersections),
+                names=", ".join(i["name"] for i in intersections[:10]) +
+                      (" ..." if len(intersections) > 10 else ""),
+                lanes=",".join(str(i["lanes"]) for i in intersections[:10]),
+                model="Random Forest Regressor",
+                inputs="car count + number of lanes"
+            ))
 
             self.client.loop_forever()
 
-        except Exception as e:
-            print(f"CONNECTION FAILED: {e}")
+        except Exception:
+            logger.exception("Connection failed")
 
 
 if __name__ == "__main__":
-    system = SmartTrafficSystemWithAI()
+    # python traffic_server_with_ai.py [--fast-boot] [--binary] [--coordinated]
+    #                                  [--config=intersections.json]
+    #                                  [--metrics-port=9108]  (0 disables the HTTP endpoint)
+    #                                  [--telemetry-dir=telemetry]
+    #                                  [--forecast]  (off by default: raises mean wait, see forecast.py)
+    #                                  [--retrain-dir=models]  (online retraining, promoted models)
+    #                                  [--inference-workers=2]  (predict in worker processes)
+    #                                  [--checkpoint=controller.ckpt]  (state snapshots, warm restart)
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+
+    setup_logging()
+    logger.info("SMART TRAFFIC SYSTEM WITH AI - random forest model, "
+                "signal sequence RED -> YELLOW -> GREEN")
+
+    system = SmartTrafficSystemWithAI(
+        config_path=options.get("config", "intersections.json"),
+        fast_boot="--fast-boot" in sys.argv,
+        wire_format="binary" if "--binary" in sys.argv else "json",
+        metrics_port=int(options.get("metrics-port", 9108)),
+        coordinated="--coordinated" in sys.argv,
+        telemetry_dir=options.get("telemetry-dir"),
+        forecasting="--forecast" in sys.argv,
+        retrainer=Retrainer(options["retrain-dir"]) if "retrain-dir" in options else None,
+        inference_workers=int(options.get("inference-workers", 0)),
+        checkpoint_path=options.get("checkpoint")
+    )
     system.start()
\ No newline at end of file
@@ -1,185 +1,260 @@
-import paho.mqtt.client as mqtt
-import json
 import random
+import threading
 import time
 import sys
 
-# Auto-detect signal ID and name
-if len(sys.argv) >= 3:
-    signal_id = sys.argv[1]
-    signal_name = sys.argv[2]
-elif len(sys.argv) == 2:
-    signal_id = sys.argv[1]
-    names = {
-        "intersection1": "SIGNAL 1",
-        "intersection2": "SIGNAL 2",
-        "intersection3": "SIGNAL 3",
-        "intersection4": "SIGNAL 4"
-    }
-    signal_name = names.get(signal_id, f"SIGNAL {signal_id[-1]}")
-else:
-    signal_id = "intersection1"
-    signal_name = "SIGNAL 1"
-
-print("=" * 60)
-print(f"{signal_name}")
-print(f"ID: {signal_id}")
-print("=" * 60)
+from metrics import Histogram
+from phase_scheduler import PhaseScheduler
+from traffic_logging import EventSummary, fields, get_logger, setup_logging
+from transport import create_transport
+from wire_format import decode, encode
+
+# Seconds between density reports
+DENSITY_PERIOD = 7
+
+# An emergency green nobody releases ends this long after its duration
+EMERGENCY_GRACE = 5
+
+# Seconds between command-to-actuation latency reports
+LATENCY_REPORT_PERIOD = 60
+
+
+def next_density(density, rng=random):
+    """One step of the simulated density random walk"""
+    change = rng.randint(-8, 12)
+    return max(0, min(50, density + change))
 
 
 class AdvancedTrafficSignal:
-    def __init__(self, signal_id, signal_name):
+    def __init__(self, signal_id, signal_name, wire_format="json", transport=None, scheduler=None):
+        """
+        Event-driven signal: every command is applied as soon as it arrives
+        and phase ends, car discharge and density reports are timers, so
+        nothing ever sleeps in the network callback.
+        """
         self.signal_id = signal_id
         self.signal_name = signal_name
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, signal_id)
+        self.wire_format = wire_format
+        self.logger = get_logger(f"signal.{signal_id}")
+        # Density levels are logged once a minute instead of on every report
+        self.density_summary = EventSummary(self.logger, "Density reports", interval=60)
+        self.client = transport or create_transport(signal_id)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
         self.status = "red"
+        self.emergency = False
         self.density = random.randint(2, 35)
         self.green_time = 30
         self.yellow_time = 5
         self.cars_passed = 0
+        self.passage_total = 0
+        self.passage_started = 0.0
+        # Cars and discharge seconds of the last finished passage, sent with the next status update
+        self.unreported_passage = None
+        self.unreported_discharge = None
         self.total_waiting = 0
 
+        self.handlers = {
+            "green": self.activate_green,
+            "yellow": self.activate_yellow,
+            "red": self.activate_red,
+            "stop": self.handle_stop,
+            "emergency_green": self.activate_emergency
+        }
+
+        # Commands arrive on the network thread and timers fire on the
+        # scheduler thread; both change state under the lock. Every
+        # transition bumps phase, so timers of an earlier phase do nothing.
+        self.lock = threading.Lock()
+        self.phase = 0
+        self.phase_timer = None
+        self.discharge_timer = None
+
+        # Command timestamp (sender clock) to the state change here
+        self.actuation = Histogram()
+        self.last_latency = None
+
+        self.scheduler = scheduler or PhaseScheduler(f"Signal-{signal_id}").start()
         self.start_traffic_simulation()
+        self.scheduler.call_later(LATENCY_REPORT_PERIOD, self.report_latency)
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         _ = userdata, flags, properties
-        print(f"{self.signal_name}: Connected to central system")
-        print(f"   ID: {self.signal_id}")
-        print(f"   Initial density: {self.density} cars")
-
         if rc == 0:
+            self.logger.info("%s: connected to central system", self.signal_name,
+                             extra=fields(signal=self.signal_id, density=self.density))
             client.subscribe(f"traffic/{self.signal_id}/control")
             self.send_status_update()
         else:
-            print(f"   Connection failed - code: {rc}")
+            self.logger.error("%s: connection failed", self.signal_name, extra=fields(code=rc))
 
     def on_message(self, client, userdata, msg):
         _ = userdata
+        received = time.time()
         try:
-            data = json.loads(msg.payload.decode())
+            data = decode(msg.payload)
             command = data.get("command")
 
-            print(f"{self.signal_name}: Command '{command}' received")
+            self.logger.debug("%s: command '%s' received", self.signal_name, command)
+
+            handler = self.handlers.get(command)
+            if handler is None:
+                return
+            with self.lock:
+                actuated = handler(data)
 
-            if command == "green":
-                self.activate_green(data)
-            elif command == "yellow":
-                self.activate_yellow(data)
-            elif command == "red":
-                self.activate_red(data)
-            elif command == "stop":
-                self.handle_stop(data)
-            elif command == "emergency_green":
-                self.activate_emergency(data)
+            if actuated:
+                self.record_latency(time.time() - data.get("timestamp", received))
+                self.send_status_update()
 
-        except Exception as e:
-            print(f"{self.signal_name}: Error in command - {e}")
+        except Exception:
+            self.logger.exception("%s: error in command", self.signal_name)
+
+    def transition(self, status):
+        """Leave the current phase now: pending timers are dropped and a running passage ends"""
+        self.phase += 1
+        for timer in (self.phase_timer, self.discharge_timer):
+            if timer is not None:
+                timer.cancel()
+        self.phase_timer = self.discharge_timer = None
+
+        if self.status == "green":
+            self.finish_passage()
+        self.status = status
+        self.emergency = False
 
     def activate_green(self, data):
-        if self.status != "green":
-            self.status = "green"
-            self.green_time = data.get("duration", 30)
-            density = data.get("density", self.density)
-            message = data.get("message", "Open")
+        if self.status == "green":
+            return False
+
+        self.transition("green")
+        self.green_time = data.get("duration", 30)
+        density = data.get("density", self.density)
+        message = data.get("message", "Open")
 
-            print(f"\n{'🟢' * 10}")
-            print(f"   {self.signal_name}: 🟢 GREEN")
-            print(f"   Duration: {self.green_time} sec (AI based)")
-            print(f"   Density: {density} cars")
-            print(f"   {message}")
-            print(f"{'🟢' * 10}\n")
+        self.logger.info("%s: GREEN for %s sec - %s", self.signal_name, self.green_time, message,
+                         extra=fields(density=density))
 
-            self.simulate_cars_passing()
+        self.simulate_cars_passing()
+        return True
 
     def activate_yellow(self, data):
-        if self.status != "yellow":
-            self.status = "yellow"
-            yellow_duration = data.get("duration", 5)
-            message = data.get("message", "Prepare to stop")
+        if self.status == "yellow":
+            return False
 
-            print(f"\n{'🟡' * 8}")
-            print(f"   {self.signal_name}: 🟡 YELLOW")
-            print(f"   {message}")
-            print(f"   Duration: {yellow_duration} sec")
-            print(f"{'🟡' * 8}\n")
+        self.transition("yellow")
+        self.yellow_time = data.get("duration", 5)
+        message = data.get("message", "Prepare to stop")
 
-            self.send_status_update()
-            time.sleep(yellow_duration)
+        self.logger.info("%s: YELLOW for %s sec - %s", self.signal_name, self.yellow_time, message)
+
+        # Yellow always ends in red, whether or not the red command arrives
+        self.phase_timer = self.scheduler.call_later(self.yellow_time, self.end_phase, self.phase, "red")
+        return True
 
     def activate_red(self, data):
-        if self.status != "red":
-            self.status = "red"
-            message = data.get("message", "Stop")
+        if self.status == "red":
+            return False
 
-            print(f"\n{'🔴' * 10}")
-            print(f"   {self.signal_name}: 🔴 RED")
-            print(f"   {message}")
-            print(f"{'🔴' * 10}\n")
+        self.transition("red")
+        message = data.get("message", "Stop")
 
-            self.send_status_update()
+        self.logger.info("%s: RED - %s", self.signal_name, message)
+        return True
 
     def handle_stop(self, data):
         reason = data.get("reason", "Another signal active")
         duration = data.get("duration", 30)
 
-        print(f"\nSTOP: {self.signal_name} temporarily stopped")
-        print(f"   Reason: {reason}")
-        print(f"   Duration: {duration} sec")
-        print(f"   Waiting...\n")
+        self.logger.info("%s: temporarily stopped for %s sec - %s", self.signal_name, duration, reason)
 
         self.total_waiting += duration
+        return False
 
     def activate_emergency(self, data):
+        """Interrupts whatever phase is running, including a green in progress"""
         vehicle = data.get("vehicle", "Emergency")
         duration = data.get("duration", 10)
 
-        print(f"\n{'🚑' * 12}")
-        print(f"   {self.signal_name}: 🟢 EMERGENCY MODE")
-        print(f"   Vehicle: {vehicle}")
-        print(f"   Green for: {duration} sec")
-        print(f"   Absolute priority!")
-        print(f"{'🚑' * 12}\n")
-
-        self.status = "green"
+        self.logger.warning("%s: EMERGENCY GREEN for %s sec", self.signal_name, duration,
+                            extra=fields(vehicle=vehicle))
+
+        self.transition("green")
+        self.emergency = True
+        self.green_time = duration
+        # Released by the controller; if it never is, the signal goes yellow by itself
+        self.phase_timer = self.scheduler.call_later(duration + EMERGENCY_GRACE, self.end_phase,
+                                                     self.phase, "yellow")
+        return True
+
+    def end_phase(self, phase, status):
+        """Timer end of a yellow (to red) or of an unreleased emergency green (to yellow)"""
+        with self.lock:
+            if phase != self.phase:
+                return
+            if status == "yellow":
+                self.logger.warning("%s: emergency green not released - ending it", self.signal_name)
+                self.activate_yellow({"duration": self.yellow_time})
+            else:
+                self.activate_red({"message": "Yellow ended"})
         self.send_status_update()
 
     def simulate_cars_passing(self):
+        """Discharge the queue one second at a time while the green lasts"""
         cars_per_second = max(1, self.density // 10)
-        total_cars = min(self.density, cars_per_second * (self.green_time - 2))
+        self.passage_total = min(self.density, cars_per_second * max(0, int(self.green_time) - 2))
+        self.passage_started = self.scheduler.now()
+        self.discharge_timer = self.scheduler.call_later(1, self.discharge_step, self.phase, cars_per_second)
 
-        print(f"   Cars starting to pass...")
+    def discharge_step(self, phase, cars_per_second):
+        with self.lock:
+            if phase != self.phase:
+                return
 
-        for i in range(self.green_time - 2):
-            cars_now = min(cars_per_second, total_cars - self.cars_passed)
+            cars_now = min(cars_per_second, self.passage_total - self.cars_passed)
             if cars_now > 0:
                 self.cars_passed += cars_now
-                print(f"   {cars_now} cars passed ({self.cars_passed}/{total_cars})")
-
-            if self.cars_passed >= total_cars:
-                break
-
-            time.sleep(5)
-
-        print(f"   Passage complete: {self.cars_passed} cars")
+                self.logger.debug("%s: %d cars passed (%d/%d)", self.signal_name, cars_now,
+                                  self.cars_passed, self.passage_total)
+
+            if self.cars_passed >= self.passage_total:
+                self.finish_passage()
+            else:
+                self.discharge_timer = self.scheduler.call_later(1, self.discharge_step, phase, cars_per_second)
+
+    def finish_passage(self):
+        """Apply the cars that passed, when the queue is empty or the green ends early"""
+        if not self.passage_total:
+            return
+        self.logger.info("%s: passage complete - %d cars", self.signal_name, self.cars_passed)
         self.density = max(0, self.density - self.cars_passed)
+        self.unreported_passage = (self.unreported_passage or 0) + self.cars_passed
+        # Seconds the queue took to discharge: the whole green if cars were left behind
+        self.unreported_discharge = round(self.scheduler.now() - self.passage_started, 1)
         self.cars_passed = 0
+        self.passage_total = 0
 
-    def start_traffic_simulation(self):
-        import threading
+    def record_latency(self, latency):
+        self.last_latency = latency
+        self.actuation.observe(max(0.0, latency))
+
+    def report_latency(self):
+        snapshot = self.actuation.snapshot()
+        if snapshot["count"]:
+            self.logger.info("%s: command-to-actuation latency mean %.2f ms, p99 <= %.2f ms over %d commands",
+                             self.signal_name, snapshot["mean"] * 1000, snapshot["p99"] * 1000,
+                             snapshot["count"], extra=fields(**{f"actuation_{k}": v for k, v in snapshot.items()}))
+        self.scheduler.call_later(LATENCY_REPORT_PERIOD, self.report_latency)
 
-        def traffic_simulator():
-            while True:
-                change = random.randint(-8, 12)
-                self.density = max(0, min(50, self.density + change))
-                self.send_density_update()
-                time.sleep(7)
+    def start_traffic_simulation(self):
+        self.scheduler.call_later(0, self.density_step)
 
-        thread = threading.Thread(target=traffic_simulator)
-        thread.daemon = True
-        thread.start()
+    def density_step(self):
+        with self.lock:
+            self.density = next_density(self.density)
+        self.send_density_update()
+        self.scheduler.call_later(DENSITY_PERIOD, self.density_step)
 
     def send_density_update(self):
         data = {
@@ -189,12 +264,14 @@ class AdvancedTrafficSignal:
             "status": self.status,
             "timestamp": time.time()
         }
-        self.client.publish(f"traffic/{self.signal_id}/density", json.dumps(data))
+        self.client.publish(f"traffic/{self.signal_id}/density", encode("density", data, self.wire_format))
 
         if self.density > 25:
-            print(f"HIGH density: {self.signal_name} - {self.density} cars")
+            self.density_summary.count("high")
         elif self.density > 15:
-            print(f"MEDIUM density: {self.signal_name} - {self.density} cars")
+            self.density_summary.count("medium")
+        else:
+            self.density_summary.count("low")
 
     def send_status_update(self):
         data = {
@@ -206,16 +283,48 @@ class AdvancedTrafficSignal:
             "yellow_time": self.yellow_time,
             "timestamp": time.time()
         }
-        self.client.publish(f"traffic/{self.signal_id}/status", json.dumps(data))
+        if self.emergency:
+            data["emergency"] = True
+        if self.last_latency is not None:
+            # Seconds from the last command's timestamp to its state change
+            data["actuation_latency"] = round(self.last_latency, 6)
+        if self.unreported_passage is not None:
+            data["cars_passed"] = self.unreported_passage
+            data["discharge_time"] = self.unreported_discharge
+            self.unreported_passage = None
+        self.client.publish(f"traffic/{self.signal_id}/status", encode("status", data, self.wire_format))
 
     def start(self):
         try:
-            self.client.connect("broker.emqx.io", 1883, 60)
+            self.client.connect()
             self.client.loop_forever()
-        except Exception as e:
-            print(f"{self.signal_name}: Connection failed - {e}")
+        except Exception:
+            self.logger.exception("%s: connection failed", self.signal_name)
 
 
 if __name__ == "__main__":
-    signal = AdvancedTrafficSignal(signal_id, signal_name)
+    # Auto-detect signal ID and name; --binary switches to the binary wire format
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    wire_format = "binary" if "--binary" in sys.argv else "json"
+
+    if len(args) >= 2:
+        signal_id = args[0]
+        signal_name = args[1]
+    elif len(args) == 1:
+        signal_id = args[0]
+        names = {
+            "intersection1": "SIGNAL 1",
+            "intersection2": "SIGNAL 2",
+            "intersection3": "SIGNAL 3",
+            "intersection4": "SIGNAL 4"
+        }
+        signal_name = names.get(signal_id, f"SIGNAL {signal_id[-1]}")
+    else:
+        signal_id = "intersection1"
+        signal_name = "SIGNAL 1"
+
+    setup_logging()
+    get_logger(f"signal.{signal_id}").info("%s (ID: %s)", signal_name, signal_id)
+
+    signal = AdvancedTrafficSignal(signal_id, signal_name, wire_format)
     signal.start()
\ No newline at end of file
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Transport - pluggable pub/sub layer for all traffic components
+
+Components talk to a transport object with the paho client surface they
+already use (on_connect/on_message callbacks, connect, subscribe, publish,
+loop_forever/loop_start). Two backends exist:
+
+    mqtt       paho MQTT client; broker host/port come from configuration
+    inprocess  in-process broker with MQTT topic wildcards, no network
+
+Configuration (environment):
+    TRAFFIC_TRANSPORT     mqtt (default) or inprocess
+    TRAFFIC_BROKER_HOST   default broker.emqx.io
+    TRAFFIC_BROKER_PORT   default 1883
+"""
+
+import os
+import queue
+import threading
+
+import paho.mqtt.client as mqtt
+
+from traffic_logging import get_logger
+
+
+TRANSPORT = os.environ.get("TRAFFIC_TRANSPORT", "mqtt")
+BROKER_HOST = os.environ.get("TRAFFIC_BROKER_HOST", "broker.emqx.io")
+BROKER_PORT = int(os.environ.get("TRAFFIC_BROKER_PORT", "1883"))
+
+logger = get_logger("transport")
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter matching with + and # wildcards"""
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+
+    for i, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+
+    return len(pattern_levels) == len(topic_levels)
+
+
+class MqttTransport(mqtt.Client):
+    def __init__(self, client_id, host=None, port=None):
+        """paho client that connects to the configured broker by default"""
+        super().__init__(mqtt.CallbackAPIVersion.VERSION2, client_id)
+        self.broker_host = host or BROKER_HOST
+        self.broker_port = port or BROKER_PORT
+
+    def connect(self, host=None, port=None, keepalive=60, *args, **kwargs):
+        return super().connect(host or self.broker_host, port or self.broker_port,
+                               keepalive, *args, **kwargs)
+
+
+class Message:
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+        self.retain = False
+
+
+class InProcessBroker:
+    def __init__(self, synchronous=False):
+        """
+        Routes published payload objects to subscribers without copying.
+
+        By default each client gets its messages on its own loop thread, as
+        with MQTT. synchronous=True delivers on the publisher's thread
+        instead, which makes single-threaded runs fully deterministic.
+        """
+        self.synchronous = synchronous
+        self.exact = {}
+        self.wildcards = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, client, topic):
+        with self.lock:
+            if "+" in topic or "#" in topic:
+                if (topic, client) not in self.wildcards:
+                    self.wildcards.append((topic, client))
+            else:
+                clients = self.exact.setdefault(topic, [])
+                if client not in clients:
+                    clients.append(client)
+
+    def unsubscribe_all(self, client):
+        with self.lock:
+            for clients in self.exact.values():
+                if client in clients:
+                    clients.remove(client)
+            self.wildcards = [(topic, c) for topic, c in self.wildcards if c is not client]
+
+    def publish(self, topic, payload):
+        with self.lock:
+            targets = list(self.exact.get(topic, ()))
+            targets += [client for pattern, client in self.wildcards
+                        if topic_matches(pattern, topic) and client not in targets]
+
+        message = Message(topic, payload)
+        for client in targets:
+            client.deliver(message)
+        return len(targets)
+
+
+# Shared broker used when no broker is passed explicitly
+default_broker = InProcessBroker()
+
+
+class InProcessTransport:
+    def __init__(self, client_id, broker=None):
+        self.client_id = client_id
+        self.broker = broker or default_broker
+        self.on_connect = None
+        self.on_message = None
+        self.userdata = None
+
+        self.inbox = queue.SimpleQueue()
+        self.loop_thread = None
+        self.connected = False
+
+    def user_data_set(self, userdata):
+        self.userdata = userdata
+
+    def connect(self, host=None, port=None, keepalive=60):
+        _ = host, port, keepalive
+        self.connected = True
+        self.deliver(None)
+        return 0
+
+    def disconnect(self):
+        self.connected = False
+        self.broker.unsubscribe_all(self)
+        self.inbox.put(StopIteration)
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        _ = qos
+        topics = topic if isinstance(topic, list) else [topic]
+        for entry in topics:
+            self.broker.subscribe(self, entry[0] if isinstance(entry, tuple) else entry)
+        return 0, 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        _ = qos, retain
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return self.broker.publish(topic, payload)
+
+    def deliver(self, message):
+        """Queue a message (None = connection event) for this client's loop"""
+        if self.broker.synchronous:
+            self.dispatch(message)
+        else:
+            self.inbox.put(message)
+
+    def dispatch(self, message):
+        if message is None:
+            if self.on_connect:
+                self.on_connect(self, self.userdata, {}, 0, None)
+        elif self.on_message:
+            self.on_message(self, self.userdata, message)
+
+    def loop_forever(self):
+        while True:
+            message = self.inbox.get()
+            if message is StopIteration:
+                return
+            try:
+                self.dispatch(message)
+            except Exception:
+                logger.exception("%s: error in callback", self.client_id)
+
+    def loop_start(self):
+        if self.broker.synchronous or self.loop_thread is not None:
+            return
+        self.loop_thread = threading.Thread(target=self.loop_forever, name=self.client_id)
+        self.loop_thread.daemon = True
+        self.loop_thread.start()
+
+    def loop_stop(self):
+        if self.loop_thread is not None:
+            self.inbox.put(StopIteration)
+            self.loop_thread.join()
+            self.loop_thread = None
+
+
+def create_transport(client_id, kind=None, broker=None):
+    """Transport for a component, chosen by argument or TRAFFIC_TRANSPORT"""
+    kind = kind or TRANSPORT
+    if kind == "inprocess":
+        return InProcessTransport(client_id, broker)
+    if kind == "mqtt":
+        return MqttTransport(client_id)
+    raise ValueError(f"Unknown transport: {kind}")
\ No newline at end of file
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Wire Format - compact binary encoding for traffic messages
+
+Binary messages start with a version byte that can never begin a JSON
+document, so JSON and binary clients can share the same topics: decode()
+detects the format of every payload, and a sender can answer each peer in
+the format that peer uses.
+
+Binary layout (little endian):
+    version  u8    BINARY_VERSION
+    kind     u8    DENSITY / STATUS / CONTROL / EMERGENCY_REQUEST / EMERGENCY_RESPONSE /
+                   EMERGENCY_PROGRESS
+    fixed    struct fields of the kind (see SCHEMAS), enums as u8,
+             durations as u16 hundredths of a second
+    extras   u8 count, then per field: u8 code (0 = named: u8 len + name),
+             u8 value type (0 = utf-8 text, 1 = JSON), u16 len + value
+
+A message the binary layout cannot carry (a count that is not an integer
+from 0 to 65534, a duration outside 0-655.34 s, an unknown enum value, an
+oversized extra) is sent as JSON instead.
+"""
+
+import json
+import math
+import numbers
+import struct
+
+
+BINARY_VERSION = 0xB1
+
+DENSITY = 1
+STATUS = 2
+CONTROL = 3
+EMERGENCY_REQUEST = 4
+EMERGENCY_RESPONSE = 5
+EMERGENCY_PROGRESS = 6
+
+KINDS = {
+    "density": DENSITY,
+    "status": STATUS,
+    "control": CONTROL,
+    "emergency_request": EMERGENCY_REQUEST,
+    "emergency_response": EMERGENCY_RESPONSE,
+    "emergency_progress": EMERGENCY_PROGRESS
+}
+
+ENUMS = {
+    "status": ["red", "yellow", "green", "emergency_active"],
+    "command": ["green", "yellow", "red", "stop", "emergency_green"]
+}
+
+# Fixed fields per kind: (name, struct code, "c" for centiseconds, or enum name)
+SCHEMAS = {
+    DENSITY: [("value", "H"), ("status", "status"), ("timestamp", "d")],
+    STATUS: [("status", "status"), ("density", "H"), ("green_time", "c"),
+             ("yellow_time", "c"), ("timestamp", "d")],
+    CONTROL: [("command", "command"), ("duration", "c"), ("density", "H"), ("timestamp", "d")],
+    EMERGENCY_REQUEST: [("timestamp", "d")],
+    EMERGENCY_RESPONSE: [("status", "status"), ("all_clear", "?"), ("timestamp", "d")],
+    EMERGENCY_PROGRESS: [("timestamp", "d")]
+}
+
+# Fields already carried by the topic (traffic/<signal>/...) are not sent
+TOPIC_FIELDS = {DENSITY: {"signal", "name"}, STATUS: {"signal", "name"}}
+
+# Known extra fields get a one-byte code instead of their name
+EXTRA_FIELDS = ["message", "vehicle", "reason", "vehicle_id", "from", "to",
+                "priority", "type", "path", "estimated_time", "etas", "intersection", "request"]
+EXTRA_CODES = {name: code for code, name in enumerate(EXTRA_FIELDS, 1)}
+
+MISSING = {"H": 0xFFFF, "c": 0xFFFF, "d": math.nan, "B": 0xFF, "?": False}
+
+HEADER = struct.Struct("<BB")
+EXTRA_HEADER = struct.Struct("<BB")
+LENGTH = struct.Struct("<H")
+
+
+def fixed_struct(schema):
+    codes = "".join("B" if code in ENUMS else "H" if code == "c" else code for _, code in schema)
+    return struct.Struct("<" + codes)
+
+
+STRUCTS = {kind: fixed_struct(schema) for kind, schema in SCHEMAS.items()}
+ENUM_CODES = {name: {value: i for i, value in enumerate(values)} for name, values in ENUMS.items()}
+
+
+def is_binary(payload):
+    return len(payload) > 0 and payload[0] == BINARY_VERSION
+
+
+def encode(kind, data, wire_format="json"):
+    """Encode a message dict as JSON text or as a binary payload"""
+    if wire_format == "json":
+        return json.dumps(data)
+
+    try:
+        return encode_binary(KINDS[kind], data)
+    except ValueError:
+        # decode() tells the formats apart, so one message may go as JSON
+        return json.dumps(data)
+
+
+def fixed_value(name, code, value):
+    """Struct value of one fixed field; ValueError if the field cannot carry it"""
+    if code in ENUMS:
+        if value is None:
+            return MISSING["B"]
+        if value not in ENUM_CODES[code]:
+            raise ValueError(f"{name}: unknown {code} {value!r}")
+        return ENUM_CODES[code][value]
+    if value is None:
+        return MISSING[code]
+    if code == "?":
+        return bool(value)
+    # Plain ints and floats skip the (slow) abstract type checks
+    number = type(value)
+    if number is not int and number is not float and (number is bool or not isinstance(value, numbers.Real)):
+        raise ValueError(f"{name}: {value!r} is not a number")
+
+    if code == "H":
+        if (number is not int and not isinstance(value, numbers.Integral)) or not 0 <= value < MISSING["H"]:
+            raise ValueError(f"{name}: {value!r} is not an integer from 0 to {MISSING['H'] - 1}")
+    elif code == "c":
+        centiseconds = round(value * 100) if math.isfinite(value) else -1
+        if not 0 <= centiseconds < MISSING["c"]:
+            raise ValueError(f"{name}: {value!r} sec is outside 0-{(MISSING['c'] - 1) / 100} sec")
+        return centiseconds
+    return value
+
+
+def encode_binary(kind, data):
+    """Binary payload of a message dict; ValueError if the layout cannot carry it"""
+    schema = SCHEMAS[kind]
+    values = [fixed_value(name, code, data.get(name)) for name, code in schema]
+
+    fixed_names = {name for name, _ in schema} | TOPIC_FIELDS.get(kind, set())
+    extras = [(name, value) for name, value in data.items() if name not in fixed_names]
+    if len(extras) > 0xFF:
+        raise ValueError(f"{len(extras)} extra fields, at most 255")
+
+    parts = [HEADER.pack(BINARY_VERSION, kind), STRUCTS[kind].pack(*values), bytes([len(extras)])]
+    for name, value in extras:
+        code = EXTRA_CODES.get(name, 0)
+        if isinstance(value, str):
+            value_type, raw = 0, value.encode()
+        else:
+            value_type, raw = 1, json.dumps(value).encode()
+        if len(raw) > 0xFFFF:
+            raise ValueError(f"{name}: {len(raw)} bytes, at most 65535")
+
+        parts.append(EXTRA_HEADER.pack(code, value_type))
+        if code == 0:
+            name_raw = name.encode()
+            if len(name_raw) > 0xFF:
+                raise ValueError(f"field name of {len(name_raw)} bytes, at most 255")
+            parts.append(bytes([len(name_raw)]) + name_raw)
+        parts.append(LENGTH.pack(len(raw)) + raw)
+
+    return b"".join(parts)
+
+
+def decode(payload):
+    """Decode a JSON or binary payload into a message dict"""
+    if not is_binary(payload):
+        return json.loads(payload)
+
+    _, kind = HEADER.unpack_from(payload)
+    schema = SCHEMAS[kind]
+    fixed = STRUCTS[kind]
+
+    data = {}
+    for (name, code), value in zip(schema, fixed.unpack_from(payload, HEADER.size)):
+        if code in ENUMS:
+            if value != MISSING["B"]:
+                data[name] = ENUMS[code][value]
+        elif code == "c":
+            if value != MISSING[code]:
+                data[name] = value / 100
+        elif code == "d":
+            if not math.isnan(value):
+                data[name] = value
+        elif value != MISSING[code] or code == "?":
+            data[name] = value
+
+    offset = HEADER.size + fixed.size
+    count = payload[offset]
+    offset += 1
+    for _ in range(count):
+        code, value_type = EXTRA_HEADER.unpack_from(payload, offset)
+        offset += EXTRA_HEADER.size
+        if code == 0:
+            size = payload[offset]
+            name = bytes(payload[offset + 1:offset + 1 + size]).decode()
+            offset += 1 + size
+        else:
+            name = EXTRA_FIELDS[code - 1]
+
+        (size,) = LENGTH.unpack_from(payload, offset)
+        raw = bytes(payload[offset + LENGTH.size:offset + LENGTH.size + size])
+        offset += LENGTH.size + size
+        data[name] = raw.decode() if value_type == 0 else json.loads(raw)
+
+    return data
+
+
+def payload_format(payload):
+    """'binary' or 'json', for answering a peer in the format it speaks"""
+    return "binary" if is_binary(payload) else "json"
\ No newline at end of file